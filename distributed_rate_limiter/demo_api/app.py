@@ -3,24 +3,74 @@ import os
 from fastapi import FastAPI, Request, Response
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
-from rate_limiter.config import RateLimitPolicy
-from rate_limiter.redis_client import get_redis
-from rate_limiter.token_bucket import TokenBucketLimiter
+from rate_limiter.config import ConcurrencyPolicy, RateLimitPolicy
+from rate_limiter.concurrency import AsyncConcurrencyLimiter
+from rate_limiter.redis_client import get_async_redis, get_async_sharded_redis, get_async_redis_cluster
+from rate_limiter.token_bucket import AsyncTokenBucketLimiter
 from rate_limiter.middleware import RateLimitMiddleware
+from rate_limiter.adaptive import AdaptiveRate
+from rate_limiter.blocked_cache import BlockedCache
+from rate_limiter.heavy_hitters import HeavyHitters
+from rate_limiter.resilience import ResilientLimiter
 
 PORT = int(os.getenv("PORT", "8080"))
 
 rate = float(os.getenv("RL_RATE_PER_SEC", "5"))
 burst = int(os.getenv("RL_BURST", "10"))
 
-policy = RateLimitPolicy(rate_per_sec=rate, burst=burst, ttl_seconds=1800, cost=1, prefix="rl:tb")
+lease_size = int(os.getenv("RL_LEASE_SIZE", "0"))
+
+policy = RateLimitPolicy(rate_per_sec=rate, burst=burst, ttl_seconds=1800, cost=1, prefix="rl:tb", lease_size=lease_size)
+
+# Optional fleet-wide quota layered on top of the per-identity one (same Redis call unless sharded).
+global_rate = os.getenv("RL_GLOBAL_RATE_PER_SEC")
+dimensions = None
+if global_rate:
+    global_policy = RateLimitPolicy(rate_per_sec=float(global_rate), burst=int(os.getenv("RL_GLOBAL_BURST", "100")),
+                                    ttl_seconds=1800, cost=1, prefix="rl:tb")
+    dimensions = [("identity", policy), ("global", global_policy)]
 
 app = FastAPI(title="Distributed Rate Limiter Demo", version="1.0.0")
 
-r = get_redis(os.getenv("REDIS_URL"))
-limiter = TokenBucketLimiter(r, policy)
+# REDIS_URLS (comma separated) shards buckets across independent nodes; REDIS_CLUSTER_URL uses Redis Cluster.
+sharded = bool(os.getenv("REDIS_URLS") or os.getenv("REDIS_CLUSTER_URL"))
+if os.getenv("REDIS_CLUSTER_URL"):
+    r = get_async_redis_cluster()
+elif os.getenv("REDIS_URLS"):
+    r = get_async_sharded_redis()
+else:
+    r = get_async_redis(os.getenv("REDIS_URL"))
+limiter = ResilientLimiter(
+    AsyncTokenBucketLimiter(r, policy, redis_clock=os.getenv("RL_REDIS_CLOCK", "0") == "1"),
+    decision_timeout_ms=float(os.getenv("RL_DECISION_TIMEOUT_MS", "50")),
+    failure_mode=os.getenv("RL_FAILURE_MODE", "local"),
+    expected_workers=int(os.getenv("RL_EXPECTED_WORKERS", "1")),
+)
+
+# Optional in-flight cap per identity (RL_MAX_IN_FLIGHT), e.g. for expensive endpoints.
+max_in_flight = os.getenv("RL_MAX_IN_FLIGHT")
+concurrency = None
+if max_in_flight:
+    concurrency = AsyncConcurrencyLimiter(r, ConcurrencyPolicy(max_in_flight=int(max_in_flight),
+                                                               lease_ttl_ms=int(os.getenv("RL_LEASE_TTL_MS", "30000"))))
+
+# Adaptive mode: shed load via an AIMD rate multiplier when downstream p99 exceeds RL_ADAPTIVE_P99_MS.
+adaptive_p99 = os.getenv("RL_ADAPTIVE_P99_MS")
+adaptive = None
+if adaptive_p99:
+    adaptive = AdaptiveRate(r, target_p99_ms=float(adaptive_p99),
+                            max_error_rate=float(os.getenv("RL_ADAPTIVE_MAX_ERROR_RATE", "0.05")),
+                            min_multiplier=float(os.getenv("RL_ADAPTIVE_MIN_MULTIPLIER", "0.1")))
 
-app.add_middleware(RateLimitMiddleware, limiter=limiter, policy=policy, dimension_label="demo")
+heavy_hitters = HeavyHitters(int(os.getenv("RL_HEAVY_HITTERS_CAPACITY", "1000")))
+
+app.add_middleware(RateLimitMiddleware, limiter=limiter, policy=policy, dimensions=dimensions, dimension_label="demo",
+                   hash_tags=sharded, block_cache=BlockedCache(int(os.getenv("RL_BLOCK_CACHE_SIZE", "100000"))),
+                   heavy_hitters=heavy_hitters, concurrency=concurrency, adaptive=adaptive, exempt_paths={"/health", "/metrics", "/debug/heavy-hitters"})
+
+@app.on_event("shutdown")
+async def _release_leases():
+    await limiter.release_leases()
 
 @app.get("/health")
 def health():
@@ -30,6 +80,11 @@ def health():
 def hello(request: Request):
     return {"message": "hello", "client": request.client.host if request.client else "unknown"}
 
+@app.get("/debug/heavy-hitters")
+def debug_heavy_hitters(k: int = 20):
+    # Per worker: with several uvicorn workers each one reports the clients it has seen.
+    return heavy_hitters.snapshot(k)
+
 @app.get("/metrics")
 def metrics():
     data = generate_latest()
@@ -1,2 +1,4 @@
-from .config import RateLimitPolicy
-from .token_bucket import TokenBucketLimiter, Decision
+from .config import RateLimitPolicy, ConcurrencyPolicy
+from .token_bucket import TokenBucketLimiter, AsyncTokenBucketLimiter, Decision
+from .concurrency import ConcurrencyLimiter, AsyncConcurrencyLimiter
+from .resilience import ResilientLimiter, CircuitBreaker
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import inspect
+from collections import deque
+from time import monotonic, time
+from typing import Deque, Dict, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from starlette.concurrency import run_in_threadpool
+
+from rate_limiter.algorithms import wire
+from rate_limiter.metrics import rl_rate_multiplier
+from rate_limiter.token_bucket import _read_script
+
+class AdaptiveRate:
+    """AIMD rate multiplier per dimension, driven by downstream latency and errors, shared through Redis.
+
+    The middleware reports each request's downstream latency and whether it failed (5xx or exception). Every
+    ``interval_s`` a worker looks at what it saw for each dimension: if p99 is above ``target_p99_ms`` or the error
+    rate above ``max_error_rate`` it asks for a multiplicative decrease (``* decrease``), otherwise an additive
+    increase (``+ increase``), and the shared multiplier in ``{prefix}:{dimension}`` moves at most once per
+    interval fleet-wide (``scripts/aimd.lua``). The value it gets back is what its limiters pass to the Lua
+    scripts as the rate multiplier until the next interval. Dimensions with fewer than ``min_samples`` requests
+    only re-read the shared value.
+
+    ``r`` may be a sync or asyncio client; Redis errors keep the last known multiplier. Not thread-safe: use one
+    per event loop.
+    """
+
+    def __init__(
+        self,
+        r,
+        *,
+        target_p99_ms: float,
+        max_error_rate: float = 0.05,
+        increase: float = 0.05,
+        decrease: float = 0.7,
+        min_multiplier: float = 0.1,
+        interval_s: float = 1.0,
+        min_samples: int = 20,
+        max_samples: int = 5000,
+        prefix: str = "rl:aimd",
+        redis_clock: bool = False,
+    ):
+        if not 0 < decrease < 1 or not 0 < min_multiplier <= 1:
+            raise ValueError("AdaptiveRate needs 0 < decrease < 1 and 0 < min_multiplier <= 1")
+        self.r = r
+        self.target_p99_ms = target_p99_ms
+        self.max_error_rate = max_error_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.min_multiplier = min_multiplier
+        self.interval_s = interval_s
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.prefix = prefix
+        self.redis_clock = redis_clock
+        self._script = _read_script("aimd")
+        self._sha: Optional[str] = None
+        self._is_async = isinstance(r, (aioredis.Redis, aioredis.RedisCluster)) or inspect.iscoroutinefunction(r.evalsha)
+        self._multipliers: Dict[str, float] = {}
+        self._samples: Dict[str, Deque[Tuple[float, bool]]] = {}
+        self._next_adjust = monotonic() + interval_s
+        self._adjusting = False
+
+    def multiplier(self, dimension: str) -> float:
+        return self._multipliers.get(dimension, 1.0)
+
+    def observe(self, dimension: str, latency_s: float, error: bool) -> None:
+        samples = self._samples.get(dimension)
+        if samples is None:
+            samples = self._samples[dimension] = deque(maxlen=self.max_samples)
+            self._multipliers.setdefault(dimension, 1.0)
+        samples.append((latency_s, error))
+
+    def due(self) -> bool:
+        return not self._adjusting and monotonic() >= self._next_adjust
+
+    def _action(self, samples: Deque[Tuple[float, bool]]) -> int:
+        if len(samples) < self.min_samples:
+            return 0
+        latencies = sorted(s[0] for s in samples)
+        p99_ms = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000
+        error_rate = sum(1 for s in samples if s[1]) / len(samples)
+        return -1 if p99_ms > self.target_p99_ms or error_rate > self.max_error_rate else 1
+
+    def _args(self, action: int) -> list:
+        now = b"" if self.redis_clock else wire(int(time() * 1000))
+        hold_ms = int(self.interval_s * 1000 * 0.9)
+        return [now, wire(action), wire(self.increase), wire(self.decrease), wire(self.min_multiplier), b"1",
+                wire(hold_ms), wire(int(self.interval_s * 1000 * 600))]
+
+    async def _call(self, fn, *args):
+        if self._is_async:
+            return await fn(*args)
+        return await run_in_threadpool(fn, *args)
+
+    async def _eval(self, key: str, args: list):
+        if self._sha is None:
+            self._sha = await self._call(self.r.script_load, self._script)
+        try:
+            return await self._call(self.r.evalsha, self._sha, 1, key, *args)
+        except redis.exceptions.NoScriptError:
+            self._sha = await self._call(self.r.script_load, self._script)
+            return await self._call(self.r.evalsha, self._sha, 1, key, *args)
+
+    async def adjust(self) -> None:
+        """Fold the last interval's samples into the shared multipliers (called by the middleware when ``due``)."""
+        self._adjusting = True
+        self._next_adjust = monotonic() + self.interval_s
+        try:
+            # observe() keeps adding dimensions while this awaits Redis, so walk a snapshot.
+            for dimension, samples in list(self._samples.items()):
+                action = self._action(samples)
+                samples.clear()
+                try:
+                    m = float(await self._eval(f"{self.prefix}:{dimension}", self._args(action)))
+                except (redis.exceptions.RedisError, OSError):
+                    continue
+                self._multipliers[dimension] = m
+                rl_rate_multiplier.labels(dimension).set(m)
+        finally:
+            self._adjusting = False
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Dict, Sequence, Tuple
+from rate_limiter.config import RateLimitPolicy
+
+def wire(v) -> bytes:
+    """Shortest ASCII form of a script argument (``5.0`` goes out as ``5``)."""
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v).encode("ascii")
+
+def encode(policy: RateLimitPolicy, name: str, values: Sequence) -> Tuple[bytes, ...]:
+    """Encode a policy's static script arguments once and cache them on the policy."""
+    enc = policy._wire.get(name)
+    if enc is None:
+        enc = policy._wire[name] = tuple(wire(v) for v in values)
+    return enc
+
+class Algorithm(ABC):
+    """Maps a policy onto one Lua script; every script returns {allowed, remaining, retry_after_ms}.
+
+    Scripts take ``now_ms`` as ARGV[1] followed by the policy arguments from ``params``.
+    """
+    name: str
+    script: str
+
+    @abstractmethod
+    def params(self, policy: RateLimitPolicy) -> tuple:
+        """The policy's script arguments, in ARGV order after ``now_ms``."""
+
+    def encoded(self, policy: RateLimitPolicy) -> Tuple[bytes, ...]:
+        return encode(policy, self.name, self.params(policy))
+
+class TokenBucket(Algorithm):
+    """Hash of (tokens, ts_ms) per key; supports leasing and check_many."""
+    name = "token_bucket"
+    script = "token_bucket"
+
+    def params(self, policy: RateLimitPolicy) -> tuple:
+        return (policy.rate_per_sec, policy.burst, policy.cost, policy.ttl_seconds)
+
+class GCRA(Algorithm):
+    """One integer (theoretical arrival time) per key; the key expires when the bucket is full again."""
+    name = "gcra"
+    script = "gcra"
+
+    def params(self, policy: RateLimitPolicy) -> tuple:
+        return (policy.rate_per_sec, policy.burst, policy.cost)
+
+class SlidingWindow(Algorithm):
+    """Sliding window counter: ``burst`` requests per ``burst / rate_per_sec`` seconds, one string per key."""
+    name = "sliding_window"
+    script = "sliding_window"
+
+    def params(self, policy: RateLimitPolicy) -> tuple:
+        return (policy.rate_per_sec, policy.burst, policy.cost)
+
+ALGORITHMS: Dict[str, Algorithm] = {a.name: a for a in (TokenBucket(), GCRA(), SlidingWindow())}
@@ -0,0 +1,43 @@
+from __future__ import annotations
+from collections import OrderedDict
+from time import monotonic
+
+from rate_limiter.metrics import rl_block_cache_evictions
+
+class BlockedCache:
+    """Bounded in-process LRU of bucket keys known to be empty until a deadline.
+
+    A bucket that just returned ``retry_after_ms`` cannot allow anything before then, so follow-up requests can be
+    rejected locally without a Redis round trip. Entries expire at their deadline; the least recently blocked key is
+    evicted when the cache is full. Not thread-safe: use one per event loop.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.max_size = max_size
+        self._until: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._until)
+
+    def blocked_for_ms(self, key: str) -> int:
+        """Milliseconds until ``key`` may be allowed again; 0 if not known to be blocked."""
+        until = self._until.get(key)
+        if until is None:
+            return 0
+        left = until - monotonic() * 1000
+        if left <= 0:
+            del self._until[key]
+            rl_block_cache_evictions.labels("expired").inc()
+            return 0
+        return int(left) + 1
+
+    def block(self, key: str, retry_after_ms: int) -> None:
+        if retry_after_ms <= 0:
+            return
+        self._until[key] = monotonic() * 1000 + retry_after_ms
+        self._until.move_to_end(key)
+        if len(self._until) > self.max_size:
+            self._until.popitem(last=False)
+            rl_block_cache_evictions.labels("lru").inc()
@@ -1,10 +1,44 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field
+from typing import Literal
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 
 class RateLimitPolicy(BaseModel):
-    """Token bucket policy."""
+    """Rate limit policy.
+
+    ``algorithm`` picks the Redis engine: ``token_bucket`` (hash per key), ``gcra`` (one integer per key) or
+    ``sliding_window`` (``burst`` requests per ``burst / rate_per_sec`` seconds, one string per key).
+
+    Leasing (``lease_size > 0``) lets each worker reserve up to ``lease_size`` tokens per Redis call and spend
+    them in memory. A lease is capped at ``lease_max_fraction`` of the tokens currently in the bucket, so leases
+    shrink towards per-request checks as the bucket drains; worst-case over-admission is roughly
+    ``workers * lease_max_fraction * burst``. Unspent tokens are returned when the lease expires.
+    """
     rate_per_sec: float = Field(..., gt=0)
     burst: int = Field(..., ge=1)
     ttl_seconds: int = Field(default=3600, ge=10)
     cost: int = Field(default=1, ge=1)
     prefix: str = Field(default="rl:tb")
+    lease_size: int = Field(default=0, ge=0)
+    lease_ttl_ms: int = Field(default=1000, ge=1)
+    lease_max_fraction: float = Field(default=0.1, gt=0, le=1)
+    algorithm: Literal["token_bucket", "gcra", "sliding_window"] = "token_bucket"
+
+    # Script arguments encoded once per policy (see algorithms.encode); treat policies as immutable.
+    _wire: dict = PrivateAttr(default_factory=dict)
+
+    @model_validator(mode="after")
+    def _lease_needs_token_bucket(self):
+        if self.lease_size > 0 and self.algorithm != "token_bucket":
+            raise ValueError("leasing is only supported by the token_bucket algorithm")
+        return self
+
+class ConcurrencyPolicy(BaseModel):
+    """In-flight request limit.
+
+    Each admitted request holds a slot until it finishes or ``lease_ttl_ms`` passes, whichever is first, so set the
+    TTL above the slowest legitimate request. Rejections carry a retry-after of at most ``retry_after_ms``.
+    """
+    max_in_flight: int = Field(..., ge=1)
+    lease_ttl_ms: int = Field(default=30_000, ge=100)
+    retry_after_ms: int = Field(default=1000, ge=1)
+    prefix: str = Field(default="rl:cc")
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import heapq
+from time import monotonic
+from typing import Dict, List, Literal, Tuple
+
+from rate_limiter.metrics import rl_heavy_hitter_rate
+
+Kind = Literal["requests", "blocked"]
+
+class SpaceSaving:
+    """Space-Saving top-K counter: at most ``capacity`` keys, whatever the number of distinct keys seen.
+
+    A new key replaces the current minimum and inherits its count as ``error``, so every reported count
+    overestimates by at most ``error`` and any key with a true share above ``1 / capacity`` is guaranteed to be
+    tracked. The minimum is found through a lazy heap of lower bounds (counts only grow), so an update is O(1)
+    amortised for hits and O(log capacity) for replacements.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = capacity
+        self._counts: Dict[str, List[int]] = {}  # key -> [count, error]
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, key: str, n: int = 1) -> None:
+        entry = self._counts.get(key)
+        if entry is not None:
+            entry[0] += n
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[key] = [n, 0]
+            heapq.heappush(self._heap, (n, key))
+            return
+        while True:
+            low, victim = self._heap[0]
+            count = self._counts[victim][0]
+            if count == low:
+                break
+            heapq.heapreplace(self._heap, (count, victim))
+        del self._counts[victim]
+        self._counts[key] = [low + n, low]
+        heapq.heapreplace(self._heap, (low + n, key))
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """The ``k`` largest ``(key, count, error)`` triples."""
+        return [(key, c, e) for key, (c, e) in heapq.nlargest(k, self._counts.items(), key=lambda kv: kv[1][0])]
+
+    def clear(self) -> None:
+        self._counts.clear()
+        self._heap.clear()
+
+class HeavyHitters:
+    """Per-worker top-K of bucket keys by request rate and by block rate.
+
+    Counts run over tumbling windows of ``window_s``; reports use the current window, or the previous one while the
+    current is younger than ``min_window_s``. Every ``publish_interval_s`` the top ``gauge_k`` of each kind are
+    published to ``rate_limiter_heavy_hitter_rate{kind,rank,key}`` (old series are dropped first, so the gauge
+    never holds more than ``2 * gauge_k`` series). Not thread-safe: use one per event loop.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1000,
+        *,
+        window_s: float = 60.0,
+        min_window_s: float = 5.0,
+        gauge_k: int = 10,
+        publish_interval_s: float = 10.0,
+    ):
+        self.window_s = window_s
+        self.min_window_s = min_window_s
+        self.gauge_k = gauge_k
+        self.publish_interval_s = publish_interval_s
+        self._current = {"requests": SpaceSaving(capacity), "blocked": SpaceSaving(capacity)}
+        self._previous: Dict[str, List[Tuple[str, int, int]]] = {"requests": [], "blocked": []}
+        self._previous_span = 0.0
+        self._started = monotonic()
+        self._published = self._started
+
+    def record(self, key: str, blocked: bool) -> None:
+        now = monotonic()
+        if now - self._started >= self.window_s:
+            self._rotate(now)
+        self._current["requests"].add(key)
+        if blocked:
+            self._current["blocked"].add(key)
+        if now - self._published >= self.publish_interval_s:
+            self.publish(now)
+
+    def _rotate(self, now: float) -> None:
+        self._previous = {kind: s.top(self.gauge_k * 10) for kind, s in self._current.items()}
+        self._previous_span = now - self._started
+        for s in self._current.values():
+            s.clear()
+        self._started = now
+
+    def top(self, k: int = 10, kind: Kind = "requests") -> List[dict]:
+        """Top ``k`` keys with their estimated count, error bound and per-second rate."""
+        span = monotonic() - self._started
+        if span < self.min_window_s and self._previous_span:
+            rows, span = self._previous[kind][:k], self._previous_span
+        else:
+            rows = self._current[kind].top(k)
+        span = max(span, 1e-3)
+        return [{"key": key, "count": c, "error": e, "per_sec": round(c / span, 3)} for key, c, e in rows]
+
+    def snapshot(self, k: int = 10) -> dict:
+        return {"window_s": self.window_s, "requests": self.top(k, "requests"), "blocked": self.top(k, "blocked")}
+
+    def publish(self, now: float | None = None) -> None:
+        self._published = monotonic() if now is None else now
+        rl_heavy_hitter_rate.clear()
+        for kind in ("requests", "blocked"):
+            for rank, row in enumerate(self.top(self.gauge_k, kind), 1):
+                rl_heavy_hitter_rate.labels(kind, str(rank), row["key"]).set(row["per_sec"])
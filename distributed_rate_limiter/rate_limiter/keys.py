@@ -1,19 +1,43 @@
 from __future__ import annotations
 from typing import Optional
 
-def key_for_api_key(api_key: str, prefix: str) -> str:
-    return f"{prefix}:apikey:{api_key}"
+# With tagged=True the identity part is wrapped in a Redis Cluster hash tag, e.g. "rl:tb:{apikey:abc}", so every
+# bucket of one identity (across prefixes/policies) lands on the same slot or shard and can share a multi-key script.
 
-def key_for_user(user_id: str, prefix: str) -> str:
-    return f"{prefix}:user:{user_id}"
+def _key(prefix: str, identity: str, tagged: bool) -> str:
+    return f"{prefix}:{{{identity}}}" if tagged else f"{prefix}:{identity}"
 
-def key_for_ip(ip: str, prefix: str) -> str:
+def key_for_api_key(api_key: str, prefix: str, tagged: bool = False) -> str:
+    return _key(prefix, f"apikey:{api_key}", tagged)
+
+def key_for_user(user_id: str, prefix: str, tagged: bool = False) -> str:
+    return _key(prefix, f"user:{user_id}", tagged)
+
+def key_for_ip(ip: str, prefix: str, tagged: bool = False) -> str:
     safe = ip.replace(':', '_')
-    return f"{prefix}:ip:{safe}"
+    return _key(prefix, f"ip:{safe}", tagged)
 
-def pick_identity_key(prefix: str, api_key: Optional[str], user_id: Optional[str], ip: str) -> str:
+def pick_identity_key(prefix: str, api_key: Optional[str], user_id: Optional[str], ip: str, tagged: bool = False) -> str:
     if api_key:
-        return key_for_api_key(api_key, prefix)
+        return key_for_api_key(api_key, prefix, tagged)
     if user_id:
-        return key_for_user(user_id, prefix)
-    return key_for_ip(ip, prefix)
+        return key_for_user(user_id, prefix, tagged)
+    return key_for_ip(ip, prefix, tagged)
+
+def key_for_global(prefix: str, tagged: bool = False) -> str:
+    return _key(prefix, "global", tagged)
+
+def key_for_dimension(dimension: str, prefix: str, api_key: Optional[str], user_id: Optional[str], ip: str,
+                      tagged: bool = False) -> Optional[str]:
+    """Key for one quota dimension, or None when the request carries no such identity."""
+    if dimension == "identity":
+        return pick_identity_key(prefix, api_key=api_key, user_id=user_id, ip=ip, tagged=tagged)
+    if dimension == "apikey":
+        return key_for_api_key(api_key, prefix, tagged) if api_key else None
+    if dimension == "user":
+        return key_for_user(user_id, prefix, tagged) if user_id else None
+    if dimension == "ip":
+        return key_for_ip(ip, prefix, tagged)
+    if dimension == "global":
+        return key_for_global(prefix, tagged)
+    raise ValueError(f"unknown rate limit dimension: {dimension}")
@@ -1,6 +1,12 @@
 from __future__ import annotations
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 rl_allowed = Counter("rate_limiter_allowed_total", "Allowed requests", ["dimension"])
 rl_blocked = Counter("rate_limiter_blocked_total", "Blocked requests", ["dimension"])
 rl_latency = Histogram("rate_limiter_decision_seconds", "Limiter decision latency (seconds)", ["dimension"])
+rl_block_cache_hits = Counter("rate_limiter_block_cache_hits_total", "Requests rejected from the local blocked cache", ["dimension"])
+rl_block_cache_evictions = Counter("rate_limiter_block_cache_evictions_total", "Blocked cache evictions", ["reason"])
+rl_breaker_state = Gauge("rate_limiter_breaker_state", "Redis circuit breaker state (0=closed, 1=open, 2=half-open)", ["dimension"])
+rl_fallback = Counter("rate_limiter_fallback_total", "Decisions made without Redis, by failure mode", ["mode"])
+rl_heavy_hitter_rate = Gauge("rate_limiter_heavy_hitter_rate", "Per-second rate of this worker's top bucket keys", ["kind", "rank", "key"])
+rl_rate_multiplier = Gauge("rate_limiter_rate_multiplier", "Adaptive (AIMD) rate multiplier applied to the policy rate", ["dimension"])
@@ -1,68 +1,307 @@
 from __future__ import annotations
-from typing import Callable, Optional
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 from time import perf_counter
+from uuid import uuid4
+import inspect
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+import redis
+
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from rate_limiter.concurrency import ConcurrencyLimiter, AsyncConcurrencyLimiter
 from rate_limiter.config import RateLimitPolicy
-from rate_limiter.keys import pick_identity_key
-from rate_limiter.token_bucket import TokenBucketLimiter
-from rate_limiter.metrics import rl_allowed, rl_blocked, rl_latency
+from rate_limiter.keys import pick_identity_key, key_for_dimension
+from rate_limiter.token_bucket import TokenBucketLimiter, AsyncTokenBucketLimiter, Decision
+from rate_limiter.adaptive import AdaptiveRate
+from rate_limiter.blocked_cache import BlockedCache
+from rate_limiter.heavy_hitters import HeavyHitters
+from rate_limiter.registry import PolicyRegistry
+from rate_limiter.metrics import rl_allowed, rl_blocked, rl_latency, rl_block_cache_hits, rl_fallback
+
+def _combine(decisions: List[Decision], policies: List[RateLimitPolicy]) -> Tuple[Decision, int]:
+    """Fold per-dimension decisions into one, reporting the tightest bucket in the headers."""
+    blocked = [i for i, d in enumerate(decisions) if not d.allowed]
+    if blocked:
+        i = max(blocked, key=lambda j: decisions[j].retry_after_ms)
+        return Decision(False, decisions[i].remaining, decisions[i].retry_after_ms), policies[i].burst
+    i = min(range(len(decisions)), key=lambda j: decisions[j].remaining)
+    return decisions[i], policies[i].burst
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing one identity policy, or several layered dimensions checked in a single Redis call.
+
+    Identity headers are read straight from ``scope["headers"]`` and the ``X-RateLimit-*`` headers are added to the
+    ``http.response.start`` message, so response bodies (including streaming ones) pass through untouched.
+
+    ``dimensions`` is a list of ``(dimension, policy)`` pairs where dimension is one of
+    ``identity``, ``apikey``, ``user``, ``ip`` or ``global`` (see ``keys.key_for_dimension``).
+
+    Set ``hash_tags=True`` when the limiter runs on Redis Cluster or a ``ShardedRedis``. Layered dimensions are
+    then only colocated when they refer to the same identity (e.g. per-second and per-day windows for one API key);
+    others, such as an API key plus ``global``, are checked one shard at a time and are not all-or-nothing.
+
+    With a ``block_cache``, buckets that returned a retry-after are remembered locally and further requests for
+    them are rejected without calling Redis until the retry-after has elapsed.
+
+    With a ``registry``, the policy is chosen per request by route prefix, method and tier (see ``PolicyRegistry``)
+    and metrics are labelled with the matching rule's name.
+
+    With ``heavy_hitters``, every checked bucket key except the shared ``global`` one is counted in a fixed-size
+    top-K sketch, by requests and by rejections.
+
+    With a ``concurrency`` limiter, requests that pass the rate check (under ``concurrency_paths`` prefixes, or all of
+    them) must also hold one of the ``concurrency_dimension`` bucket's in-flight slots, released once the response
+    has been sent. If Redis fails here the request proceeds without a slot.
+
+    With ``adaptive``, the downstream latency and 5xx rate of admitted requests are reported per metric label (rule
+    name / dimension) and the resulting AIMD multiplier scales the policy rate inside the Lua decision.
+    """
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
-        app,
-        limiter: TokenBucketLimiter,
-        policy: RateLimitPolicy,
+        app: ASGIApp,
+        limiter: Union[TokenBucketLimiter, AsyncTokenBucketLimiter],
+        policy: Optional[RateLimitPolicy] = None,
         *,
+        dimensions: Optional[Sequence[Tuple[str, RateLimitPolicy]]] = None,
         api_key_header: str = "x-api-key",
         user_id_header: str = "x-user-id",
         exempt_paths: Optional[set[str]] = None,
         dimension_label: str = "default",
+        hash_tags: bool = False,
+        block_cache: Optional[BlockedCache] = None,
+        registry: Optional[PolicyRegistry] = None,
+        heavy_hitters: Optional[HeavyHitters] = None,
+        concurrency: Optional[Union[ConcurrencyLimiter, AsyncConcurrencyLimiter]] = None,
+        concurrency_dimension: str = "identity",
+        concurrency_paths: Optional[Sequence[str]] = None,
+        adaptive: Optional[AdaptiveRate] = None,
     ):
-        super().__init__(app)
+        self.app = app
+        if policy is None and not dimensions and registry is None:
+            raise ValueError("RateLimitMiddleware needs a policy, dimensions or a registry")
+        if dimensions and registry is not None:
+            raise ValueError("dimensions and registry cannot be combined")
         self.limiter = limiter
         self.policy = policy
+        self.dimensions = list(dimensions) if dimensions else None
         self.api_key_header = api_key_header.lower()
         self.user_id_header = user_id_header.lower()
+        self._api_key_h = self.api_key_header.encode("latin-1")
+        self._user_id_h = self.user_id_header.encode("latin-1")
+        self._tier_h = registry.tier_header.encode("latin-1") if registry is not None and registry.tier_header else None
         self.exempt_paths = exempt_paths or {"/health", "/metrics"}
         self.dimension_label = dimension_label
+        self.hash_tags = hash_tags
+        self.block_cache = block_cache
+        self.registry = registry
+        self.heavy_hitters = heavy_hitters
+        self.concurrency = concurrency
+        self.concurrency_dimension = concurrency_dimension
+        self.concurrency_paths = tuple(concurrency_paths) if concurrency_paths else None
+        self.adaptive = adaptive
+        self._limiter_is_async = inspect.iscoroutinefunction(limiter.check)
+        self._concurrency_is_async = concurrency is not None and inspect.iscoroutinefunction(concurrency.acquire)
+
+    async def _call(self, fn: Callable, *args, is_async: Optional[bool] = None):
+        if self._limiter_is_async if is_async is None else is_async:
+            return await fn(*args)
+        # Sync limiters block on a Redis round trip; keep that off the event loop.
+        return await run_in_threadpool(fn, *args)
 
-    async def dispatch(self, request: Request, call_next: Callable):
-        if request.url.path in self.exempt_paths:
-            return await call_next(request)
+    def _identity(self, scope: Scope) -> Tuple[Optional[str], Optional[str], str, Optional[str]]:
+        api_key = user_id = forwarded = tier = None
+        for name, value in scope["headers"]:
+            if name == self._api_key_h:
+                api_key = api_key or value.decode("latin-1")
+            elif name == self._user_id_h:
+                user_id = user_id or value.decode("latin-1")
+            elif name == b"x-forwarded-for":
+                forwarded = forwarded or value.decode("latin-1")
+            elif name == self._tier_h:
+                tier = tier or value.decode("latin-1")
+        if forwarded:
+            ip = forwarded.split(",")[0].strip()
+        else:
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+        return api_key, user_id, ip, tier
 
-        api_key = request.headers.get(self.api_key_header)
-        user_id = request.headers.get(self.user_id_header)
-        forwarded = request.headers.get("x-forwarded-for")
-        ip = (forwarded.split(",")[0].strip() if forwarded else (request.client.host if request.client else "unknown"))
+    async def decide(self, method: str, path: str, api_key: Optional[str], user_id: Optional[str], ip: str,
+                     header_tier: Optional[str] = None) -> Optional[Tuple[Decision, int, List[str]]]:
+        """Run the limiter for one request.
 
-        redis_key = pick_identity_key(self.policy.prefix, api_key=api_key, user_id=user_id, ip=ip)
+        Returns (decision, limit, metric labels of the checked buckets), or None when the request is not limited.
+        """
+        check_policy = None
+        if self.registry is not None:
+            tier = await self.registry.tier_for(api_key, header_tier)
+            rule = self.registry.match(method, path, tier)
+            if rule is None or rule.policy is None:
+                return None
+            check_policy = rule.policy
+            names = [rule.name]
+            keys = [pick_identity_key(rule.key_prefix, api_key=api_key, user_id=user_id, ip=ip, tagged=self.hash_tags)]
+            policies = [rule.policy]
+        elif self.dimensions is None:
+            names = [self.dimension_label]
+            keys = [pick_identity_key(self.policy.prefix, api_key=api_key, user_id=user_id, ip=ip, tagged=self.hash_tags)]
+            policies = [self.policy]
+        else:
+            names, keys, policies = [], [], []
+            for name, pol in self.dimensions:
+                k = key_for_dimension(name, pol.prefix, api_key=api_key, user_id=user_id, ip=ip, tagged=self.hash_tags)
+                if k is not None:
+                    names.append(name)
+                    keys.append(k)
+                    policies.append(pol)
+            if not keys:
+                return None
+
+        if self.block_cache is not None:
+            waits = [self.block_cache.blocked_for_ms(k) for k in keys]
+            if any(waits):
+                i = max(range(len(waits)), key=lambda j: waits[j])
+                for label, w in zip(names, waits):
+                    if w:
+                        rl_block_cache_hits.labels(label).inc()
+                        rl_blocked.labels(label).inc()
+                self._track(names, keys, blocked=True)
+                return Decision(False, 0.0, waits[i]), policies[i].burst, names
 
         t0 = perf_counter()
-        decision = self.limiter.check(redis_key)
+        if self.dimensions is None:
+            if self.adaptive is None:
+                per_dim = [await self._call(self.limiter.check, keys[0], check_policy)]
+            else:
+                per_dim = [await self._call(self.limiter.check, keys[0], check_policy, self.adaptive.multiplier(names[0]))]
+        elif self.adaptive is None:
+            per_dim = await self._call(self.limiter.check_many, keys, policies)
+        else:
+            scales = [self.adaptive.multiplier(n) for n in names]
+            per_dim = await self._call(self.limiter.check_many, keys, policies, scales)
         rl_latency.labels(self.dimension_label).observe(perf_counter() - t0)
-
-        headers = {
-            "X-RateLimit-Limit": str(self.policy.burst),
-            "X-RateLimit-Remaining": str(max(0, int(decision.remaining))),
-        }
+        decision, limit = _combine(per_dim, policies)
 
         if decision.allowed:
-            rl_allowed.labels(self.dimension_label).inc()
-            resp: Response = await call_next(request)
-            for k, v in headers.items():
-                resp.headers[k] = v
-            return resp
+            for label in names:
+                rl_allowed.labels(label).inc()
+        else:
+            for label, key, d in zip(names, keys, per_dim):
+                if not d.allowed:
+                    rl_blocked.labels(label).inc()
+                    if self.block_cache is not None:
+                        self.block_cache.block(key, d.retry_after_ms)
+        self._track(names, keys, blocked=not decision.allowed)
+        return decision, limit, names
+
+    def _track(self, names: List[str], keys: List[str], blocked: bool) -> None:
+        if self.heavy_hitters is not None:
+            for name, key in zip(names, keys):
+                if name != "global":
+                    self.heavy_hitters.record(key, blocked)
 
-        rl_blocked.labels(self.dimension_label).inc()
+    @staticmethod
+    def limit_headers(decision: Decision, limit: int) -> List[Tuple[bytes, bytes]]:
+        return [
+            (b"x-ratelimit-limit", str(limit).encode("latin-1")),
+            (b"x-ratelimit-remaining", str(max(0, int(decision.remaining))).encode("latin-1")),
+        ]
+
+    @staticmethod
+    def reject(decision: Decision, limit: int) -> JSONResponse:
         retry_after_s = max(1, int((decision.retry_after_ms + 999) / 1000))
-        headers["Retry-After"] = str(retry_after_s)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(max(0, int(decision.remaining))),
+            "Retry-After": str(retry_after_s),
+        }
         return JSONResponse(
             status_code=429,
             content={"error": "rate_limited", "retry_after_seconds": retry_after_s},
             headers=headers,
         )
+
+    def _slot_key(self, path: str, api_key: Optional[str], user_id: Optional[str], ip: str) -> Optional[str]:
+        if self.concurrency is None:
+            return None
+        if self.concurrency_paths is not None and not path.startswith(self.concurrency_paths):
+            return None
+        return key_for_dimension(self.concurrency_dimension, self.concurrency.policy.prefix, api_key=api_key,
+                                 user_id=user_id, ip=ip, tagged=self.hash_tags)
+
+    async def _slot(self, fn: Callable, *args) -> Optional[Decision]:
+        try:
+            return await self._call(fn, *args, is_async=self._concurrency_is_async)
+        except (redis.exceptions.RedisError, OSError):
+            rl_fallback.labels("open").inc()
+            return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        api_key, user_id, ip, header_tier = self._identity(scope)
+        outcome = await self.decide(scope["method"], scope["path"], api_key, user_id, ip, header_tier)
+        if outcome is not None and not outcome[0].allowed:
+            await self.reject(outcome[0], outcome[1])(scope, receive, send)
+            return
+
+        app_send = send
+        if outcome is not None:
+            extra = self.limit_headers(outcome[0], outcome[1])
+
+            async def send_with_limit_headers(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", ()), *extra]}
+                await send(message)
+
+            app_send = send_with_limit_headers
+
+        slot_key = self._slot_key(scope["path"], api_key, user_id, ip)
+        token = None
+        if slot_key is not None:
+            token = uuid4().hex
+            slot = await self._slot(self.concurrency.acquire, slot_key, token)
+            if slot is None:
+                token = None
+            elif not slot.allowed:
+                rl_blocked.labels("concurrency").inc()
+                await self.reject(slot, self.concurrency.policy.max_in_flight)(scope, receive, send)
+                return
+
+        if self.adaptive is not None and outcome is not None:
+            await self._observed(scope, receive, app_send, outcome[2], slot_key, token)
+            return
+
+        try:
+            await self.app(scope, receive, app_send)
+        finally:
+            if token is not None:
+                await self._slot(self.concurrency.release, slot_key, token)
+
+    async def _observed(self, scope: Scope, receive: Receive, send: Send, names: List[str],
+                        slot_key: Optional[str], token: Optional[str]) -> None:
+        """Run the app and report its latency and outcome to the adaptive controller."""
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - t0
+            if token is not None:
+                await self._slot(self.concurrency.release, slot_key, token)
+            for name in names:
+                self.adaptive.observe(name, elapsed, status >= 500)
+        if self.adaptive.due():
+            await self.adaptive.adjust()
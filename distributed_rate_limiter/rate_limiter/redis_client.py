@@ -1,6 +1,9 @@
 from __future__ import annotations
 import os
+from typing import Sequence
 import redis
+import redis.asyncio as aioredis
+from rate_limiter.sharding import ShardedRedis, AsyncShardedRedis
 
 def get_redis(url: str | None = None) -> redis.Redis:
     url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -11,3 +14,43 @@ def get_redis(url: str | None = None) -> redis.Redis:
         socket_connect_timeout=2.0,
         health_check_interval=10,
     )
+
+def get_async_redis(url: str | None = None, *, max_connections: int | None = None) -> aioredis.Redis:
+    """asyncio client backed by a bounded pool; callers wait for a free connection instead of erroring."""
+    url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    max_connections = max_connections or int(os.getenv("REDIS_MAX_CONNECTIONS", "256"))
+    pool = aioredis.BlockingConnectionPool.from_url(
+        url,
+        max_connections=max_connections,
+        timeout=2.0,
+        decode_responses=False,
+        socket_timeout=2.0,
+        socket_connect_timeout=2.0,
+        health_check_interval=10,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+def _urls(urls: Sequence[str] | str | None) -> list[str]:
+    urls = urls or os.getenv("REDIS_URLS", "")
+    if isinstance(urls, str):
+        urls = [u.strip() for u in urls.split(",") if u.strip()]
+    if not urls:
+        raise ValueError("no Redis URLs given (pass urls or set REDIS_URLS)")
+    return list(urls)
+
+def get_sharded_redis(urls: Sequence[str] | str | None = None) -> ShardedRedis:
+    """Consistent-hash over several independent Redis nodes (``REDIS_URLS`` is comma separated)."""
+    urls = _urls(urls)
+    return ShardedRedis([get_redis(u) for u in urls], names=urls)
+
+def get_async_sharded_redis(urls: Sequence[str] | str | None = None, *, max_connections: int | None = None) -> AsyncShardedRedis:
+    urls = _urls(urls)
+    return AsyncShardedRedis([get_async_redis(u, max_connections=max_connections) for u in urls], names=urls)
+
+def get_redis_cluster(url: str | None = None) -> redis.RedisCluster:
+    url = url or os.getenv("REDIS_CLUSTER_URL", "redis://localhost:7000/0")
+    return redis.RedisCluster.from_url(url, decode_responses=False, socket_timeout=2.0, socket_connect_timeout=2.0)
+
+def get_async_redis_cluster(url: str | None = None) -> aioredis.RedisCluster:
+    url = url or os.getenv("REDIS_CLUSTER_URL", "redis://localhost:7000/0")
+    return aioredis.RedisCluster.from_url(url, decode_responses=False, socket_timeout=2.0, socket_connect_timeout=2.0)
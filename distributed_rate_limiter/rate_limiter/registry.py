@@ -0,0 +1,140 @@
+from __future__ import annotations
+import inspect
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from rate_limiter.config import RateLimitPolicy
+
+TierLookup = Callable[[str], Union[Optional[str], Awaitable[Optional[str]]]]
+
+@dataclass
+class PolicyRule:
+    """Policy for requests under ``path_prefix`` (whole path segments), optionally narrowed by method and tier.
+
+    ``policy=None`` exempts matching requests. Buckets are keyed under ``{policy.prefix}:{name}`` so every rule
+    has its own quota.
+    """
+    name: str
+    policy: Optional[RateLimitPolicy]
+    path_prefix: str = "/"
+    methods: Optional[Iterable[str]] = None
+    tier: Optional[str] = None
+    key_prefix: str = field(init=False, default="")
+
+    def __post_init__(self):
+        self.key_prefix = f"{self.policy.prefix}:{self.name}" if self.policy else ""
+
+class _Node:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = {}
+        self.rules: Dict[Tuple[Optional[str], Optional[str]], PolicyRule] = {}
+
+class _TTLCache:
+    """Bounded LRU whose entries expire ``ttl_s`` after they were stored."""
+
+    def __init__(self, ttl_s: float, max_size: int):
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self._data: OrderedDict[str, Tuple[float, Optional[str]]] = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        hit = self._data.get(key)
+        if hit is None:
+            return False, None
+        if hit[0] <= monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, hit[1]
+
+    def put(self, key: str, value: Optional[str]) -> None:
+        self._data[key] = (monotonic() + self.ttl_s, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+def _segments(path: str):
+    return [s for s in path.split("/") if s]
+
+class PolicyRegistry:
+    """Route/method/tier -> policy table compiled once into a path-segment trie.
+
+    ``match`` walks one trie node per path segment and does at most four dict lookups per node, so its cost depends
+    on the path depth, not on the number of rules. The longest matching prefix wins; at equal depth a rule naming
+    both method and tier beats one naming only the method, which beats tier-only, which beats neither.
+
+    The tier comes from ``tier_header`` if set and present, otherwise from ``tier_lookup(api_key)`` (sync or async),
+    whose results are cached for ``tier_cache_ttl_s``.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[PolicyRule],
+        *,
+        tier_header: Optional[str] = None,
+        tier_lookup: Optional[TierLookup] = None,
+        tier_cache_ttl_s: float = 60.0,
+        tier_cache_size: int = 100_000,
+    ):
+        self.tier_header = tier_header.lower() if tier_header else None
+        self.tier_lookup = tier_lookup
+        self._lookup_is_async = inspect.iscoroutinefunction(tier_lookup)
+        self._tiers = _TTLCache(tier_cache_ttl_s, tier_cache_size)
+        self._root = _Node()
+        for rule in rules:
+            self._add(rule)
+
+    def _add(self, rule: PolicyRule) -> None:
+        node = self._root
+        for seg in _segments(rule.path_prefix):
+            node = node.children.setdefault(seg, _Node())
+        methods = [m.upper() for m in rule.methods] if rule.methods else [None]
+        for m in methods:
+            slot = (m, rule.tier)
+            if slot in node.rules:
+                raise ValueError(f"rules {node.rules[slot].name!r} and {rule.name!r} overlap")
+            node.rules[slot] = rule
+
+    @staticmethod
+    def _pick(node: _Node, method: str, tier: Optional[str]) -> Optional[PolicyRule]:
+        rules = node.rules
+        if not rules:
+            return None
+        if tier is not None:
+            hit = rules.get((method, tier)) or rules.get((method, None)) or rules.get((None, tier))
+        else:
+            hit = rules.get((method, None))
+        return hit or rules.get((None, None))
+
+    def match(self, method: str, path: str, tier: Optional[str] = None) -> Optional[PolicyRule]:
+        node = self._root
+        best = self._pick(node, method, tier)
+        for seg in _segments(path):
+            node = node.children.get(seg)
+            if node is None:
+                break
+            hit = self._pick(node, method, tier)
+            if hit is not None:
+                best = hit
+        return best
+
+    async def tier_for(self, api_key: Optional[str], header_value: Optional[str] = None) -> Optional[str]:
+        if header_value:
+            return header_value
+        if not api_key or self.tier_lookup is None:
+            return None
+        found, tier = self._tiers.get(api_key)
+        if found:
+            return tier
+        if self._lookup_is_async:
+            tier = await self.tier_lookup(api_key)
+        else:
+            tier = await run_in_threadpool(self.tier_lookup, api_key)
+        self._tiers.put(api_key, tier)
+        return tier
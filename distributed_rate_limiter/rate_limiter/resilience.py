@@ -0,0 +1,182 @@
+from __future__ import annotations
+import asyncio
+import math
+from collections import OrderedDict
+from time import monotonic
+from typing import Awaitable, Callable, List, Literal, Optional, Sequence
+
+import redis
+
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.metrics import rl_breaker_state, rl_fallback
+from rate_limiter.token_bucket import AsyncTokenBucketLimiter, Decision
+
+FailureMode = Literal["local", "open", "closed"]
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Opens after ``failure_threshold`` failures in a row, stays open for ``reset_timeout_s``, then lets a single
+    trial call through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 2.0, label: str = "default"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.label = label
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        rl_breaker_state.labels(label).set(CLOSED)
+
+    def _set(self, state: int) -> None:
+        self.state = state
+        rl_breaker_state.labels(self.label).set(state)
+
+    def allow_request(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and monotonic() - self._opened_at >= self.reset_timeout_s:
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._trial_in_flight = False
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = monotonic()
+            self._set(OPEN)
+
+class LocalTokenBucket:
+    """Per-process token buckets used while Redis is unavailable.
+
+    Each bucket gets ``1 / expected_workers`` of the policy's rate and burst, so the fleet as a whole stays close to
+    the global limit. Bounded LRU over keys.
+    """
+
+    def __init__(self, expected_workers: int = 1, max_keys: int = 100_000):
+        self.expected_workers = max(1, expected_workers)
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, List[float]] = OrderedDict()
+
+    def _tokens(self, key: str, policy: RateLimitPolicy, now: float, scale: float) -> tuple[float, float, float]:
+        rate = policy.rate_per_sec * scale / self.expected_workers
+        burst = max(1.0, math.ceil(policy.burst / self.expected_workers))
+        b = self._buckets.get(key)
+        tokens = burst if b is None else min(burst, b[0] + (now - b[1]) * rate)
+        return tokens, rate, burst
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        self._buckets[key] = [tokens, now]
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def check_many(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                   scales: Optional[Sequence[float]] = None) -> List[Decision]:
+        now = monotonic()
+        scales = scales or [1.0] * len(keys)
+        state = [self._tokens(k, p, now, s) for k, p, s in zip(keys, policies, scales)]
+        ok = [tokens >= p.cost for (tokens, _, _), p in zip(state, policies)]
+        out = []
+        for k, p, (tokens, rate, _), allowed in zip(keys, policies, state, ok):
+            if all(ok):
+                tokens -= p.cost
+            self._store(k, tokens, now)
+            retry_after_ms = 0 if allowed else math.ceil((p.cost - tokens) / rate * 1000)
+            out.append(Decision(allowed, tokens, retry_after_ms))
+        return out
+
+    def check(self, key: str, policy: RateLimitPolicy, scale: float = 1.0) -> Decision:
+        return self.check_many([key], [policy], [scale])[0]
+
+class ResilientLimiter:
+    """Wraps an AsyncTokenBucketLimiter with a decision deadline and a circuit breaker.
+
+    A Redis call that errors or misses ``decision_timeout_ms`` counts as a failure. While the breaker is open (and
+    for the failing call itself) ``failure_mode`` decides: ``local`` uses a LocalTokenBucket, ``open`` allows and
+    ``closed`` rejects. Limiter latency is therefore capped at the deadline during incidents.
+
+    A missed deadline cancels the Redis call mid-read, and redis-py then drops that connection, so keep the deadline
+    well above Redis' healthy p99 (tens of milliseconds) or every slow spike turns into reconnects.
+    """
+
+    def __init__(
+        self,
+        limiter: AsyncTokenBucketLimiter,
+        *,
+        decision_timeout_ms: float = 50.0,
+        breaker: Optional[CircuitBreaker] = None,
+        failure_mode: FailureMode = "local",
+        expected_workers: int = 1,
+        fallback: Optional[LocalTokenBucket] = None,
+    ):
+        if failure_mode not in ("local", "open", "closed"):
+            raise ValueError(f"unknown failure_mode: {failure_mode}")
+        self.limiter = limiter
+        self.policy = limiter.policy
+        self.timeout_s = decision_timeout_ms / 1000.0
+        self.breaker = breaker or CircuitBreaker()
+        self.failure_mode = failure_mode
+        self.fallback = fallback or LocalTokenBucket(expected_workers)
+
+    def _degraded(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                  scales: Optional[Sequence[float]]) -> List[Decision]:
+        rl_fallback.labels(self.failure_mode).inc()
+        if self.failure_mode == "local":
+            return self.fallback.check_many(keys, policies, scales)
+        if self.failure_mode == "open":
+            return [Decision(True, float(p.burst), 0) for p in policies]
+        return [Decision(False, 0.0, int(self.breaker.reset_timeout_s * 1000)) for _ in policies]
+
+    async def _run(self, call: Callable[[], Awaitable[List[Decision]]], keys: Sequence[str],
+                   policies: Sequence[RateLimitPolicy], scales: Optional[Sequence[float]] = None) -> List[Decision]:
+        if not self.breaker.allow_request():
+            return self._degraded(keys, policies, scales)
+        ok = False
+        try:
+            decisions = await asyncio.wait_for(call(), self.timeout_s)
+            ok = True
+        except (asyncio.TimeoutError, redis.exceptions.RedisError, OSError):
+            return self._degraded(keys, policies, scales)
+        finally:
+            # Anything else (a bug, or the request being cancelled) still settles the breaker and its trial slot.
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return decisions
+
+    async def check(self, key: str, policy: Optional[RateLimitPolicy] = None, scale: float = 1.0) -> Decision:
+        async def call():
+            # Only adaptive callers pass a scale, so plain limiters keep their two-argument check.
+            if scale == 1.0:
+                return [await self.limiter.check(key, policy)]
+            return [await self.limiter.check(key, policy, scale)]
+        return (await self._run(call, [key], [policy or self.policy], [scale]))[0]
+
+    async def check_many(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                         scales: Optional[Sequence[float]] = None) -> List[Decision]:
+        async def call():
+            if scales is None:
+                return await self.limiter.check_many(keys, policies)
+            return await self.limiter.check_many(keys, policies, scales)
+        return await self._run(call, keys, policies, scales)
+
+    async def release_leases(self, expired_only: bool = False) -> None:
+        try:
+            await asyncio.wait_for(self.limiter.release_leases(expired_only), self.timeout_s * 10)
+        except (asyncio.TimeoutError, redis.exceptions.RedisError, OSError):
+            pass
@@ -0,0 +1,47 @@
+-- Shared AIMD rate multiplier (Redis + Lua)
+-- KEYS[1] multiplier key
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2] action: 1 increase, -1 decrease, 0 read only
+-- ARGV[3] additive step
+-- ARGV[4] multiplicative factor (< 1)
+-- ARGV[5] min multiplier
+-- ARGV[6] max multiplier
+-- ARGV[7] hold_ms: minimum time between changes, so N workers reporting the same interval move it once
+-- ARGV[8] key ttl in ms (an idle key resets to max)
+--
+-- Hash fields: m (float), ts_ms (last change), last (last action)
+-- A decrease right after an increase is applied immediately, so bad news is never held back.
+-- Return: multiplier as a string (Lua numbers would be truncated to integers)
+
+local key = KEYS[1]
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local action = tonumber(ARGV[2])
+local step = tonumber(ARGV[3])
+local factor = tonumber(ARGV[4])
+local lo = tonumber(ARGV[5])
+local hi = tonumber(ARGV[6])
+local hold_ms = tonumber(ARGV[7])
+local ttl_ms = tonumber(ARGV[8])
+
+local data = redis.call('HMGET', key, 'm', 'ts_ms', 'last')
+local m = tonumber(data[1]) or hi
+local ts = tonumber(data[2]) or 0
+local last = tonumber(data[3]) or 0
+local held = now_ms - ts < hold_ms
+
+if action < 0 and (not held or last > 0) then
+  m = math.max(lo, m * factor)
+  redis.call('HSET', key, 'm', m, 'ts_ms', now_ms, 'last', -1)
+elseif action > 0 and not held and m < hi then
+  m = math.min(hi, m + step)
+  redis.call('HSET', key, 'm', m, 'ts_ms', now_ms, 'last', 1)
+end
+if action ~= 0 then
+  redis.call('PEXPIRE', key, ttl_ms)
+end
+
+return tostring(m)
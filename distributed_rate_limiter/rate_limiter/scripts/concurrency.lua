@@ -0,0 +1,37 @@
+-- Concurrency slots (Redis + Lua): sorted set of in-flight leases scored by expiry
+-- KEYS[1] slot set key
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2] max_in_flight
+-- ARGV[3] lease_ttl_ms
+-- ARGV[4] lease token (unique per request)
+-- ARGV[5] retry_after cap in ms
+--
+-- Leases past their expiry are dropped first, so slots held by crashed workers free themselves.
+-- Return: {acquired(0/1), slots_remaining(int), retry_after_ms(int)}
+
+local key = KEYS[1]
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local limit = tonumber(ARGV[2])
+local ttl_ms = tonumber(ARGV[3])
+local token = ARGV[4]
+local retry_cap = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now_ms)
+local in_flight = redis.call('ZCARD', key)
+
+if in_flight < limit then
+  redis.call('ZADD', key, now_ms + ttl_ms, token)
+  redis.call('PEXPIRE', key, ttl_ms)
+  return {1, limit - in_flight - 1, 0}
+end
+
+-- Full: the oldest lease expires first at the latest; a release usually frees a slot sooner.
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry_after_ms = tonumber(oldest[2]) - now_ms
+if retry_after_ms > retry_cap then retry_after_ms = retry_cap end
+if retry_after_ms < 1 then retry_after_ms = 1 end
+return {0, 0, retry_after_ms}
@@ -0,0 +1,38 @@
+-- GCRA (Generic Cell Rate Algorithm), single integer state
+-- KEYS[1] key
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2] rate_per_sec
+-- ARGV[3] burst
+-- ARGV[4] cost
+-- ARGV[5] rate multiplier (optional, adaptive mode; default 1)
+--
+-- Value: theoretical arrival time (TAT) in microseconds, stored with SET ... PX so the
+-- key disappears exactly when the bucket would be full again.
+-- Return: {allowed(1/0), tokens_remaining(int), retry_after_ms(int)}
+
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local now = now_ms * 1000
+local interval = 1000000.0 / (tonumber(ARGV[2]) * (tonumber(ARGV[5]) or 1))
+local burst = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local tau = interval * burst
+
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+  tat = now
+end
+
+local new_tat = tat + interval * cost
+local diff = new_tat - now
+
+if diff > tau then
+  local remaining = math.floor((tau - (tat - now)) / interval + 1e-9)
+  return {0, remaining, math.ceil((diff - tau) / 1000.0)}
+end
+
+redis.call('SET', KEYS[1], string.format('%.0f', new_tat), 'PX', math.ceil(diff / 1000.0))
+return {1, math.floor((tau - diff) / interval + 1e-9), 0}
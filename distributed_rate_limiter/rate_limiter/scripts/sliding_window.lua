@@ -0,0 +1,61 @@
+-- Sliding window counter, single string state
+-- KEYS[1] key
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2] rate_per_sec
+-- ARGV[3] burst (requests allowed per window; window = burst / rate seconds)
+-- ARGV[4] cost
+-- ARGV[5] rate multiplier (optional, adaptive mode; default 1). Scales the per-window limit so the
+--         window length, and with it the stored window index, stays fixed.
+--
+-- Value: "window_index:current_count:previous_count". The previous window's count is
+-- weighted by how much of it still overlaps the sliding window. Blocked calls do not write.
+-- Return: {allowed(1/0), tokens_remaining(int), retry_after_ms(int)}
+
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local rate = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local window_ms = math.ceil((limit / rate) * 1000.0)
+limit = limit * (tonumber(ARGV[5]) or 1)
+local idx = math.floor(now_ms / window_ms)
+local elapsed = now_ms - idx * window_ms
+
+local cur = 0
+local prev = 0
+local raw = redis.call('GET', KEYS[1])
+if raw then
+  local s_idx, s_cur, s_prev = string.match(raw, '^(%d+):(%d+):(%d+)$')
+  s_idx = tonumber(s_idx)
+  if s_idx == idx then
+    cur = tonumber(s_cur)
+    prev = tonumber(s_prev)
+  elseif s_idx == idx - 1 then
+    prev = tonumber(s_cur)
+  end
+end
+
+local count = prev * (1.0 - elapsed / window_ms) + cur
+
+if count + cost <= limit then
+  cur = cur + cost
+  redis.call('SET', KEYS[1], string.format('%d:%d:%d', idx, cur, prev), 'PX', 2 * window_ms)
+  return {1, math.floor(limit - count - cost), 0}
+end
+
+local retry_after_ms
+local room = limit - cur - cost
+if room >= 0 and prev > 0 then
+  retry_after_ms = math.ceil(window_ms * (1.0 - room / prev)) - elapsed
+else
+  retry_after_ms = window_ms - elapsed
+end
+if retry_after_ms < 1 then retry_after_ms = 1 end
+
+local remaining = limit - count
+if remaining < 0 then remaining = 0 end
+return {0, math.floor(remaining), retry_after_ms}
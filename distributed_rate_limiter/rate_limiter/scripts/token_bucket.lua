@@ -1,17 +1,22 @@
 -- Token Bucket (Redis + Lua)
 -- KEYS[1] bucket key
--- ARGV[1] now_ms
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
 -- ARGV[2] rate_per_sec
 -- ARGV[3] burst
 -- ARGV[4] cost
 -- ARGV[5] ttl_seconds
+-- ARGV[6] rate multiplier (optional, adaptive mode; default 1)
 --
 -- Hash fields: tokens (float), ts_ms (int)
 -- Return: {allowed(1/0), tokens_remaining(float), retry_after_ms(int)}
 
 local key = KEYS[1]
 local now_ms = tonumber(ARGV[1])
-local rate = tonumber(ARGV[2])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local rate = tonumber(ARGV[2]) * (tonumber(ARGV[6]) or 1)
 local burst = tonumber(ARGV[3])
 local cost = tonumber(ARGV[4])
 local ttl = tonumber(ARGV[5])
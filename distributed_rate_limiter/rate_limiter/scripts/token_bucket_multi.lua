@@ -0,0 +1,71 @@
+-- Multi-bucket Token Bucket (Redis + Lua), all-or-nothing
+-- KEYS[1..n] bucket keys
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2 + s*(i-1) ..] rate_per_sec, burst, cost, ttl_seconds[, rate multiplier] for KEYS[i]; the stride s is
+--   4, or 5 when every bucket carries a rate multiplier (adaptive mode)
+--
+-- Every bucket is refilled and checked first; tokens are deducted only if
+-- all buckets allow the request.
+-- Hash fields: tokens (float), ts_ms (int)
+-- Return: flat {allowed_1, tokens_1, retry_after_ms_1, allowed_2, ...}
+
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local n = #KEYS
+local stride = (#ARGV - 1) / n
+
+local tokens = {}
+local allowed = {}
+local retry_after = {}
+local all_allowed = 1
+
+for i = 1, n do
+  local base = 2 + (i - 1) * stride
+  local rate = tonumber(ARGV[base])
+  if stride == 5 then rate = rate * tonumber(ARGV[base + 4]) end
+  local burst = tonumber(ARGV[base + 1])
+  local cost = tonumber(ARGV[base + 2])
+
+  local data = redis.call('HMGET', KEYS[i], 'tokens', 'ts_ms')
+  local t = tonumber(data[1])
+  local last_ms = tonumber(data[2])
+  if t == nil or last_ms == nil then
+    t = burst
+    last_ms = now_ms
+  end
+
+  local delta_ms = now_ms - last_ms
+  if delta_ms < 0 then delta_ms = 0 end
+  t = t + (delta_ms / 1000.0) * rate
+  if t > burst then t = burst end
+
+  if t >= cost then
+    allowed[i] = 1
+    retry_after[i] = 0
+  else
+    allowed[i] = 0
+    all_allowed = 0
+    retry_after[i] = math.ceil(((cost - t) / rate) * 1000.0)
+  end
+  tokens[i] = t
+end
+
+local out = {}
+for i = 1, n do
+  local base = 2 + (i - 1) * stride
+  local cost = tonumber(ARGV[base + 2])
+  local ttl = tonumber(ARGV[base + 3])
+  if all_allowed == 1 then
+    tokens[i] = tokens[i] - cost
+  end
+  redis.call('HSET', KEYS[i], 'tokens', tokens[i], 'ts_ms', now_ms)
+  redis.call('EXPIRE', KEYS[i], ttl)
+  out[#out + 1] = allowed[i]
+  out[#out + 1] = tokens[i]
+  out[#out + 1] = retry_after[i]
+end
+
+return out
@@ -0,0 +1,62 @@
+-- Token lease (Redis + Lua): reserve a batch of tokens for local spending
+-- KEYS[1] bucket key
+-- ARGV[1] now_ms (empty = use Redis TIME, skew-free across app hosts)
+-- ARGV[2] rate_per_sec
+-- ARGV[3] burst
+-- ARGV[4] cost
+-- ARGV[5] ttl_seconds
+-- ARGV[6] lease_max_fraction
+-- ARGV[7] lease_size (0 = only return tokens)
+-- ARGV[8] returned tokens from a previous lease
+-- ARGV[9] rate multiplier (optional, adaptive mode; default 1)
+--
+-- Hash fields: tokens (float), ts_ms (int) -- same layout as token_bucket.lua
+-- Return: {granted(int), tokens_remaining(float), retry_after_ms(int)}
+
+local key = KEYS[1]
+local now_ms = tonumber(ARGV[1])
+if now_ms == nil then
+  local t = redis.call('TIME')
+  now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+end
+local rate = tonumber(ARGV[2]) * (tonumber(ARGV[9]) or 1)
+local burst = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local ttl = tonumber(ARGV[5])
+local max_fraction = tonumber(ARGV[6])
+local lease_size = tonumber(ARGV[7])
+local returned = tonumber(ARGV[8])
+
+local data = redis.call('HMGET', key, 'tokens', 'ts_ms')
+local tokens = tonumber(data[1])
+local last_ms = tonumber(data[2])
+
+if tokens == nil or last_ms == nil then
+  tokens = burst
+  last_ms = now_ms
+end
+
+local delta_ms = now_ms - last_ms
+if delta_ms < 0 then delta_ms = 0 end
+
+tokens = tokens + (delta_ms / 1000.0) * rate + returned
+if tokens > burst then tokens = burst end
+
+local granted = 0
+local retry_after_ms = 0
+
+if lease_size > 0 then
+  if tokens >= cost then
+    granted = math.floor(tokens * max_fraction)
+    if granted > lease_size then granted = lease_size end
+    if granted < cost then granted = cost end
+    tokens = tokens - granted
+  else
+    retry_after_ms = math.ceil(((cost - tokens) / rate) * 1000.0)
+  end
+end
+
+redis.call('HSET', key, 'tokens', tokens, 'ts_ms', now_ms)
+redis.call('EXPIRE', key, ttl)
+
+return {granted, tokens, retry_after_ms}
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+from bisect import bisect
+from typing import Generic, List, Sequence, TypeVar
+
+import redis
+import redis.asyncio as aioredis
+
+N = TypeVar("N")
+
+def hash_tag(key: str) -> str:
+    """The part of ``key`` that decides placement, using Redis Cluster's ``{tag}`` rule."""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+def _point(s: str) -> int:
+    return int.from_bytes(hashlib.md5(s.encode("utf-8")).digest()[:8], "big")
+
+class HashRing(Generic[N]):
+    """Consistent hash ring; adding or removing a node moves only ~1/N of the keys."""
+
+    def __init__(self, nodes: Sequence[N], names: Sequence[str], vnodes: int = 160):
+        if not nodes or len(nodes) != len(names):
+            raise ValueError("HashRing needs one name per node")
+        points = sorted((_point(f"{name}#{i}"), idx) for idx, name in enumerate(names) for i in range(vnodes))
+        self.nodes = list(nodes)
+        self._points = [p for p, _ in points]
+        self._owners = [idx for _, idx in points]
+
+    def index_for(self, key: str) -> int:
+        i = bisect(self._points, _point(hash_tag(key))) % len(self._points)
+        return self._owners[i]
+
+    def node_for(self, key: str) -> N:
+        return self.nodes[self.index_for(key)]
+
+    def node_for_keys(self, keys: Sequence[str]) -> N:
+        idx = {self.index_for(k) for k in keys}
+        if len(idx) != 1:
+            raise ValueError("multi-key calls need keys on one shard; give them a common {hash tag}")
+        return self.nodes[idx.pop()]
+
+class ShardedRedis:
+    """Client-side sharding over several Redis nodes.
+
+    Implements the subset of ``redis.Redis`` the limiters use: ``evalsha`` and ``zrem`` route by the keys' hash tag and
+    ``script_load`` loads on every node, so a NOSCRIPT from any one node is fixed by the usual reload.
+    """
+
+    def __init__(self, clients: Sequence[redis.Redis], names: Sequence[str] | None = None):
+        names = names or [str(i) for i in range(len(clients))]
+        self.ring: HashRing[redis.Redis] = HashRing(clients, names)
+
+    @property
+    def nodes(self) -> List[redis.Redis]:
+        return self.ring.nodes
+
+    def node_for(self, key: str) -> redis.Redis:
+        return self.ring.node_for(key)
+
+    def keyslot(self, key: str) -> int:
+        """Index of the node holding ``key``; keys with equal slots can share one script call, as on Redis Cluster."""
+        return self.ring.index_for(key)
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args):
+        node = self.ring.node_for_keys(keys_and_args[:numkeys])
+        return node.evalsha(sha, numkeys, *keys_and_args)
+
+    def script_load(self, script: str) -> str:
+        shas = [node.script_load(script) for node in self.nodes]
+        return shas[0]
+
+    def zrem(self, key: str, *members):
+        return self.ring.node_for(key).zrem(key, *members)
+
+class AsyncShardedRedis:
+    """asyncio twin of ShardedRedis."""
+
+    def __init__(self, clients: Sequence[aioredis.Redis], names: Sequence[str] | None = None):
+        names = names or [str(i) for i in range(len(clients))]
+        self.ring: HashRing[aioredis.Redis] = HashRing(clients, names)
+
+    @property
+    def nodes(self) -> List[aioredis.Redis]:
+        return self.ring.nodes
+
+    def node_for(self, key: str) -> aioredis.Redis:
+        return self.ring.node_for(key)
+
+    def keyslot(self, key: str) -> int:
+        """Index of the node holding ``key``; keys with equal slots can share one script call, as on Redis Cluster."""
+        return self.ring.index_for(key)
+
+    async def evalsha(self, sha: str, numkeys: int, *keys_and_args):
+        node = self.ring.node_for_keys(keys_and_args[:numkeys])
+        return await node.evalsha(sha, numkeys, *keys_and_args)
+
+    async def script_load(self, script: str) -> str:
+        shas = await asyncio.gather(*(node.script_load(script) for node in self.nodes))
+        return shas[0]
+
+    async def zrem(self, key: str, *members):
+        return await self.ring.node_for(key).zrem(key, *members)
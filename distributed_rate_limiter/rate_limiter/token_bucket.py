@@ -1,7 +1,12 @@
 from __future__ import annotations
+import asyncio
 from dataclasses import dataclass
+from threading import Lock
 from time import time
+from typing import Dict, List, Optional, Sequence
 import redis
+import redis.asyncio as aioredis
+from rate_limiter.algorithms import ALGORITHMS, encode, wire
 from rate_limiter.config import RateLimitPolicy
 
 @dataclass
@@ -10,42 +15,238 @@ class Decision:
     remaining: float
     retry_after_ms: int
 
-class TokenBucketLimiter:
-    """Redis-backed token bucket limiter using Lua for atomic decisions."""
+@dataclass
+class _Lease:
+    tokens: int
+    expires_ms: int
+    bucket_remaining: float
+    policy: RateLimitPolicy
 
-    def __init__(self, r: redis.Redis, policy: RateLimitPolicy):
-        self.r = r
-        self.policy = policy
-        self._script, self._sha = self._load_script()
+SCRIPTS = ("token_bucket", "token_bucket_multi", "token_lease", "gcra", "sliding_window")
 
-    def _load_script(self):
-        import pkgutil
-        lua = pkgutil.get_data("rate_limiter", "scripts/token_bucket.lua")
-        if lua is None:
-            raise RuntimeError("Lua script not found")
-        script = lua.decode("utf-8")
-        sha = self.r.script_load(script)
-        return script, sha
+def _read_script(name: str) -> str:
+    import pkgutil
+    lua = pkgutil.get_data("rate_limiter", f"scripts/{name}.lua")
+    if lua is None:
+        raise RuntimeError("Lua script not found")
+    return lua.decode("utf-8")
+
+class _BucketBase:
+    # Once this many leases are held, expired ones are handed back before taking another.
+    max_leases = 10_000
+
+    def __init__(self, policy: RateLimitPolicy, redis_clock: bool = False):
+        self.policy = policy
+        self.redis_clock = redis_clock
+        self._scripts = {name: _read_script(name) for name in SCRIPTS}
+        self._shas: dict[str, str] = {}
+        self._leases: Dict[str, _Lease] = {}
+        self._lease_lock = Lock()
 
     def _now_ms(self) -> int:
         return int(time() * 1000)
 
-    def check(self, key: str) -> Decision:
-        args = [
-            str(self._now_ms()),
-            str(self.policy.rate_per_sec),
-            str(self.policy.burst),
-            str(self.policy.cost),
-            str(self.policy.ttl_seconds),
-        ]
-        try:
-            res = self.r.evalsha(self._sha, 1, key, *args)
-        except redis.exceptions.NoScriptError:
-            self._sha = self.r.script_load(self._script)
-            res = self.r.evalsha(self._sha, 1, key, *args)
+    def _now_arg(self, now_ms: Optional[int] = None) -> bytes:
+        if self.redis_clock:
+            return b""
+        return wire(self._now_ms() if now_ms is None else now_ms)
+
+    # ``scale`` multiplies the policy's rate inside the script (adaptive mode); 1.0 sends no extra argument.
+
+    def _args(self, policy: RateLimitPolicy, scale: float = 1.0) -> list:
+        args = [self._now_arg(), *ALGORITHMS[policy.algorithm].encoded(policy)]
+        if scale != 1.0:
+            args.append(wire(scale))
+        return args
+
+    def _multi_args(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                    scales: Optional[Sequence[float]] = None) -> list:
+        if not keys or len(keys) != len(policies) or (scales is not None and len(scales) != len(keys)):
+            raise ValueError("check_many needs one policy per key")
+        if any(p.algorithm != "token_bucket" for p in policies):
+            raise ValueError("check_many only supports token_bucket policies")
+        args = [self._now_arg()]
+        for i, p in enumerate(policies):
+            args += ALGORITHMS["token_bucket"].encoded(p)
+            if scales is not None:
+                args.append(wire(scales[i]))
+        return args
 
+    def _multi_calls(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                     scales: Optional[Sequence[float]] = None) -> List[tuple[List[int], List[str], list]]:
+        """One ``token_bucket_multi`` call per shard (or Cluster slot): (positions, keys, args).
+
+        Unsharded clients get a single call over every key.
+        """
+        args = self._multi_args(keys, policies, scales)
+        keyslot = getattr(self.r, "keyslot", None)
+        groups: Dict[int, List[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(keyslot(key) if keyslot else 0, []).append(i)
+        if len(groups) == 1:
+            return [(list(range(len(keys))), list(keys), args)]
+        return [(group, [keys[i] for i in group],
+                 self._multi_args([keys[i] for i in group], [policies[i] for i in group],
+                                  None if scales is None else [scales[i] for i in group]))
+                for group in groups.values()]
+
+    @classmethod
+    def _merge_decisions(cls, calls: list, results: list) -> List[Decision]:
+        by_position: Dict[int, Decision] = {}
+        for (group, _, _), res in zip(calls, results):
+            by_position.update(zip(group, cls._decisions(res)))
+        return [by_position[i] for i in range(len(by_position))]
+
+    def _lease_args(self, p: RateLimitPolicy, now_ms: int, lease_size: int, returned: int, scale: float = 1.0) -> list:
+        static = encode(p, "token_lease", (p.rate_per_sec, p.burst, p.cost, p.ttl_seconds, p.lease_max_fraction))
+        args = [self._now_arg(now_ms), *static, wire(lease_size), wire(returned)]
+        if scale != 1.0:
+            args.append(wire(scale))
+        return args
+
+    def _lease_spend(self, key: str, now_ms: int, cost: int) -> tuple[Optional[Decision], int]:
+        """Spend from a live local lease, or drop the lease and report how many tokens it still held."""
+        with self._lease_lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                return None, 0
+            if lease.expires_ms > now_ms and lease.tokens >= cost:
+                lease.tokens -= cost
+                # Approximate: the bucket as Redis saw it at lease time plus what is left locally.
+                return Decision(True, lease.bucket_remaining + lease.tokens, 0), 0
+            del self._leases[key]
+            return None, lease.tokens
+
+    def _lease_store(self, key: str, policy: RateLimitPolicy, now_ms: int, res) -> Decision:
+        granted, remaining, retry_after_ms = int(res[0]), float(res[1]), int(res[2])
+        if granted < policy.cost:
+            return Decision(False, remaining, retry_after_ms)
+        left = granted - policy.cost
+        with self._lease_lock:
+            lease = self._leases.get(key)
+            if lease is not None:
+                # Another caller leased concurrently; merge rather than drop its tokens.
+                lease.tokens += left
+                lease.expires_ms = now_ms + policy.lease_ttl_ms
+                lease.bucket_remaining = remaining
+            else:
+                self._leases[key] = _Lease(left, now_ms + policy.lease_ttl_ms, remaining, policy)
+        return Decision(True, remaining + left, 0)
+
+    def _drain_leases(self, expired_only: bool) -> List[tuple[str, _Lease]]:
+        now_ms = self._now_ms()
+        with self._lease_lock:
+            keys = [k for k, l in self._leases.items() if not expired_only or l.expires_ms <= now_ms]
+            return [(k, self._leases.pop(k)) for k in keys]
+
+    @staticmethod
+    def _decision(res) -> Decision:
         return Decision(
             allowed=bool(int(res[0])),
             remaining=float(res[1]),
             retry_after_ms=int(res[2]),
         )
+
+    @classmethod
+    def _decisions(cls, res) -> List[Decision]:
+        return [cls._decision(res[i:i + 3]) for i in range(0, len(res), 3)]
+
+class TokenBucketLimiter(_BucketBase):
+    """Redis-backed limiter using Lua for atomic decisions; the engine follows ``policy.algorithm``.
+
+    With ``redis_clock=True`` the scripts read ``TIME`` on the Redis server instead of trusting the app host's
+    clock, so refill math is immune to skew between pods. Local lease expiry still uses the host clock.
+    """
+
+    def __init__(self, r: redis.Redis, policy: RateLimitPolicy, *, redis_clock: bool = False):
+        super().__init__(policy, redis_clock)
+        self.r = r
+        for name, script in self._scripts.items():
+            self._shas[name] = self.r.script_load(script)
+
+    def _eval(self, name: str, keys: Sequence[str], args: list):
+        try:
+            return self.r.evalsha(self._shas[name], len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            self._shas[name] = self.r.script_load(self._scripts[name])
+            return self.r.evalsha(self._shas[name], len(keys), *keys, *args)
+
+    def check(self, key: str, policy: Optional[RateLimitPolicy] = None, scale: float = 1.0) -> Decision:
+        """Decide for ``key`` under the limiter's policy, or under ``policy`` when given (per-route policies).
+
+        ``scale`` multiplies the refill rate for this decision (adaptive limits).
+        """
+        policy = policy or self.policy
+        if policy.lease_size > 0:
+            return self._check_leased(key, policy, scale)
+        return self._decision(self._eval(ALGORITHMS[policy.algorithm].script, [key], self._args(policy, scale)))
+
+    def _check_leased(self, key: str, policy: RateLimitPolicy, scale: float = 1.0) -> Decision:
+        now_ms = self._now_ms()
+        decision, returned = self._lease_spend(key, now_ms, policy.cost)
+        if decision is not None:
+            return decision
+        if len(self._leases) >= self.max_leases:
+            self.release_leases(expired_only=True)
+        res = self._eval("token_lease", [key], self._lease_args(policy, now_ms, policy.lease_size, returned, scale))
+        return self._lease_store(key, policy, now_ms, res)
+
+    def release_leases(self, expired_only: bool = False) -> None:
+        """Hand unspent leased tokens back to Redis (call on shutdown, or periodically with expired_only)."""
+        for key, lease in self._drain_leases(expired_only):
+            if lease.tokens > 0:
+                self._eval("token_lease", [key], self._lease_args(lease.policy, self._now_ms(), 0, lease.tokens))
+
+    def check_many(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                   scales: Optional[Sequence[float]] = None) -> List[Decision]:
+        """Check several buckets in one round trip; tokens are only taken if every bucket allows.
+
+        Returns one Decision per key; the request is allowed iff all of them are. Leasing does not apply here.
+        On a sharded client or Redis Cluster the keys are checked in one call per shard, so all-or-nothing only
+        holds within a shard: a shard that allows keeps its tokens even when another shard rejects.
+        """
+        calls = self._multi_calls(keys, policies, scales)
+        return self._merge_decisions(calls, [self._eval("token_bucket_multi", sub, args) for _, sub, args in calls])
+
+class AsyncTokenBucketLimiter(_BucketBase):
+    """asyncio twin of TokenBucketLimiter; scripts are loaded on first use."""
+
+    def __init__(self, r: aioredis.Redis, policy: RateLimitPolicy, *, redis_clock: bool = False):
+        super().__init__(policy, redis_clock)
+        self.r = r
+
+    async def _eval(self, name: str, keys: Sequence[str], args: list):
+        if name not in self._shas:
+            self._shas[name] = await self.r.script_load(self._scripts[name])
+        try:
+            return await self.r.evalsha(self._shas[name], len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            self._shas[name] = await self.r.script_load(self._scripts[name])
+            return await self.r.evalsha(self._shas[name], len(keys), *keys, *args)
+
+    async def check(self, key: str, policy: Optional[RateLimitPolicy] = None, scale: float = 1.0) -> Decision:
+        policy = policy or self.policy
+        if policy.lease_size > 0:
+            return await self._check_leased(key, policy, scale)
+        return self._decision(await self._eval(ALGORITHMS[policy.algorithm].script, [key], self._args(policy, scale)))
+
+    async def _check_leased(self, key: str, policy: RateLimitPolicy, scale: float = 1.0) -> Decision:
+        now_ms = self._now_ms()
+        decision, returned = self._lease_spend(key, now_ms, policy.cost)
+        if decision is not None:
+            return decision
+        if len(self._leases) >= self.max_leases:
+            await self.release_leases(expired_only=True)
+        res = await self._eval("token_lease", [key], self._lease_args(policy, now_ms, policy.lease_size, returned, scale))
+        return self._lease_store(key, policy, now_ms, res)
+
+    async def release_leases(self, expired_only: bool = False) -> None:
+        for key, lease in self._drain_leases(expired_only):
+            if lease.tokens > 0:
+                await self._eval("token_lease", [key], self._lease_args(lease.policy, self._now_ms(), 0, lease.tokens))
+
+    async def check_many(self, keys: Sequence[str], policies: Sequence[RateLimitPolicy],
+                         scales: Optional[Sequence[float]] = None) -> List[Decision]:
+        calls = self._multi_calls(keys, policies, scales)
+        results = await asyncio.gather(*(self._eval("token_bucket_multi", sub, args) for _, sub, args in calls))
+        return self._merge_decisions(calls, list(results))
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+import redis
+import redis.asyncio as aioredis
+from rate_limiter.adaptive import AdaptiveRate
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+@pytest.mark.asyncio
+async def test_aimd_multiplier_is_shared_and_moves_once_per_interval():
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    await r.delete("test:aimd:api")
+    workers = [AdaptiveRate(r, target_p99_ms=50, interval_s=0.2, min_samples=5, prefix="test:aimd") for _ in range(3)]
+
+    for w in workers:
+        for _ in range(10):
+            w.observe("api", 0.2, error=False)  # p99 200 ms > 50 ms target
+        await w.adjust()
+    assert [w.multiplier("api") for w in workers] == [0.7, 0.7, 0.7]
+
+    await asyncio.sleep(0.2)
+    for _ in range(10):
+        workers[0].observe("api", 0.01, error=True)  # fast but failing
+    await workers[0].adjust()
+    await workers[1].adjust()  # no samples: only reads the shared value
+    assert workers[1].multiplier("api") == pytest.approx(0.49)
+
+    await asyncio.sleep(0.2)
+    for _ in range(10):
+        workers[2].observe("api", 0.01, error=False)
+    await workers[2].adjust()
+    assert workers[2].multiplier("api") == pytest.approx(0.54)
+    await r.aclose()
+
+@pytest.mark.asyncio
+async def test_new_dimension_observed_while_adjusting():
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    await r.delete("test:aimd2:a", "test:aimd2:b", "test:aimd2:new")
+    w = AdaptiveRate(r, target_p99_ms=50, interval_s=0.2, min_samples=5, prefix="test:aimd2")
+    for dimension in ("a", "b"):
+        for _ in range(10):
+            w.observe(dimension, 0.2, error=False)
+
+    real_eval = w._eval
+    async def eval_with_traffic(key, args):
+        w.observe("new", 0.01, error=False)  # a request for a new policy lands mid-adjust
+        return await real_eval(key, args)
+    w._eval = eval_with_traffic
+
+    await w.adjust()
+    assert w.multiplier("a") == w.multiplier("b") == 0.7
+    assert len(w._samples["new"]) == 2 and w.multiplier("new") == 1.0
+    await r.aclose()
+
+@pytest.mark.parametrize("algorithm", ["token_bucket", "gcra", "sliding_window"])
+def test_scale_slows_refill_inside_script(algorithm):
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=10, burst=10, ttl_seconds=60, prefix="test:scale", algorithm=algorithm)
+    limiter = TokenBucketLimiter(r, policy)
+    key = f"test:scale:{algorithm}"
+    r.delete(key)
+
+    allowed = sum(limiter.check(key, scale=0.5).allowed for _ in range(20))
+    assert allowed == (5 if algorithm == "sliding_window" else 10)
+    if algorithm != "sliding_window":  # its retry-after depends on where the window boundary falls
+        d = limiter.check(key, scale=0.5)
+        assert not d.allowed and d.retry_after_ms > 150  # 1 token takes 200 ms at half rate
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+import redis.asyncio as aioredis
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import AsyncTokenBucketLimiter
+
+@pytest.mark.asyncio
+async def test_async_token_bucket_burst_and_refill():
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=5.0, burst=5, ttl_seconds=60, cost=1, prefix="test:atb")
+    limiter = AsyncTokenBucketLimiter(r, policy)
+
+    key = "test:atb:apikey:demo"
+    await r.delete(key)
+
+    decisions = await asyncio.gather(*[limiter.check(key) for _ in range(7)])
+    assert sum(1 for d in decisions if d.allowed) == 5
+
+    await asyncio.sleep(0.25)
+    d2 = await limiter.check(key)
+    assert d2.allowed is True
+    await r.aclose()
+
+@pytest.mark.asyncio
+async def test_async_token_bucket_reloads_after_script_flush():
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=5.0, burst=5, ttl_seconds=60, cost=1, prefix="test:atb")
+    limiter = AsyncTokenBucketLimiter(r, policy)
+
+    key = "test:atb:apikey:flush"
+    await r.delete(key)
+    assert (await limiter.check(key)).allowed
+
+    await r.script_flush()
+    d = await limiter.check(key)
+    assert d.allowed is True
+    assert d.remaining == pytest.approx(3.0, abs=0.1)
+    await r.aclose()
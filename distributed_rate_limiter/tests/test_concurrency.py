@@ -0,0 +1,37 @@
+import asyncio
+import time
+import pytest
+import redis
+import redis.asyncio as aioredis
+from rate_limiter.concurrency import AsyncConcurrencyLimiter, ConcurrencyLimiter
+from rate_limiter.config import ConcurrencyPolicy
+
+def test_slots_are_acquired_released_and_expire():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    limiter = ConcurrencyLimiter(r, ConcurrencyPolicy(max_in_flight=2, lease_ttl_ms=200, retry_after_ms=5000))
+    key = "test:cc:apikey:demo"
+    r.delete(key)
+
+    a, b, c = (limiter.acquire(key, t) for t in ("a", "b", "c"))
+    assert (a.allowed, a.remaining) == (True, 1.0)
+    assert b.allowed and not c.allowed
+    assert 0 < c.retry_after_ms <= 200
+
+    limiter.release(key, "a")
+    assert limiter.acquire(key, "d").allowed
+
+    # "b" and "d" are never released, as if their worker crashed; their leases lapse.
+    time.sleep(0.25)
+    assert limiter.acquire(key, "e").remaining == 1.0
+
+@pytest.mark.asyncio
+async def test_async_slots_under_concurrent_acquire():
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    limiter = AsyncConcurrencyLimiter(r, ConcurrencyPolicy(max_in_flight=3), redis_clock=True)
+    key = "test:cc:apikey:async"
+    await r.delete(key)
+
+    decisions = await asyncio.gather(*[limiter.acquire(key, f"t{i}") for i in range(10)])
+    assert sum(d.allowed for d in decisions) == 3
+    assert all(d.retry_after_ms == 1000 for d in decisions if not d.allowed)
+    await r.aclose()
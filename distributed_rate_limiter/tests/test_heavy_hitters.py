@@ -0,0 +1,38 @@
+import random
+from rate_limiter.heavy_hitters import HeavyHitters, SpaceSaving
+from rate_limiter.metrics import rl_heavy_hitter_rate
+
+def test_space_saving_finds_heavy_keys_in_fixed_memory():
+    s = SpaceSaving(capacity=100)
+    rnd = random.Random(7)
+    for i in range(100_000):
+        if i % 10 == 0:
+            s.add("abuser")
+        elif i % 25 == 0:
+            s.add("busy")
+        else:
+            s.add(f"cold:{rnd.randrange(1_000_000)}")
+    assert len(s) == 100
+    top = s.top(2)
+    assert [k for k, _, _ in top] == ["abuser", "busy"]
+    for key, count, error in top:
+        true = 10_000 if key == "abuser" else 2_000
+        assert count - error <= true <= count
+
+def test_heavy_hitters_ranks_blocked_and_publishes_bounded_gauge():
+    hh = HeavyHitters(capacity=20, gauge_k=3, publish_interval_s=3600)
+    for _ in range(30):
+        hh.record("rl:tb:apikey:a", blocked=False)
+    for _ in range(10):
+        hh.record("rl:tb:ip:1.2.3.4", blocked=True)
+    for i in range(100):
+        hh.record(f"rl:tb:ip:10.0.0.{i}", blocked=False)
+
+    snap = hh.snapshot(2)
+    assert snap["requests"][0]["key"] == "rl:tb:apikey:a"
+    assert [r["key"] for r in snap["blocked"]] == ["rl:tb:ip:1.2.3.4"]
+
+    hh.publish()
+    series = [s for m in rl_heavy_hitter_rate.collect() for s in m.samples]
+    assert len(series) == 3 + 1
+    assert {s.labels["kind"] for s in series} == {"requests", "blocked"}
@@ -1,7 +1,14 @@
-from rate_limiter.keys import key_for_api_key, key_for_user, key_for_ip, pick_identity_key
+from rate_limiter.keys import key_for_api_key, key_for_user, key_for_ip, pick_identity_key, key_for_dimension
 
 def test_key_builders():
     assert key_for_api_key("abc", "p") == "p:apikey:abc"
     assert key_for_user("u1", "p") == "p:user:u1"
     assert key_for_ip("1.2.3.4", "p") == "p:ip:1.2.3.4"
     assert pick_identity_key("p", api_key="k", user_id="u", ip="1.1.1.1") == "p:apikey:k"
+    assert pick_identity_key("p", api_key=None, user_id="u", ip="1.1.1.1", tagged=True) == "p:{user:u}"
+
+def test_key_for_dimension():
+    assert key_for_dimension("identity", "p", api_key=None, user_id="u", ip="1.1.1.1") == "p:user:u"
+    assert key_for_dimension("apikey", "p", api_key=None, user_id="u", ip="1.1.1.1") is None
+    assert key_for_dimension("ip", "p", api_key="k", user_id=None, ip="::1") == "p:ip:__1"
+    assert key_for_dimension("global", "p", api_key=None, user_id=None, ip="1.1.1.1") == "p:global"
@@ -0,0 +1,51 @@
+import time
+import pytest
+import redis
+from rate_limiter.algorithms import ALGORITHMS, Algorithm
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+@pytest.mark.parametrize("redis_clock", [False, True])
+@pytest.mark.parametrize("algorithm", ["token_bucket", "gcra", "sliding_window"])
+def test_algorithm_burst_then_block(algorithm, redis_clock):
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=5.0, burst=5, ttl_seconds=60, cost=1, prefix="test:alg", algorithm=algorithm)
+    limiter = TokenBucketLimiter(r, policy, redis_clock=redis_clock)
+
+    key = f"test:alg:{algorithm}:{redis_clock}"
+    r.delete(key)
+
+    decisions = [limiter.check(key) for _ in range(7)]
+    assert [d.allowed for d in decisions] == [True] * 5 + [False] * 2
+    assert decisions[0].remaining == 4
+    assert all(d.retry_after_ms > 0 for d in decisions[5:])
+
+def test_gcra_keeps_one_expiring_integer_per_key():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=5.0, burst=5, prefix="test:alg", algorithm="gcra")
+    limiter = TokenBucketLimiter(r, policy)
+
+    key = "test:alg:gcra:tat"
+    r.delete(key)
+    limiter.check(key)
+    limiter.check(key)
+
+    assert r.type(key) == b"string"
+    assert int(r.get(key)) > 0
+    assert 0 < r.pttl(key) <= 400
+
+    time.sleep(0.25)
+    assert limiter.check(key).allowed
+
+def test_policy_arguments_are_encoded_once():
+    policy = RateLimitPolicy(rate_per_sec=5.0, burst=10, ttl_seconds=60, cost=1)
+    enc = ALGORITHMS["token_bucket"].encoded(policy)
+    assert enc == (b"5", b"10", b"1", b"60")
+    assert ALGORITHMS["token_bucket"].encoded(policy) is enc
+
+def test_algorithm_without_params_cannot_be_built():
+    class Incomplete(Algorithm):
+        name = script = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,32 @@
+import redis
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+def test_check_many_is_all_or_nothing():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    wide = RateLimitPolicy(rate_per_sec=0.1, burst=5, ttl_seconds=60, cost=1, prefix="test:tbm")
+    narrow = RateLimitPolicy(rate_per_sec=0.1, burst=2, ttl_seconds=60, cost=1, prefix="test:tbm")
+    limiter = TokenBucketLimiter(r, wide)
+
+    keys = ["test:tbm:apikey:demo", "test:tbm:global"]
+    r.delete(*keys)
+
+    results = [limiter.check_many(keys, [wide, narrow]) for _ in range(3)]
+    assert [all(d.allowed for d in ds) for ds in results] == [True, True, False]
+
+    last = results[-1]
+    assert last[0].allowed is True and last[1].allowed is False
+    assert last[1].retry_after_ms > 0
+    # The blocked attempt must not have spent tokens from the wide bucket.
+    assert int(float(r.hget(keys[0], "tokens"))) == 3
+
+def test_check_many_applies_per_bucket_scales():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    fast = RateLimitPolicy(rate_per_sec=10, burst=1, ttl_seconds=60, prefix="test:tbm")
+    keys = ["test:tbm:{s}:a", "test:tbm:{s}:b"]
+    r.delete(*keys)
+    limiter = TokenBucketLimiter(r, fast)
+
+    assert all(d.allowed for d in limiter.check_many(keys, [fast, fast], scales=[1.0, 0.25]))
+    retry = [d.retry_after_ms for d in limiter.check_many(keys, [fast, fast], scales=[1.0, 0.25])]
+    assert 90 <= retry[0] <= 100 and 390 <= retry[1] <= 400
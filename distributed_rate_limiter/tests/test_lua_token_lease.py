@@ -0,0 +1,35 @@
+import redis
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+def test_leased_checks_spend_locally_and_return_unused_tokens():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=0.001, burst=100, ttl_seconds=60, cost=1, prefix="test:tl",
+                             lease_size=10, lease_ttl_ms=60_000, lease_max_fraction=0.5)
+    limiter = TokenBucketLimiter(r, policy)
+
+    key = "test:tl:apikey:hot"
+    r.delete(key)
+    tokens = lambda: int(float(r.hget(key, "tokens")))
+
+    for _ in range(10):
+        assert limiter.check(key).allowed
+    assert tokens() == 90  # one lease of 10 served all ten requests
+
+    assert limiter.check(key).allowed
+    assert tokens() == 80
+
+    limiter.release_leases()
+    assert tokens() == 89
+
+def test_lease_shrinks_as_bucket_drains():
+    r = redis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    policy = RateLimitPolicy(rate_per_sec=0.001, burst=4, ttl_seconds=60, cost=1, prefix="test:tl",
+                             lease_size=10, lease_ttl_ms=60_000, lease_max_fraction=0.5)
+    limiter = TokenBucketLimiter(r, policy)
+
+    key = "test:tl:apikey:small"
+    r.delete(key)
+
+    results = [limiter.check(key).allowed for _ in range(5)]
+    assert results == [True, True, True, True, False]
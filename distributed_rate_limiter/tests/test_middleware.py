@@ -0,0 +1,188 @@
+import asyncio
+import httpx
+import redis.asyncio as aioredis
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from rate_limiter.adaptive import AdaptiveRate
+from rate_limiter.blocked_cache import BlockedCache
+from rate_limiter.heavy_hitters import HeavyHitters
+from rate_limiter.config import ConcurrencyPolicy, RateLimitPolicy
+from rate_limiter.middleware import RateLimitMiddleware
+from rate_limiter.registry import PolicyRegistry, PolicyRule
+from rate_limiter.token_bucket import Decision
+
+class FakeLimiter:
+    """Allows the first `allow` calls, then blocks with a fixed retry-after."""
+
+    def __init__(self, allow: int, retry_after_ms: int = 5000):
+        self.allow = allow
+        self.retry_after_ms = retry_after_ms
+        self.calls = 0
+
+    async def check(self, key: str, policy=None) -> Decision:
+        self.calls += 1
+        if self.calls <= self.allow:
+            return Decision(True, float(self.allow - self.calls), 0)
+        return Decision(False, 0.0, self.retry_after_ms)
+
+def _app(limiter, **kwargs) -> FastAPI:
+    app = FastAPI()
+    policy = RateLimitPolicy(rate_per_sec=1, burst=2)
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, policy=policy, **kwargs)
+
+    @app.get("/x")
+    def x():
+        return {"ok": True}
+
+    return app
+
+@pytest.mark.asyncio
+async def test_block_cache_rejects_locally_until_retry_after():
+    limiter = FakeLimiter(allow=2)
+    app = _app(limiter, block_cache=BlockedCache(max_size=10))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        codes = [(await c.get("/x", headers={"x-api-key": "abuser"})).status_code for _ in range(10)]
+        other = await c.get("/x", headers={"x-api-key": "someone-else"})
+
+    assert codes == [200, 200] + [429] * 8
+    assert limiter.calls == 4  # abuser: 2 allowed + 1 blocked, then local rejections; other key: 1
+    assert other.status_code == 429
+
+@pytest.mark.asyncio
+async def test_locally_rejected_response_keeps_retry_after():
+    app = _app(FakeLimiter(allow=0, retry_after_ms=2500), block_cache=BlockedCache())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        first = await c.get("/x", headers={"x-api-key": "k"})
+        second = await c.get("/x", headers={"x-api-key": "k"})
+    assert first.headers["retry-after"] == second.headers["retry-after"] == "3"
+
+def test_blocked_cache_evicts_least_recent_when_full():
+    cache = BlockedCache(max_size=2)
+    cache.block("a", 10_000)
+    cache.block("b", 10_000)
+    cache.block("c", 10_000)
+    assert len(cache) == 2
+    assert cache.blocked_for_ms("a") == 0
+    assert cache.blocked_for_ms("c") > 9_000
+
+@pytest.mark.asyncio
+async def test_registry_selects_policy_per_route():
+    seen = []
+
+    class RecordingLimiter(FakeLimiter):
+        async def check(self, key, policy=None):
+            seen.append((key, policy.burst))
+            return await super().check(key, policy)
+
+    app = FastAPI()
+    registry = PolicyRegistry([
+        PolicyRule("default", RateLimitPolicy(rate_per_sec=1, burst=2)),
+        PolicyRule("x", RateLimitPolicy(rate_per_sec=1, burst=7, prefix="rl"), path_prefix="/x"),
+    ])
+    app.add_middleware(RateLimitMiddleware, limiter=RecordingLimiter(allow=10), registry=registry)
+
+    @app.get("/x")
+    def x():
+        return {"ok": True}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        r = await c.get("/x", headers={"x-api-key": "k"})
+    assert r.status_code == 200
+    assert seen == [("rl:x:apikey:k", 7)]
+
+@pytest.mark.asyncio
+async def test_streaming_response_passes_through_with_limit_headers():
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=FakeLimiter(allow=5), policy=RateLimitPolicy(rate_per_sec=1, burst=5))
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        r = await c.get("/stream", headers={"x-api-key": "k"})
+    assert r.status_code == 200
+    assert r.content == b"abc"
+    assert r.headers["x-ratelimit-limit"] == "5"
+    assert r.headers["x-ratelimit-remaining"] == "4"
+
+@pytest.mark.asyncio
+async def test_heavy_hitters_count_identity_keys():
+    hh = HeavyHitters(capacity=10)
+    app = _app(FakeLimiter(allow=3), heavy_hitters=hh)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        for _ in range(5):
+            await c.get("/x", headers={"x-api-key": "noisy"})
+        await c.get("/x", headers={"x-api-key": "quiet"})
+    top = hh.snapshot(2)
+    assert [(r["key"], r["count"]) for r in top["requests"]] == [("rl:tb:apikey:noisy", 5), ("rl:tb:apikey:quiet", 1)]
+    assert top["blocked"][0]["key"] == "rl:tb:apikey:noisy"
+
+class FakeSlots:
+    def __init__(self, max_in_flight: int):
+        self.policy = ConcurrencyPolicy(max_in_flight=max_in_flight)
+        self.held = set()
+        self.peak = 0
+
+    async def acquire(self, key, token, policy=None) -> Decision:
+        if len(self.held) >= self.policy.max_in_flight:
+            return Decision(False, 0.0, 700)
+        self.held.add(token)
+        self.peak = max(self.peak, len(self.held))
+        return Decision(True, float(self.policy.max_in_flight - len(self.held)), 0)
+
+    async def release(self, key, token) -> None:
+        self.held.discard(token)
+
+@pytest.mark.asyncio
+async def test_concurrency_mode_caps_in_flight_and_releases_slots():
+    slots = FakeSlots(max_in_flight=2)
+    gate = asyncio.Event()
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=FakeLimiter(allow=100), policy=RateLimitPolicy(rate_per_sec=1, burst=2),
+                       concurrency=slots, concurrency_paths=["/slow"])
+
+    @app.get("/slow")
+    async def slow():
+        await gate.wait()
+        return {"ok": True}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        running = [asyncio.create_task(c.get("/slow")) for _ in range(2)]
+        while len(slots.held) < 2:
+            await asyncio.sleep(0.01)
+        rejected = await c.get("/slow")
+        gate.set()
+        done = await asyncio.gather(*running)
+
+    assert [r.status_code for r in done] == [200, 200]
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "1"
+    assert slots.peak == 2 and not slots.held
+
+@pytest.mark.asyncio
+async def test_adaptive_mode_scales_rate_after_slow_responses():
+    class ScaleRecorder(FakeLimiter):
+        scales = []
+
+        async def check(self, key, policy=None, scale=1.0):
+            self.scales.append(scale)
+            return await super().check(key, policy)
+
+    r = aioredis.Redis.from_url("redis://localhost:6379/0", decode_responses=False)
+    await r.delete("test:aimd:default")
+    adaptive = AdaptiveRate(r, target_p99_ms=10, interval_s=0.0, min_samples=1, prefix="test:aimd")
+    limiter = ScaleRecorder(allow=10)
+    app = _app(limiter, adaptive=adaptive)
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.03)
+        return {"ok": True}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        await c.get("/slow")
+        await c.get("/x")
+    assert limiter.scales == [1.0, 0.7]
+    await r.aclose()
@@ -0,0 +1,49 @@
+import pytest
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.registry import PolicyRegistry, PolicyRule
+
+P = RateLimitPolicy(rate_per_sec=1, burst=1)
+
+def _registry(**kwargs) -> PolicyRegistry:
+    return PolicyRegistry([
+        PolicyRule("default", P),
+        PolicyRule("search", P, path_prefix="/v1/search"),
+        PolicyRule("search-write", P, path_prefix="/v1/search", methods=["post"]),
+        PolicyRule("search-pro", P, path_prefix="/v1/search", tier="pro"),
+        PolicyRule("internal", None, path_prefix="/internal"),
+    ], **kwargs)
+
+def test_longest_prefix_then_method_then_tier():
+    reg = _registry()
+    assert reg.match("GET", "/v1/hello").name == "default"
+    assert reg.match("GET", "/v1/search").name == "search"
+    assert reg.match("GET", "/v1/search/items/42").name == "search"
+    assert reg.match("GET", "/v1/searchable").name == "default"
+    assert reg.match("POST", "/v1/search").name == "search-write"
+    assert reg.match("GET", "/v1/search", tier="pro").name == "search-pro"
+    assert reg.match("GET", "/internal/x").policy is None
+
+def test_overlapping_rules_are_rejected():
+    with pytest.raises(ValueError):
+        PolicyRegistry([PolicyRule("a", P, path_prefix="/x"), PolicyRule("b", P, path_prefix="/x/")])
+
+def test_many_rules():
+    reg = PolicyRegistry([PolicyRule(f"r{i}", P, path_prefix=f"/v1/r{i}") for i in range(5000)])
+    assert reg.match("GET", "/v1/r4999/items").name == "r4999"
+    assert reg.match("GET", "/v2/r1") is None
+
+@pytest.mark.asyncio
+async def test_tier_lookup_is_cached():
+    calls = []
+
+    async def lookup(api_key):
+        calls.append(api_key)
+        return "pro" if api_key == "k1" else None
+
+    reg = _registry(tier_header="x-tier", tier_lookup=lookup)
+    assert await reg.tier_for("k1") == "pro"
+    assert await reg.tier_for("k1") == "pro"
+    assert await reg.tier_for("k2") is None
+    assert await reg.tier_for("k2") is None
+    assert await reg.tier_for("k2", "enterprise") == "enterprise"
+    assert calls == ["k1", "k2"]
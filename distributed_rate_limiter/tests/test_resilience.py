@@ -0,0 +1,79 @@
+import asyncio, time
+from time import perf_counter
+import pytest
+import redis.asyncio as aioredis
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResilientLimiter
+from rate_limiter.token_bucket import AsyncTokenBucketLimiter, Decision
+
+POLICY = RateLimitPolicy(rate_per_sec=1.0, burst=4)
+
+class SlowLimiter:
+    policy = POLICY
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+
+    async def check(self, key: str, policy=None) -> Decision:
+        await asyncio.sleep(self.delay_s)
+        return Decision(True, 1.0, 0)
+
+def test_breaker_opens_then_half_opens_then_closes():
+    b = CircuitBreaker(failure_threshold=2, reset_timeout_s=0.05)
+    b.record_failure()
+    assert b.state == CLOSED
+    b.record_failure()
+    assert b.state == OPEN and not b.allow_request()
+
+    time.sleep(0.06)
+    assert b.allow_request() and b.state == HALF_OPEN
+    assert not b.allow_request()  # one trial at a time
+    b.record_success()
+    assert b.state == CLOSED
+
+@pytest.mark.asyncio
+async def test_deadline_caps_latency_and_falls_back_locally():
+    limiter = ResilientLimiter(SlowLimiter(1.0), decision_timeout_ms=20, expected_workers=2,
+                               breaker=CircuitBreaker(failure_threshold=1, reset_timeout_s=60))
+    t0 = perf_counter()
+    decisions = [await limiter.check("k") for _ in range(4)]
+    assert perf_counter() - t0 < 0.5
+    assert limiter.breaker.state == OPEN
+    # burst 4 split across 2 workers: 2 local tokens
+    assert [d.allowed for d in decisions] == [True, True, False, False]
+
+class BrokenLimiter:
+    policy = POLICY
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+    async def check(self, key: str, policy=None) -> Decision:
+        raise self.exc
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("exc", [ValueError("bad reply"), asyncio.CancelledError()])
+async def test_unexpected_errors_count_as_failures_and_free_the_trial(exc):
+    limiter = ResilientLimiter(BrokenLimiter(exc), breaker=CircuitBreaker(failure_threshold=1, reset_timeout_s=0.01))
+    with pytest.raises(type(exc)):
+        await limiter.check("k")
+    assert limiter.breaker.state == OPEN
+
+    await asyncio.sleep(0.02)
+    with pytest.raises(type(exc)):
+        await limiter.check("k")  # the half-open trial
+    assert limiter.breaker.state == OPEN and not limiter.breaker._trial_in_flight
+
+    await asyncio.sleep(0.02)
+    limiter.limiter = SlowLimiter(0)
+    assert (await limiter.check("k")).allowed
+    assert limiter.breaker.state == CLOSED
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode,allowed", [("open", True), ("closed", False)])
+async def test_fail_open_and_fail_closed_when_redis_is_down(mode, allowed):
+    dead = aioredis.Redis(port=1, socket_connect_timeout=0.1)
+    limiter = ResilientLimiter(AsyncTokenBucketLimiter(dead, POLICY), decision_timeout_ms=200, failure_mode=mode)
+    d = await limiter.check("k")
+    assert d.allowed is allowed
+    assert limiter.breaker._failures == 1
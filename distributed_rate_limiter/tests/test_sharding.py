@@ -0,0 +1,119 @@
+import asyncio, shutil, socket, subprocess, time
+import pytest
+import redis
+import redis.asyncio as aioredis
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.keys import key_for_api_key, key_for_global
+from rate_limiter.sharding import AsyncShardedRedis, HashRing, ShardedRedis, hash_tag
+from rate_limiter.token_bucket import AsyncTokenBucketLimiter, TokenBucketLimiter
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def nodes():
+    if not shutil.which("redis-server"):
+        pytest.skip("redis-server not installed")
+    ports = [_free_port() for _ in range(3)]
+    procs = [subprocess.Popen(["redis-server", "--port", str(p), "--save", "", "--appendonly", "no"],
+                              stdout=subprocess.DEVNULL) for p in ports]
+    clients = [redis.Redis(port=p) for p in ports]
+    for c in clients:
+        for _ in range(50):
+            try:
+                c.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+    yield clients
+    for p in procs:
+        p.terminate()
+        p.wait()
+
+def test_hash_tag():
+    assert hash_tag("rl:{apikey:k}:x") == "apikey:k"
+    assert hash_tag("rl:{}:x") == "rl:{}:x"
+    assert hash_tag("rl:ip:1.2.3.4") == "rl:ip:1.2.3.4"
+
+def test_ring_spreads_keys_and_moves_few_on_growth():
+    ring3 = HashRing(["a", "b", "c"], ["a", "b", "c"])
+    ring4 = HashRing(["a", "b", "c", "d"], ["a", "b", "c", "d"])
+    keys = [f"rl:ip:{i}" for i in range(20_000)]
+    counts = {n: 0 for n in "abc"}
+    for k in keys:
+        counts[ring3.node_for(k)] += 1
+    assert min(counts.values()) > 20_000 / 3 * 0.8
+    moved = sum(1 for k in keys if ring3.node_for(k) != ring4.node_for(k))
+    assert moved < 20_000 * 0.35
+
+def test_sharded_limiter_routes_and_reloads_scripts_per_node(nodes):
+    backend = ShardedRedis(nodes)
+    policy = RateLimitPolicy(rate_per_sec=0.1, burst=3, ttl_seconds=60, prefix="test:sh")
+    limiter = TokenBucketLimiter(backend, policy)
+
+    keys = [key_for_api_key(f"k{i}", policy.prefix, tagged=True) for i in range(30)]
+    for n in nodes:
+        n.flushdb()
+    for k in keys:
+        assert limiter.check(k).allowed
+    assert all(n.dbsize() > 0 for n in nodes)
+    for k in keys:
+        assert backend.node_for(k).exists(k)
+
+    for n in nodes:
+        n.script_flush()
+    assert all(limiter.check(k).allowed for k in keys)
+
+def test_sharded_check_many_keeps_an_identity_on_one_shard(nodes):
+    backend = ShardedRedis(nodes)
+    per_sec = RateLimitPolicy(rate_per_sec=0.1, burst=2, ttl_seconds=60, prefix="test:sh:sec")
+    per_day = RateLimitPolicy(rate_per_sec=0.1, burst=5, ttl_seconds=60, prefix="test:sh:day")
+    limiter = TokenBucketLimiter(backend, per_sec)
+
+    same_identity = [key_for_api_key("k", p.prefix, tagged=True) for p in (per_sec, per_day)]
+    assert all(d.allowed for d in limiter.check_many(same_identity, [per_sec, per_day]))
+    assert backend.node_for(same_identity[0]).exists(*same_identity) == 2
+
+def _identity_off_global_shard(backend, prefix: str) -> tuple[str, str]:
+    global_key = key_for_global(prefix, tagged=True)
+    api_key = next(f"k{i}" for i in range(1000)
+                   if backend.keyslot(key_for_api_key(f"k{i}", prefix, tagged=True)) != backend.keyslot(global_key))
+    return key_for_api_key(api_key, prefix, tagged=True), global_key
+
+def test_sharded_check_many_splits_dimensions_across_shards(nodes):
+    backend = ShardedRedis(nodes)
+    identity = RateLimitPolicy(rate_per_sec=0.1, burst=5, ttl_seconds=60, prefix="test:sh:dim")
+    global_policy = RateLimitPolicy(rate_per_sec=0.1, burst=1, ttl_seconds=60, prefix="test:sh:dim")
+    limiter = TokenBucketLimiter(backend, identity)
+    keys = _identity_off_global_shard(backend, identity.prefix)
+
+    first = limiter.check_many(keys, [identity, global_policy])
+    assert [d.allowed for d in first] == [True, True]
+    assert backend.node_for(keys[0]).exists(keys[0]) and backend.node_for(keys[1]).exists(keys[1])
+
+    # One call per shard: the identity shard still spends its token when the global shard rejects.
+    second = limiter.check_many(keys, [identity, global_policy])
+    assert [d.allowed for d in second] == [True, False]
+    assert second[0].remaining == pytest.approx(3, abs=0.1)
+
+def test_async_sharded_check_many_splits_dimensions_across_shards(nodes):
+    async def run():
+        clients = [aioredis.Redis(**n.connection_pool.connection_kwargs) for n in nodes]
+        backend = AsyncShardedRedis(clients)
+        identity = RateLimitPolicy(rate_per_sec=0.1, burst=5, ttl_seconds=60, prefix="test:sh:adim")
+        global_policy = RateLimitPolicy(rate_per_sec=0.1, burst=1, ttl_seconds=60, prefix="test:sh:adim")
+        limiter = AsyncTokenBucketLimiter(backend, identity)
+        keys = _identity_off_global_shard(backend, identity.prefix)
+        try:
+            first = await limiter.check_many(keys, [identity, global_policy])
+            second = await limiter.check_many(keys, [identity, global_policy])
+        finally:
+            for c in clients:
+                await c.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [d.allowed for d in first] == [True, True]
+    assert [d.allowed for d in second] == [True, False]
@@ -0,0 +1,58 @@
+from __future__ import annotations
+import argparse, json, time
+import redis
+
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+ALGORITHMS = ["token_bucket", "gcra", "sliding_window"]
+
+def _commands(r: redis.Redis) -> int:
+    stats = r.info("commandstats")
+    return sum(v["calls"] for k, v in stats.items() if not k.startswith(("cmdstat_info", "cmdstat_evalsha", "cmdstat_script")))
+
+def bench(r: redis.Redis, algorithm: str, keys: int, batch: int, rate: float) -> dict:
+    # A slow rate keeps GCRA / sliding-window keys alive for the whole run, so live keys are what gets measured.
+    policy = RateLimitPolicy(rate_per_sec=rate, burst=10, ttl_seconds=3600, cost=1, prefix="bench", algorithm=algorithm)
+    limiter = TokenBucketLimiter(r, policy)
+    sha = limiter._shas[algorithm]
+
+    r.flushdb()
+    r.config_resetstat()
+    mem_before = r.info("memory")["used_memory"]
+    cmds_before = _commands(r)
+
+    t0 = time.perf_counter()
+    for start in range(0, keys, batch):
+        pipe = r.pipeline(transaction=False)
+        for i in range(start, min(start + batch, keys)):
+            pipe.evalsha(sha, 1, f"bench:ip:{i}", *limiter._args(policy))
+        pipe.execute()
+    elapsed = time.perf_counter() - t0
+
+    mem_after = r.info("memory")["used_memory"]
+    return {
+        "algorithm": algorithm,
+        "keys": keys,
+        "bytes_per_key": round((mem_after - mem_before) / keys, 1),
+        "mb_per_million_keys": round((mem_after - mem_before) / keys * 1_000_000 / 2**20, 1),
+        "redis_commands_per_decision": round((_commands(r) - cmds_before) / keys, 2),
+        "decisions_per_sec": round(keys / elapsed),
+    }
+
+def main():
+    p = argparse.ArgumentParser(description="Per-key Redis memory and commands for each limiter algorithm")
+    p.add_argument("--redis-url", default="redis://localhost:6379/15", help="a scratch DB; it is flushed")
+    p.add_argument("--keys", type=int, default=200_000)
+    p.add_argument("--batch", type=int, default=1000)
+    p.add_argument("--rate", type=float, default=0.01)
+    p.add_argument("--algorithms", nargs="+", default=ALGORITHMS, choices=ALGORITHMS)
+    args = p.parse_args()
+
+    r = redis.Redis.from_url(args.redis_url, decode_responses=False)
+    results = [bench(r, a, args.keys, args.batch, args.rate) for a in args.algorithms]
+    r.flushdb()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+import argparse, json, random, shutil, socket, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import redis
+
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.token_bucket import TokenBucketLimiter
+
+# name -> (policy overrides, limiter kwargs)
+VARIANTS = {
+    "token_bucket": ({}, {}),
+    "token_bucket_redis_clock": ({}, {"redis_clock": True}),
+    "token_lease": ({"lease_size": 10}, {}),
+    "gcra": ({"algorithm": "gcra"}, {}),
+    "sliding_window": ({"algorithm": "sliding_window"}, {}),
+}
+ADMIN = ("cmdstat_info", "cmdstat_config", "cmdstat_flushdb", "cmdstat_dbsize", "cmdstat_script", "cmdstat_ping")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def local_redis() -> Iterator[str]:
+    """A throwaway redis-server on a free port, without persistence."""
+    if not shutil.which("redis-server"):
+        sys.exit("redis-server not found on PATH (or pass --redis-url)")
+    port = _free_port()
+    proc = subprocess.Popen(["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+                            stdout=subprocess.DEVNULL)
+    try:
+        r = redis.Redis(port=port)
+        for _ in range(100):
+            try:
+                r.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        yield f"redis://127.0.0.1:{port}/0"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def _counts(r: redis.Redis) -> tuple[int, int]:
+    stats = r.info("commandstats")
+    total = sum(v["calls"] for k, v in stats.items() if not k.startswith(ADMIN))
+    return total, stats.get("cmdstat_evalsha", {}).get("calls", 0)
+
+def _pct(sorted_ns: List[int], q: float) -> float:
+    return round(sorted_ns[min(len(sorted_ns) - 1, int(q * len(sorted_ns)))] / 1000, 1)
+
+def bench(r: redis.Redis, variant: str, concurrency: int, cardinality: int, ops: int, rate: float, burst: int) -> dict:
+    overrides, kwargs = VARIANTS[variant]
+    policy = RateLimitPolicy(rate_per_sec=rate, burst=burst, ttl_seconds=3600, cost=1, prefix="bench", **overrides)
+    limiter = TokenBucketLimiter(r, policy, **kwargs)
+
+    r.flushdb()
+    r.config_resetstat()
+    # used_memory_dataset leaves out client buffers, which grow with concurrency and would swamp the per-key figure.
+    mem_before = r.info("memory")["used_memory_dataset"]
+    cmds_before, trips_before = _counts(r)
+
+    def worker(n: int, seed: int) -> tuple[List[int], int]:
+        rnd = random.Random(seed)
+        lat, allowed = [], 0
+        for _ in range(n):
+            key = "bench:ip:hot" if cardinality == 1 else f"bench:ip:{rnd.randrange(cardinality)}"
+            t0 = time.perf_counter_ns()
+            allowed += limiter.check(key).allowed
+            lat.append(time.perf_counter_ns() - t0)
+        return lat, allowed
+
+    per_worker = ops // concurrency
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, [per_worker] * concurrency, range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    lat = sorted(ns for l, _ in results for ns in l)
+    done = len(lat)
+    cmds, trips = _counts(r)
+    keys = r.dbsize()
+    mem = r.info("memory")["used_memory_dataset"] - mem_before
+    limiter.release_leases()
+    return {
+        "variant": variant,
+        "concurrency": concurrency,
+        "key_cardinality": cardinality,
+        "decisions": done,
+        "allowed_ratio": round(sum(a for _, a in results) / done, 3),
+        "decisions_per_sec": round(done / elapsed),
+        "p50_us": _pct(lat, 0.50),
+        "p99_us": _pct(lat, 0.99),
+        "p999_us": _pct(lat, 0.999),
+        "redis_commands_per_decision": round((cmds - cmds_before) / done, 3),
+        "round_trips_per_decision": round((trips - trips_before) / done, 3),
+        "keys": keys,
+        "bytes_per_key": round(mem / keys, 1) if keys > 100 else None,
+    }
+
+def regressions(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Scenarios whose throughput dropped or p99 grew by more than ``tolerance`` against ``baseline``."""
+    ident = lambda row: (row["variant"], row["concurrency"], row["key_cardinality"])
+    old = {ident(row): row for row in baseline}
+    out = []
+    for row in results:
+        prev = old.get(ident(row))
+        if prev is None:
+            continue
+        if row["decisions_per_sec"] < prev["decisions_per_sec"] * (1 - tolerance):
+            out.append(f"{ident(row)}: decisions_per_sec {prev['decisions_per_sec']} -> {row['decisions_per_sec']}")
+        if row["p99_us"] > prev["p99_us"] * (1 + tolerance):
+            out.append(f"{ident(row)}: p99_us {prev['p99_us']} -> {row['p99_us']}")
+    return out
+
+def main():
+    p = argparse.ArgumentParser(description="TokenBucketLimiter.check throughput, latency and Redis cost per decision")
+    p.add_argument("--redis-url", default=None, help="use this Redis (the DB is flushed) instead of spawning one")
+    p.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    p.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    p.add_argument("--cold-keys", type=int, default=10_000_000, help="key space for the cold-key scenario")
+    p.add_argument("--ops", type=int, default=50_000, help="decisions per scenario")
+    p.add_argument("--rate", type=float, default=1000.0)
+    p.add_argument("--burst", type=int, default=1000)
+    p.add_argument("--out", default=None, help="write JSON here instead of stdout")
+    p.add_argument("--baseline", default=None, help="earlier --out file; exit 1 on regressions")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    args = p.parse_args()
+
+    def run(url: str) -> List[dict]:
+        r = redis.Redis.from_url(url, decode_responses=False, max_connections=max(args.concurrency) + 4)
+        rows = [bench(r, v, c, k, args.ops, args.rate, args.burst)
+                for v in args.variants for k in (1, args.cold_keys) for c in args.concurrency]
+        r.flushdb()
+        return rows
+
+    if args.redis_url:
+        results = run(args.redis_url)
+    else:
+        with local_redis() as url:
+            results = run(url)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print("regression:", line, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
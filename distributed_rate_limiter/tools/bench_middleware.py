@@ -0,0 +1,105 @@
+from __future__ import annotations
+import argparse, asyncio, json, time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from rate_limiter.config import RateLimitPolicy
+from rate_limiter.middleware import RateLimitMiddleware
+from rate_limiter.token_bucket import Decision
+
+class AllowLimiter:
+    """Always allows without I/O, so only the middleware's own overhead is measured."""
+
+    async def check(self, key, policy=None):
+        return Decision(True, 99.0, 0)
+
+    async def check_many(self, keys, policies):
+        return [Decision(True, 99.0, 0) for _ in keys]
+
+class BaseHTTPRateLimit(BaseHTTPMiddleware):
+    """The previous BaseHTTPMiddleware shape, running the same decision core."""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app)
+        self.core = RateLimitMiddleware(app, **kwargs)
+
+    async def dispatch(self, request: Request, call_next):
+        core = self.core
+        if request.url.path in core.exempt_paths:
+            return await call_next(request)
+        forwarded = request.headers.get("x-forwarded-for")
+        ip = forwarded.split(",")[0].strip() if forwarded else (request.client.host if request.client else "unknown")
+        outcome = await core.decide(request.method, request.url.path, request.headers.get(core.api_key_header),
+                                    request.headers.get(core.user_id_header), ip)
+        if outcome is None:
+            return await call_next(request)
+        decision, limit, _ = outcome
+        if not decision.allowed:
+            return core.reject(decision, limit)
+        resp = await call_next(request)
+        for name, value in core.limit_headers(decision, limit):
+            resp.headers[name.decode()] = value.decode()
+        return resp
+
+def _app(middleware) -> FastAPI:
+    app = FastAPI()
+    policy = RateLimitPolicy(rate_per_sec=100, burst=100, ttl_seconds=60, cost=1, prefix="bench")
+    if middleware is not None:
+        app.add_middleware(middleware, limiter=AllowLimiter(), policy=policy)
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("pong")
+
+    return app
+
+async def _drive(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"x-api-key", b"k1")], "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    async def send(message):
+        pass
+
+    async def one():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                # Nothing else arrives; response-side listeners are cancelled once the response is done.
+                await asyncio.Event().wait()
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        await app(dict(scope), receive, send)
+
+    for _ in range(min(requests, 1000)):
+        await one()
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        await one()
+    return (time.perf_counter() - t0) / requests * 1e6
+
+def main():
+    p = argparse.ArgumentParser(description="Per-request overhead of the rate-limit middleware (no Redis)")
+    p.add_argument("--requests", type=int, default=20_000)
+    args = p.parse_args()
+
+    async def run():
+        baseline = await _drive(_app(None), args.requests)
+        out = {"requests": args.requests, "no_middleware_us": round(baseline, 1)}
+        for name, mw in (("asgi", RateLimitMiddleware), ("base_http", BaseHTTPRateLimit)):
+            us = await _drive(_app(mw), args.requests)
+            out[f"{name}_us"] = round(us, 1)
+            out[f"{name}_overhead_us"] = round(us - baseline, 1)
+        return out
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-__all__ = ["config","db","models","ledger_core","idempotency","outbox","api","worker"]
+__all__ = ["config","db","async_db","models","ledger_core","async_core","idempotency","outbox","api","worker"]
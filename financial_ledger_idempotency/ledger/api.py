@@ -1,77 +1,201 @@
 from __future__ import annotations
-from fastapi import FastAPI, Header, HTTPException
-import psycopg2
+import json
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import psycopg
+from psycopg_pool import PoolTimeout as AsyncPoolTimeout
 
 from ledger.config import settings
-from ledger.db import get_conn, migrate
-from ledger.models import CreateAccountRequest, AccountResponse, BalanceResponse, TransferRequest, TransactionResponse
-from ledger.ledger_core import create_account, get_balance, transfer
+from ledger.db import PoolTimeout, migrate
+from ledger.async_db import close_async_pool, get_async_pool, open_async_pool
+from ledger.models import (CreateAccountRequest, AccountResponse, BalanceResponse, TransferRequest, TransactionResponse,
+                           BatchTransferRequest, BatchTransferResponse, EntryPageResponse, JournalRequest)
+from ledger.async_core import (create_account, ensure_account, get_balance, get_balance_as_of, iter_entries, list_entries, post_journal,
+                               post_transfers, transfer)
+from ledger.idempotency import request_hash
+from ledger.ledger_core import journal_payload, transfer_payload
+from ledger.response_cache import ResponseCache
 
 app = FastAPI(title="Financial Ledger with Idempotency", version="1.0.0")
+response_cache = ResponseCache.from_settings(settings)
 
 @app.on_event("startup")
-def _startup():
+async def _startup():
     migrate(sql_dir="sql")
+    await open_async_pool()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await close_async_pool()
+    await response_cache.close()
+
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(AsyncPoolTimeout)
+def _pool_timeout(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": "db_pool_exhausted"}, headers={"Retry-After": "1"})
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
 @app.post("/v1/accounts", response_model=AccountResponse)
-def create_account_route(req: CreateAccountRequest):
-    with get_conn() as conn:
+async def create_account_route(req: CreateAccountRequest):
+    async with get_async_pool().connection() as conn:
         try:
-            acct = create_account(conn, req.name, req.type, req.currency)
-            conn.commit()
+            acct = await create_account(conn, req.name, req.type, req.currency)
+            await conn.commit()
             return acct
         except Exception:
-            conn.rollback()
+            await conn.rollback()
             raise
 
 @app.get("/v1/accounts/{account_id}/balance", response_model=BalanceResponse)
-def balance_route(account_id: str):
-    with get_conn() as conn:
+async def balance_route(account_id: str, as_of: Optional[datetime] = None):
+    async with get_async_pool().connection() as conn:
         try:
-            row = get_balance(conn, account_id)
+            row = await (get_balance(conn, account_id) if as_of is None else get_balance_as_of(conn, account_id, as_of))
             return {"account_id": row["account_id"], "currency": row["currency"], "balance_cents": int(row["balance_cents"])}
         except KeyError:
             raise HTTPException(status_code=404, detail="account_not_found")
 
-@app.post("/v1/transactions/transfer", response_model=TransactionResponse)
-def transfer_route(req: TransferRequest, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
-    if not idempotency_key:
-        raise HTTPException(status_code=400, detail="missing_idempotency_key")
-    with get_conn() as conn:
+@app.get("/v1/accounts/{account_id}/entries", response_model=EntryPageResponse)
+async def entries_route(account_id: str, limit: int = Query(default=100, ge=1, le=1000), cursor: Optional[str] = None):
+    async with get_async_pool().connection() as conn:
         try:
-            resp = transfer(
-                conn,
-                idempotency_key=idempotency_key,
-                from_account_id=req.from_account_id,
-                to_account_id=req.to_account_id,
-                amount_cents=req.amount_cents,
-                currency=req.currency,
-                external_ref=req.external_ref,
-            )
-            conn.commit()
-            return resp
+            return await list_entries(conn, account_id, limit=limit, cursor=cursor)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="account_not_found")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid_cursor")
+        finally:
+            await conn.rollback()
+
+async def _entries_ndjson(account_id: str, since: Optional[datetime], until: Optional[datetime]):
+    # One pooled connection for the whole export; rows are read a keyset page at a time, each page in its own short
+    # transaction, and go out in chunks of the same size. Memory stays flat however long the history is, and a slow
+    # client holds no transaction open, so it does not hold back the settled horizon for other readers.
+    async with get_async_pool().connection() as conn:
+        chunk = []
+        async for entry in iter_entries(conn, account_id, since=since, until=until):
+            chunk.append(json.dumps(entry) + "\n")
+            if len(chunk) >= 1000:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+@app.get("/v1/accounts/{account_id}/entries/export")
+async def entries_export_route(account_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    async with get_async_pool().connection() as conn:
+        try:
+            await ensure_account(conn, account_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="account_not_found")
+        finally:
+            await conn.rollback()
+    return StreamingResponse(_entries_ndjson(account_id, since, until), media_type="application/x-ndjson")
+
+_BAD_REQUESTS = {"CURRENCY_MISMATCH", "INVALID_JOURNAL", "UNBALANCED_JOURNAL"}
+# statement_timeout / lock_timeout: the request was fine, the database was busy; retrying later can succeed.
+_DB_TIMEOUTS = (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable)
+
+def _db_timeout() -> HTTPException:
+    return HTTPException(status_code=503, detail="db_timeout", headers={"Retry-After": "1"})
+
+async def _post(idempotency_key: str, req_hash: str,
+                posting: Callable[[psycopg.AsyncConnection], Awaitable[dict]]) -> dict:
+    """Run one posting in its own transaction and map ledger errors to HTTP ones.
+
+    Replays of a key whose response is cached are answered (or refused on a hash mismatch) without touching the DB.
+    """
+    cached = await response_cache.get(idempotency_key)
+    if cached is not None:
+        if cached[0] != req_hash:
+            raise HTTPException(status_code=409, detail="idempotency_key_conflict")
+        return cached[1]
+    async with get_async_pool().connection() as conn:
+        try:
+            resp = await posting(conn)
+            await conn.commit()
         except ValueError as e:
-            conn.rollback()
+            await conn.rollback()
             if str(e) == "IDEMPOTENCY_KEY_CONFLICT":
                 raise HTTPException(status_code=409, detail="idempotency_key_conflict")
-            if str(e) == "CURRENCY_MISMATCH":
-                raise HTTPException(status_code=400, detail="currency_mismatch")
+            if str(e) in _BAD_REQUESTS:
+                raise HTTPException(status_code=400, detail=str(e).lower())
             raise HTTPException(status_code=400, detail="bad_request")
         except KeyError:
-            conn.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=404, detail="account_not_found")
         except RuntimeError as e:
-            conn.rollback()
+            await conn.rollback()
             if str(e) == "IDEMPOTENCY_IN_PROGRESS":
                 raise HTTPException(status_code=409, detail="idempotency_in_progress")
             raise HTTPException(status_code=500, detail="internal_error")
-        except psycopg2.Error:
-            conn.rollback()
+        except _DB_TIMEOUTS:
+            await conn.rollback()
+            raise _db_timeout()
+        except psycopg.Error:
+            await conn.rollback()
+            raise HTTPException(status_code=400, detail="db_constraint_violation")
+    await response_cache.put(idempotency_key, req_hash, resp)
+    return resp
+
+@app.post("/v1/transactions/transfer", response_model=TransactionResponse)
+async def transfer_route(req: TransferRequest, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
+    if not idempotency_key:
+        raise HTTPException(status_code=400, detail="missing_idempotency_key")
+    req_hash = request_hash(transfer_payload(req.from_account_id, req.to_account_id, req.amount_cents, req.currency,
+                                              req.external_ref))
+    return await _post(idempotency_key, req_hash, lambda conn: transfer(
+        conn,
+        idempotency_key=idempotency_key,
+        from_account_id=req.from_account_id,
+        to_account_id=req.to_account_id,
+        amount_cents=req.amount_cents,
+        currency=req.currency,
+        external_ref=req.external_ref,
+    ))
+
+@app.post("/v1/transactions/journal", response_model=TransactionResponse)
+async def journal_route(req: JournalRequest, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
+    if not idempotency_key:
+        raise HTTPException(status_code=400, detail="missing_idempotency_key")
+    legs = [leg.model_dump() for leg in req.legs]
+    req_hash = request_hash(journal_payload(legs, req.currency, req.txn_type, req.external_ref))
+    return await _post(idempotency_key, req_hash, lambda conn: post_journal(
+        conn,
+        idempotency_key=idempotency_key,
+        legs=legs,
+        currency=req.currency,
+        txn_type=req.txn_type,
+        external_ref=req.external_ref,
+    ))
+
+@app.post("/v1/transactions/batch", response_model=BatchTransferResponse)
+async def batch_route(req: BatchTransferRequest):
+    if len(req.transfers) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail="batch_too_large")
+    async with get_async_pool().connection() as conn:
+        try:
+            resp = await post_transfers(conn, [t.model_dump() for t in req.transfers], atomic=req.atomic)
+            await conn.commit()
+        except ValueError as e:
+            await conn.rollback()
+            if str(e) == "DUPLICATE_IDEMPOTENCY_KEY":
+                raise HTTPException(status_code=400, detail="duplicate_idempotency_key")
+            raise HTTPException(status_code=400, detail="bad_request")
+        except _DB_TIMEOUTS:
+            await conn.rollback()
+            raise _db_timeout()
+        except psycopg.Error:
+            await conn.rollback()
             raise HTTPException(status_code=400, detail="db_constraint_violation")
+    if not resp["committed"]:
+        return JSONResponse(status_code=422, content=resp)
+    return resp
 
 if __name__ == "__main__":
     import uvicorn
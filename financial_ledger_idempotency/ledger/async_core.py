@@ -0,0 +1,102 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import AsyncIterator, Sequence
+
+import psycopg
+from psycopg.rows import dict_row
+
+from ledger.ledger_core import (ACCOUNT_EXISTS_SQL, ENTRIES_PAST_HORIZON_SQL, INSERT_ACCOUNT_SQL, INSERT_EMPTY_BALANCE_SQL,
+                                POST_JOURNAL_SQL, POST_TRANSFER_SQL, POST_TRANSFERS_SQL, SELECT_BALANCE_AS_OF_SQL,
+                                SELECT_BALANCE_SQL, SELECT_ENTRIES_SQL, SETTLED_HORIZON_SQL,
+                                batch_args, batch_result, entries_args, entries_cursor, entries_page, entry_row,
+                                journal_args, posting_result, transfer_args)
+
+# asyncio twins of ledger_core on psycopg3: the same statements (the posting functions claim the idempotency key
+# and write the outbox event in SQL), so the semantics are identical. Callers own the transaction, as with the sync
+# functions.
+
+async def create_account(conn: psycopg.AsyncConnection, name: str, type_: str, currency: str) -> dict:
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(INSERT_ACCOUNT_SQL, (name, type_, currency))
+        acct = await cur.fetchone()
+        await cur.execute(INSERT_EMPTY_BALANCE_SQL, (acct["account_id"],))
+        return {k: str(v) for k, v in acct.items()}
+
+async def get_balance(conn: psycopg.AsyncConnection, account_id: str) -> dict:
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(SELECT_BALANCE_SQL, (account_id,))
+        row = await cur.fetchone()
+        if not row:
+            raise KeyError("ACCOUNT_NOT_FOUND")
+        row["account_id"] = str(row["account_id"])
+        return row
+
+async def get_balance_as_of(conn: psycopg.AsyncConnection, account_id: str, ts: datetime) -> dict:
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(SELECT_BALANCE_AS_OF_SQL, {"account_id": account_id, "ts": ts})
+        row = await cur.fetchone()
+        if not row:
+            raise KeyError("ACCOUNT_NOT_FOUND")
+        row["account_id"] = str(row["account_id"])
+        return row
+
+async def ensure_account(conn: psycopg.AsyncConnection, account_id: str) -> None:
+    cur = await conn.execute(ACCOUNT_EXISTS_SQL, (account_id,))
+    if not await cur.fetchone():
+        raise KeyError("ACCOUNT_NOT_FOUND")
+
+async def settled_horizon(conn: psycopg.AsyncConnection) -> datetime:
+    cur = await conn.execute(SETTLED_HORIZON_SQL)
+    return (await cur.fetchone())[0]
+
+async def list_entries(conn: psycopg.AsyncConnection, account_id: str, *, limit: int = 100,
+                       cursor: str | None = None) -> dict:
+    await ensure_account(conn, account_id)
+    horizon = await settled_horizon(conn)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(SELECT_ENTRIES_SQL, entries_args(account_id, cursor, limit=limit + 1, horizon=horizon))
+        rows = await cur.fetchall()
+        held_back = False
+        if len(rows) <= limit:
+            await cur.execute(ENTRIES_PAST_HORIZON_SQL, (account_id, horizon))
+            held_back = (await cur.fetchone())["exists"]
+        return entries_page(account_id, rows, limit, cursor=cursor, held_back=held_back)
+
+async def iter_entries(conn: psycopg.AsyncConnection, account_id: str, *, since: datetime | None = None,
+                       until: datetime | None = None, itersize: int = 1000) -> AsyncIterator[dict]:
+    """Keyset pages of ``itersize`` rows, each read in its own short transaction.
+
+    Unlike the sync version no transaction stays open while the caller consumes rows, so a slow consumer (an export
+    to a slow client) does not hold back the settled horizon for other readers. Call it with ``conn`` idle; inside a
+    caller's transaction the pages become savepoints and that transaction is what holds the horizon back. Every page
+    stops at the horizon read up front, so the result is the same as one read at that moment.
+    """
+    async with conn.transaction():
+        horizon = await settled_horizon(conn)
+    cursor = None
+    while True:
+        async with conn.transaction():
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(SELECT_ENTRIES_SQL, entries_args(account_id, cursor, since=since, until=until,
+                                                                   limit=itersize, horizon=horizon))
+                rows = await cur.fetchall()
+        for row in rows:
+            yield entry_row(row)
+        if len(rows) < itersize:
+            return
+        cursor = entries_cursor(rows[-1])
+
+async def transfer(conn: psycopg.AsyncConnection, *, idempotency_key: str, from_account_id: str, to_account_id: str,
+                   amount_cents: int, currency: str, external_ref: str | None) -> dict:
+    cur = await conn.execute(POST_TRANSFER_SQL, transfer_args(idempotency_key, from_account_id, to_account_id,
+                                                              amount_cents, currency, external_ref))
+    return posting_result((await cur.fetchone())[0])
+
+async def post_journal(conn: psycopg.AsyncConnection, *, idempotency_key: str, legs: Sequence[dict], currency: str,
+                       txn_type: str = "JOURNAL", external_ref: str | None = None) -> dict:
+    cur = await conn.execute(POST_JOURNAL_SQL, journal_args(idempotency_key, legs, currency, txn_type, external_ref))
+    return posting_result((await cur.fetchone())[0])
+
+async def post_transfers(conn: psycopg.AsyncConnection, transfers: Sequence[dict], *, atomic: bool = True) -> dict:
+    cur = await conn.execute(POST_TRANSFERS_SQL, batch_args(transfers, atomic))
+    return batch_result((await cur.fetchone())[0], atomic)
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from time import monotonic
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from ledger.config import Settings, settings
+
+class _IdleCheck:
+    """Pool ``reset``/``check`` pair: ping only connections that sat idle longer than ``check_idle_s``."""
+
+    def __init__(self, check_idle_s: float):
+        self.check_idle_s = check_idle_s
+        self._returned: WeakKeyDictionary[AsyncConnection, float] = WeakKeyDictionary()
+
+    async def reset(self, conn: AsyncConnection) -> None:
+        self._returned[conn] = monotonic()
+
+    async def check(self, conn: AsyncConnection) -> None:
+        if monotonic() - self._returned.get(conn, 0.0) >= self.check_idle_s:
+            await AsyncConnectionPool.check_connection(conn)
+
+def make_async_pool(s: Settings = settings) -> AsyncConnectionPool:
+    """psycopg3 async pool sized and timed like the sync ``ledger.db.ConnectionPool``."""
+    idle = _IdleCheck(s.db_pool_check_idle_seconds)
+    kwargs = {"options": f"-c statement_timeout={s.db_statement_timeout_ms}"} if s.db_statement_timeout_ms else {}
+    return AsyncConnectionPool(
+        s.db_url,
+        min_size=s.db_pool_min_size,
+        max_size=s.db_pool_max_size,
+        timeout=s.db_pool_timeout_seconds,
+        kwargs=kwargs,
+        check=idle.check,
+        reset=idle.reset,
+        open=False,
+    )
+
+_pool: Optional[AsyncConnectionPool] = None
+
+async def open_async_pool() -> AsyncConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = make_async_pool()
+        await _pool.open()
+    return _pool
+
+def get_async_pool() -> AsyncConnectionPool:
+    if _pool is None:
+        raise RuntimeError("async pool not opened; call open_async_pool() at startup")
+    return _pool
+
+async def close_async_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -1,12 +1,139 @@
 from __future__ import annotations
 import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+from typing import Deque, Iterator, Optional, Tuple
+
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extras import RealDictCursor
-from ledger.config import settings
+from ledger.config import Settings, settings
 
 def get_conn(db_url: str | None = None):
     return psycopg2.connect(db_url or settings.db_url)
 
+class PoolTimeout(Exception):
+    """No pooled connection became free within the acquire timeout."""
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool.
+
+    At most ``max_size`` connections are checked out; ``getconn`` waits up to ``timeout_s`` for one and then raises
+    PoolTimeout. Connections idle for more than ``check_idle_s`` are pinged before reuse and replaced if dead.
+    Returned connections are rolled back if a transaction was left open. ``statement_timeout_ms`` (0 = off) is set
+    on every connection.
+    """
+
+    def __init__(self, db_url: str, *, min_size: int = 2, max_size: int = 20, timeout_s: float = 5.0,
+                 check_idle_s: float = 30.0, statement_timeout_ms: int = 0):
+        if min_size > max_size:
+            raise ValueError("min_size must not exceed max_size")
+        self.db_url = db_url
+        self.max_size = max_size
+        self.timeout_s = timeout_s
+        self.check_idle_s = check_idle_s
+        self._options = f"-c statement_timeout={statement_timeout_ms}" if statement_timeout_ms else None
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: Deque[Tuple[object, float]] = deque()
+        for _ in range(min_size):
+            self._idle.append((self._connect(), monotonic()))
+
+    @classmethod
+    def from_settings(cls, s: Settings) -> "ConnectionPool":
+        return cls(s.db_url, min_size=s.db_pool_min_size, max_size=s.db_pool_max_size,
+                   timeout_s=s.db_pool_timeout_seconds, check_idle_s=s.db_pool_check_idle_seconds,
+                   statement_timeout_ms=s.db_statement_timeout_ms)
+
+    def _connect(self):
+        if self._options:
+            return psycopg2.connect(self.db_url, options=self._options)
+        return psycopg2.connect(self.db_url)
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if monotonic() - idle_since < self.check_idle_s:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout_s):
+            raise PoolTimeout(f"no database connection free within {self.timeout_s}s")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    return self._connect()
+                if self._healthy(*item):
+                    return item[0]
+                self._discard(item[0])
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn) -> None:
+        try:
+            if conn.closed:
+                return
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            with self._lock:
+                self._idle.append((conn, monotonic()))
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """Borrow a connection; commit inside the block, anything uncommitted is rolled back on return."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """The process-wide pool, created from ``settings`` on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool.from_settings(settings)
+    return _pool
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 def migrate(sql_dir: str = "sql"):
     sql_files = sorted([f for f in os.listdir(sql_dir) if f.endswith(".sql")])
     with get_conn() as conn:
@@ -17,7 +144,7 @@ def migrate(sql_dir: str = "sql"):
         conn.commit()
 
 def fetch_one(sql: str, params=None):
-    with get_conn() as conn:
+    with get_pool().connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(sql, params or ())
             return cur.fetchone()
@@ -2,36 +2,51 @@ from __future__ import annotations
 import hashlib, json
 from typing import Any, Dict, Optional, Tuple
 
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# Shared with ledger.async_core so both drivers run identical statements.
+# A taken key returns no row instead of raising, so the transaction stays usable (no rollback of the caller's work).
+INSERT_KEY_SQL = ("INSERT INTO idempotency_key(idempotency_key, request_hash, status) VALUES (%s, %s, 'IN_PROGRESS') "
+                  "ON CONFLICT (idempotency_key) DO NOTHING RETURNING idempotency_key")
+SELECT_KEY_SQL = "SELECT * FROM idempotency_key WHERE idempotency_key=%s"
+COMPLETE_KEY_SQL = "UPDATE idempotency_key SET status='COMPLETED', response_json=%s, updated_at=now() WHERE idempotency_key=%s"
+# Retention: a bounded batch per statement (sql/006_idempotency_retention.sql indexes created_at).
+EXPIRE_KEYS_SQL = """DELETE FROM idempotency_key WHERE idempotency_key IN (
+                       SELECT idempotency_key FROM idempotency_key
+                       WHERE created_at < now() - make_interval(secs => %s)
+                       ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED)"""
+
 def request_hash(payload: Dict[str, Any]) -> str:
     raw = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
     return hashlib.sha256(raw).hexdigest()
 
+def existing_status(row: Optional[dict], req_hash: str) -> Tuple[str, Optional[dict]]:
+    """Outcome for a key that already exists (``row`` may be None if it vanished meanwhile)."""
+    if not row:
+        return "NEW", None
+    if row["request_hash"] != req_hash:
+        raise ValueError("IDEMPOTENCY_KEY_CONFLICT")
+    if row["status"] == "COMPLETED":
+        return "COMPLETED", row["response_json"]
+    return "IN_PROGRESS", None
+
 def begin_idempotent(conn, key: str, req_hash: str) -> Tuple[str, Optional[dict]]:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        try:
-            cur.execute(
-                "INSERT INTO idempotency_key(idempotency_key, request_hash, status) VALUES (%s, %s, 'IN_PROGRESS')",
-                (key, req_hash),
-            )
+        cur.execute(INSERT_KEY_SQL, (key, req_hash))
+        if cur.fetchone():
             return "NEW", None
-        except psycopg2.errors.UniqueViolation:
-            conn.rollback()
-            cur.execute("SELECT * FROM idempotency_key WHERE idempotency_key=%s", (key,))
-            row = cur.fetchone()
-            if not row:
-                return "NEW", None
-            if row["request_hash"] != req_hash:
-                raise ValueError("IDEMPOTENCY_KEY_CONFLICT")
-            if row["status"] == "COMPLETED":
-                return "COMPLETED", row["response_json"]
-            return "IN_PROGRESS", None
+        cur.execute(SELECT_KEY_SQL, (key,))
+        return existing_status(cur.fetchone(), req_hash)
 
 def complete_idempotency(conn, key: str, response_json: dict) -> None:
     with conn.cursor() as cur:
-        cur.execute(
-            "UPDATE idempotency_key SET status='COMPLETED', response_json=%s, updated_at=now() WHERE idempotency_key=%s",
-            (json.dumps(response_json), key),
-        )
+        cur.execute(COMPLETE_KEY_SQL, (json.dumps(response_json), key))
+
+def expire_keys(conn, retention_seconds: float, batch: int = 5000) -> int:
+    """Delete up to ``batch`` keys created more than ``retention_seconds`` ago; returns how many went.
+
+    A retry arriving after its key expired is treated as a new request, so the window must outlast client retries.
+    """
+    with conn.cursor() as cur:
+        cur.execute(EXPIRE_KEYS_SQL, (retention_seconds, batch))
+        return cur.rowcount
@@ -1,102 +1,294 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple
+import base64, json, uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 from psycopg2.extras import RealDictCursor
 
-from ledger.idempotency import request_hash, begin_idempotent, complete_idempotency
-from ledger.outbox import insert_event
+from ledger.idempotency import request_hash
+
+# Shared with ledger.async_core so both drivers run identical statements.
+INSERT_ACCOUNT_SQL = "INSERT INTO account(name, type, currency) VALUES (%s, %s, %s) RETURNING account_id, name, type, currency"
+INSERT_EMPTY_BALANCE_SQL = "INSERT INTO account_balance(account_id, balance_cents) VALUES (%s, 0) ON CONFLICT (account_id) DO NOTHING"
+# Sharded accounts (sql/005_balance_shards.sql) keep part of their balance in account_balance_shard rows.
+SELECT_BALANCE_SQL = """SELECT a.account_id, a.currency,
+                      b.balance_cents + COALESCE((SELECT SUM(s.balance_cents) FROM account_balance_shard s
+                                                  WHERE s.account_id=a.account_id), 0)::bigint AS balance_cents
+               FROM account a JOIN account_balance b ON b.account_id=a.account_id
+               WHERE a.account_id=%s"""
+# sql/010_balance_snapshots.sql: the latest snapshot at or before the requested time plus the entries after it.
+SELECT_BALANCE_AS_OF_SQL = """SELECT a.account_id, a.currency, s.as_of AS snapshot_as_of,
+                      (COALESCE(s.balance_cents, 0)
+                       + COALESCE((SELECT SUM(e.amount_cents) FROM ledger_entry e
+                                   WHERE e.account_id=a.account_id AND e.created_at >= COALESCE(s.as_of, '-infinity')
+                                     AND e.created_at < %(ts)s), 0))::bigint AS balance_cents
+               FROM account a
+               LEFT JOIN LATERAL (SELECT as_of, balance_cents FROM account_balance_snapshot
+                                  WHERE account_id=a.account_id AND as_of <= %(ts)s
+                                  ORDER BY as_of DESC LIMIT 1) s ON true
+               WHERE a.account_id=%(account_id)s"""
+TAKE_BALANCE_SNAPSHOT_SQL = "SELECT take_balance_snapshot(%s)"
+SET_BALANCE_SHARDS_SQL = "UPDATE account SET balance_shards=%s WHERE account_id=%s"
+COMPACT_BALANCE_SHARDS_SQL = "SELECT compact_balance_shards(%s)"
+# sql/002_post_transfer.sql: idempotency, validation, entries, balances and outbox in one round trip.
+POST_TRANSFER_SQL = "SELECT post_transfer(%s, %s, %s, %s, %s, %s, %s)"
+# sql/004_post_journal.sql: the same for any number of legs.
+POST_JOURNAL_SQL = "SELECT post_journal(%s, %s, %s, %s, %s, %s::jsonb)"
+# sql/003_post_transfers.sql: the same posting, set-based over a whole batch.
+POST_TRANSFERS_SQL = "SELECT post_transfers(%s::jsonb, %s)"
+# Account statements (sql/009_entry_partitions.sql): keyset pages along idx_entry_account_created, never OFFSET. The
+# plain created_at bounds let Postgres prune the monthly partitions outside the range; the row comparison breaks ties.
+ACCOUNT_EXISTS_SQL = "SELECT 1 FROM account WHERE account_id=%s"
+SELECT_ENTRIES_SQL = """SELECT e.entry_id, e.txn_id, e.amount_cents, e.created_at, t.txn_type, t.external_ref
+               FROM ledger_entry e JOIN ledger_transaction t ON t.txn_id=e.txn_id
+               WHERE e.account_id=%s AND e.created_at >= %s AND (e.created_at, e.entry_id) > (%s, %s)
+                 AND e.created_at < LEAST(%s::timestamptz, %s::timestamptz)
+               ORDER BY e.created_at, e.entry_id
+               LIMIT %s"""
+SETTLED_HORIZON_SQL = "SELECT ledger_settled_horizon()"
+ENTRIES_PAST_HORIZON_SQL = "SELECT EXISTS (SELECT 1 FROM ledger_entry WHERE account_id=%s AND created_at >= %s)"
+CREATE_ENTRY_PARTITIONS_SQL = "SELECT ledger_entry_create_partitions((now() AT TIME ZONE 'UTC')::date, %s)"
+
+_POSTING_ERRORS = {
+    "IDEMPOTENCY_KEY_CONFLICT": ValueError,
+    "CURRENCY_MISMATCH": ValueError,
+    "ACCOUNT_NOT_FOUND": KeyError,
+    "IDEMPOTENCY_IN_PROGRESS": RuntimeError,
+}
+
+def transfer_payload(from_account_id: str, to_account_id: str, amount_cents: int, currency: str,
+                     external_ref: str | None) -> Dict[str, Any]:
+    return {
+        "from_account_id": from_account_id,
+        "to_account_id": to_account_id,
+        "amount_cents": amount_cents,
+        "currency": currency,
+        "external_ref": external_ref,
+    }
+
+def transfer_args(idempotency_key: str, from_account_id: str, to_account_id: str, amount_cents: int, currency: str,
+                  external_ref: str | None) -> tuple:
+    rh = request_hash(transfer_payload(from_account_id, to_account_id, amount_cents, currency, external_ref))
+    return (idempotency_key, rh, from_account_id, to_account_id, amount_cents, currency, external_ref)
+
+def journal_payload(legs: Sequence[dict], currency: str, txn_type: str, external_ref: str | None) -> Dict[str, Any]:
+    legs = [{"account_id": str(l["account_id"]), "amount_cents": int(l["amount_cents"])} for l in legs]
+    return {"txn_type": txn_type, "currency": currency, "external_ref": external_ref, "legs": legs}
+
+def journal_args(idempotency_key: str, legs: Sequence[dict], currency: str, txn_type: str,
+                 external_ref: str | None) -> tuple:
+    payload = journal_payload(legs, currency, txn_type, external_ref)
+    legs = payload["legs"]
+    if len(legs) < 2 or any(l["amount_cents"] == 0 for l in legs):
+        raise ValueError("INVALID_JOURNAL")
+    if sum(l["amount_cents"] for l in legs) != 0:
+        raise ValueError("UNBALANCED_JOURNAL")
+    return (idempotency_key, request_hash(payload), txn_type, currency, external_ref, json.dumps(legs))
+
+def posting_result(res: dict) -> dict:
+    """The response from post_transfer, or the exception the old multi-statement path raised."""
+    error = res.get("error")
+    if error:
+        raise _POSTING_ERRORS[error](error)
+    return res
+
+def batch_args(transfers: Sequence[dict], atomic: bool) -> tuple:
+    """``transfers`` are dicts with ``idempotency_key`` plus the transfer() fields; keys must be unique."""
+    if not transfers:
+        raise ValueError("EMPTY_BATCH")
+    items = []
+    for t in transfers:
+        payload = transfer_payload(t["from_account_id"], t["to_account_id"], t["amount_cents"], t["currency"],
+                                   t.get("external_ref"))
+        items.append({"idempotency_key": t["idempotency_key"], "request_hash": request_hash(payload), **payload})
+    if len({i["idempotency_key"] for i in items}) != len(items):
+        raise ValueError("DUPLICATE_IDEMPOTENCY_KEY")
+    return (json.dumps(items), atomic)
+
+def batch_result(results: list, atomic: bool) -> dict:
+    counts = {s: 0 for s in ("POSTED", "REPLAYED", "REJECTED", "ABORTED")}
+    for r in results:
+        counts[r["status"]] += 1
+    return {"atomic": atomic, "committed": not (atomic and counts["REJECTED"]),
+            **{k.lower(): v for k, v in counts.items()}, "results": results}
+
+def entries_args(account_id: str, cursor: str | None = None, since: datetime | None = None,
+                 until: datetime | None = None, limit: int | None = None, *, horizon: datetime) -> tuple:
+    """SELECT_ENTRIES_SQL parameters; ``cursor`` (a page's ``next_cursor``) takes precedence over ``since``.
+
+    ``horizon`` comes from SETTLED_HORIZON_SQL, read in an earlier statement. Entries dated after it are left for a
+    later page: a transaction that is still open may yet commit entries before them, and a cursor already past those
+    would skip them.
+    """
+    if cursor is not None:
+        try:
+            ts, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            after = (datetime.fromisoformat(ts), str(uuid.UUID(entry_id)))
+        except ValueError:
+            raise ValueError("INVALID_CURSOR")
+    else:
+        after = (since or "-infinity", "00000000-0000-0000-0000-000000000000")
+    return (account_id, after[0], after[0], after[1], until or "infinity", horizon, limit)
+
+def entry_row(row: dict) -> dict:
+    return {"entry_id": str(row["entry_id"]), "txn_id": str(row["txn_id"]), "amount_cents": int(row["amount_cents"]),
+            "created_at": row["created_at"].isoformat(), "txn_type": row["txn_type"], "external_ref": row["external_ref"]}
+
+def entries_cursor(row: dict) -> str:
+    """Opaque position right after ``row``, as taken by entries_args."""
+    return base64.urlsafe_b64encode(f"{row['created_at'].isoformat()}|{row['entry_id']}".encode()).decode()
+
+# Position before every entry, handed out when the horizon holds back an account's first page.
+_START_CURSOR = entries_cursor({"created_at": datetime(1, 1, 1, tzinfo=timezone.utc),
+                                "entry_id": "00000000-0000-0000-0000-000000000000"})
+
+def entries_page(account_id: str, rows: List[dict], limit: int, *, cursor: str | None = None,
+                 held_back: bool = False) -> dict:
+    """Rows were fetched with ``limit + 1``: the extra row only says whether another page exists.
+
+    ``held_back`` says entries past the settled horizon exist: the page is short only because they are not settled
+    yet, so it still gets a cursor (after its last row, or the caller's position if it is empty) and ``has_more``.
+    ``next_cursor`` is None only at the end of the account's history as of the horizon.
+    """
+    entries = [entry_row(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = entries_cursor(rows[limit - 1])
+    elif held_back:
+        next_cursor = entries_cursor(rows[-1]) if rows else cursor or _START_CURSOR
+    return {"account_id": account_id, "entries": entries, "next_cursor": next_cursor,
+            "has_more": next_cursor is not None}
 
 def create_account(conn, name: str, type_: str, currency: str) -> dict:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "INSERT INTO account(name, type, currency) VALUES (%s, %s, %s) RETURNING account_id, name, type, currency",
-            (name, type_, currency),
-        )
+        cur.execute(INSERT_ACCOUNT_SQL, (name, type_, currency))
         acct = cur.fetchone()
-        cur.execute(
-            "INSERT INTO account_balance(account_id, balance_cents) VALUES (%s, 0) ON CONFLICT (account_id) DO NOTHING",
-            (acct["account_id"],),
-        )
+        cur.execute(INSERT_EMPTY_BALANCE_SQL, (acct["account_id"],))
         return {k: str(v) for k, v in acct.items()}
 
 def get_balance(conn, account_id: str) -> dict:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """SELECT a.account_id, a.currency, b.balance_cents
-               FROM account a JOIN account_balance b ON b.account_id=a.account_id
-               WHERE a.account_id=%s""",
-            (account_id,),
-        )
+        cur.execute(SELECT_BALANCE_SQL, (account_id,))
         row = cur.fetchone()
         if not row:
             raise KeyError("ACCOUNT_NOT_FOUND")
         row["account_id"] = str(row["account_id"])
         return row
 
-def _apply_balance_updates(cur, updates: List[Tuple[str, int]]):
-    for account_id, delta in updates:
-        cur.execute(
-            """INSERT INTO account_balance(account_id, balance_cents)
-               VALUES (%s, %s)
-               ON CONFLICT (account_id) DO UPDATE
-                 SET balance_cents = account_balance.balance_cents + EXCLUDED.balance_cents,
-                     updated_at = now()""",
-            (account_id, delta),
-        )
+def ensure_account(conn, account_id: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute(ACCOUNT_EXISTS_SQL, (account_id,))
+        if not cur.fetchone():
+            raise KeyError("ACCOUNT_NOT_FOUND")
 
-def transfer(conn, *, idempotency_key: str, from_account_id: str, to_account_id: str,
-             amount_cents: int, currency: str, external_ref: str | None) -> dict:
-    payload = {
-        "from_account_id": from_account_id,
-        "to_account_id": to_account_id,
-        "amount_cents": amount_cents,
-        "currency": currency,
-        "external_ref": external_ref,
-    }
-    rh = request_hash(payload)
+def settled_horizon(conn) -> datetime:
+    """Start of the oldest other open transaction (or now): no later commit can add entries dated before it."""
+    with conn.cursor() as cur:
+        cur.execute(SETTLED_HORIZON_SQL)
+        return cur.fetchone()[0]
+
+def list_entries(conn, account_id: str, *, limit: int = 100, cursor: str | None = None) -> dict:
+    """One page of an account's entries, oldest first; pass ``next_cursor`` back for the next one.
+
+    Each page is a single index range scan starting at the cursor, so page 10,000 costs what page 1 does. Pages stop
+    at the settled horizon, so entries a still-open transaction commits later are never behind a cursor; a page cut
+    short there keeps ``has_more`` and a cursor to resume from (see entries_page).
+    """
+    ensure_account(conn, account_id)
+    horizon = settled_horizon(conn)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(SELECT_ENTRIES_SQL, entries_args(account_id, cursor, limit=limit + 1, horizon=horizon))
+        rows = cur.fetchall()
+        held_back = False
+        if len(rows) <= limit:
+            cur.execute(ENTRIES_PAST_HORIZON_SQL, (account_id, horizon))
+            held_back = cur.fetchone()["exists"]
+        return entries_page(account_id, rows, limit, cursor=cursor, held_back=held_back)
+
+def iter_entries(conn, account_id: str, *, since: datetime | None = None, until: datetime | None = None,
+                 itersize: int = 1000) -> Iterator[dict]:
+    """Every entry of an account in ``[since, until)``, oldest first, through a server-side cursor.
+
+    Only ``itersize`` rows are held at a time, whatever the account's history. Needs an open transaction, which holds
+    back the settled horizon (and so every other reader's pages) until the caller ends it: drain it promptly.
+    """
+    horizon = settled_horizon(conn)
+    with conn.cursor(name=f"entries_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+        cur.itersize = itersize
+        cur.execute(SELECT_ENTRIES_SQL, entries_args(account_id, since=since, until=until, horizon=horizon))
+        for row in cur:
+            yield entry_row(row)
+
+def create_entry_partitions(conn, months_ahead: int = 3) -> int:
+    """Make sure monthly ledger_entry partitions exist through ``months_ahead`` months from now.
 
-    status, cached = begin_idempotent(conn, idempotency_key, rh)
-    if status == "COMPLETED":
-        return cached
-    if status == "IN_PROGRESS":
-        raise RuntimeError("IDEMPOTENCY_IN_PROGRESS")
+    Creating a partition locks ``ledger_entry`` against postings; the lock_timeout keeps a long reader from queueing
+    that lock, and every posting behind it, indefinitely. Commit promptly afterwards.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '2s'")
+        cur.execute(CREATE_ENTRY_PARTITIONS_SQL, (months_ahead + 1,))
+        return cur.fetchone()[0]
 
+def get_balance_as_of(conn, account_id: str, ts: datetime) -> dict:
+    """Balance from entries created before ``ts`` (same sign convention as get_balance).
+
+    Starts from the newest snapshot at or before ``ts``, so at most one snapshot interval of entries is summed.
+    ``snapshot_as_of`` says which snapshot was used (None when ``ts`` predates them all).
+    """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT account_id, currency FROM account WHERE account_id=%s", (from_account_id,))
-        fa = cur.fetchone()
-        cur.execute("SELECT account_id, currency FROM account WHERE account_id=%s", (to_account_id,))
-        ta = cur.fetchone()
-        if not fa or not ta:
+        cur.execute(SELECT_BALANCE_AS_OF_SQL, {"account_id": account_id, "ts": ts})
+        row = cur.fetchone()
+        if not row:
             raise KeyError("ACCOUNT_NOT_FOUND")
-        if fa["currency"] != currency or ta["currency"] != currency:
-            raise ValueError("CURRENCY_MISMATCH")
-
-        cur.execute(
-            "INSERT INTO ledger_transaction(txn_type, currency, external_ref) VALUES ('TRANSFER', %s, %s) "
-            "RETURNING txn_id, txn_type, currency, external_ref",
-            (currency, external_ref),
-        )
-        txn = cur.fetchone()
-
-        cur.execute("INSERT INTO ledger_entry(txn_id, account_id, amount_cents) VALUES (%s, %s, %s)",
-                    (txn["txn_id"], from_account_id, -amount_cents))
-        cur.execute("INSERT INTO ledger_entry(txn_id, account_id, amount_cents) VALUES (%s, %s, %s)",
-                    (txn["txn_id"], to_account_id, amount_cents))
-
-        _apply_balance_updates(cur, [(from_account_id, -amount_cents), (to_account_id, amount_cents)])
-
-        cur.execute("SELECT entry_id, account_id, amount_cents FROM ledger_entry WHERE txn_id=%s ORDER BY created_at",
-                    (txn["txn_id"],))
-        entries = cur.fetchall()
-
-        resp = {
-            "txn_id": str(txn["txn_id"]),
-            "txn_type": txn["txn_type"],
-            "currency": txn["currency"],
-            "external_ref": txn["external_ref"],
-            "entries": [{"entry_id": str(e["entry_id"]), "account_id": str(e["account_id"]), "amount_cents": int(e["amount_cents"])} for e in entries],
-        }
-
-        insert_event(conn, "ledger.transaction_posted", {"txn_id": resp["txn_id"], "type": resp["txn_type"], "currency": resp["currency"]})
-        complete_idempotency(conn, idempotency_key, resp)
-
-        return resp
+        row["account_id"] = str(row["account_id"])
+        return row
+
+def take_balance_snapshot(conn, max_span: timedelta = timedelta(days=1)) -> Optional[datetime]:
+    """Snapshot every account changed since the last run, covering at most ``max_span`` of entries.
+
+    Returns the cutoff, or None if there was nothing new. A cutoff short of the present means there is more to take.
+    """
+    with conn.cursor() as cur:
+        cur.execute(TAKE_BALANCE_SNAPSHOT_SQL, (max_span,))
+        return cur.fetchone()[0]
+
+def set_balance_shards(conn, account_id: str, shards: int) -> None:
+    """Spread a hot account's balance over ``shards`` rows (1 turns sharding off; existing shard rows still count)."""
+    with conn.cursor() as cur:
+        cur.execute(SET_BALANCE_SHARDS_SQL, (shards, account_id))
+        if cur.rowcount == 0:
+            raise KeyError("ACCOUNT_NOT_FOUND")
+
+def compact_balance_shards(conn, limit: int = 1000) -> int:
+    """Fold up to ``limit`` balance shard rows back into account_balance; returns how many were folded."""
+    with conn.cursor() as cur:
+        cur.execute(COMPACT_BALANCE_SHARDS_SQL, (limit,))
+        return cur.fetchone()[0]
+
+def transfer(conn, *, idempotency_key: str, from_account_id: str, to_account_id: str,
+             amount_cents: int, currency: str, external_ref: str | None) -> dict:
+    with conn.cursor() as cur:
+        cur.execute(POST_TRANSFER_SQL, transfer_args(idempotency_key, from_account_id, to_account_id, amount_cents,
+                                                     currency, external_ref))
+        return posting_result(cur.fetchone()[0])
+
+def post_journal(conn, *, idempotency_key: str, legs: Sequence[dict], currency: str, txn_type: str = "JOURNAL",
+                 external_ref: str | None = None) -> dict:
+    """Post one balanced transaction with any number of ``{"account_id", "amount_cents"}`` legs (fees, splits).
+
+    Same idempotency, errors and response shape as transfer(); entries come back in leg order.
+    """
+    with conn.cursor() as cur:
+        cur.execute(POST_JOURNAL_SQL, journal_args(idempotency_key, legs, currency, txn_type, external_ref))
+        return posting_result(cur.fetchone()[0])
+
+def post_transfers(conn, transfers: Sequence[dict], *, atomic: bool = True) -> dict:
+    """Post many transfers in one round trip.
+
+    ``atomic=True``: one rejected item aborts the batch (``committed`` is False, the rest come back ABORTED).
+    ``atomic=False``: every valid item posts and rejected ones are reported per item. Replays of completed keys
+    return their cached response in both modes. The transaction is left consistent either way; the caller commits.
+    """
+    with conn.cursor() as cur:
+        cur.execute(POST_TRANSFERS_SQL, batch_args(transfers, atomic))
+        return batch_result(cur.fetchone()[0], atomic)
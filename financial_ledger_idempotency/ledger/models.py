@@ -20,6 +20,22 @@ class BalanceResponse(BaseModel):
     currency: str
     balance_cents: int
 
+class EntryResponse(BaseModel):
+    entry_id: str
+    txn_id: str
+    amount_cents: int
+    created_at: str
+    txn_type: str
+    external_ref: Optional[str]
+
+class EntryPageResponse(BaseModel):
+    # next_cursor is opaque; pass it back as ?cursor= for the following page. It is None (and has_more false) only at
+    # the end of history as of the settled horizon; a page cut short by the horizon keeps a cursor to resume from.
+    account_id: str
+    entries: List[EntryResponse]
+    next_cursor: Optional[str]
+    has_more: bool
+
 class TransferRequest(BaseModel):
     from_account_id: str
     to_account_id: str
@@ -27,9 +43,43 @@ class TransferRequest(BaseModel):
     currency: str = Field(min_length=3, max_length=3)
     external_ref: Optional[str] = None
 
+class JournalLeg(BaseModel):
+    account_id: str
+    amount_cents: int
+
+class JournalRequest(BaseModel):
+    # Legs must sum to zero; negative amounts debit, positive credit, as in transfer entries.
+    legs: List[JournalLeg] = Field(min_length=2)
+    currency: str = Field(min_length=3, max_length=3)
+    txn_type: str = Field(default="JOURNAL", min_length=1)
+    external_ref: Optional[str] = None
+
 class TransactionResponse(BaseModel):
     txn_id: str
     txn_type: str
     currency: str
     external_ref: Optional[str]
     entries: List[dict]
+
+class BatchTransferItem(TransferRequest):
+    idempotency_key: str = Field(min_length=1)
+
+class BatchTransferRequest(BaseModel):
+    # atomic: one rejected item aborts the whole batch; otherwise valid items post and rejections are per item.
+    atomic: bool = True
+    transfers: List[BatchTransferItem] = Field(min_length=1)
+
+class BatchItemResult(BaseModel):
+    idempotency_key: str
+    status: Literal["POSTED","REPLAYED","REJECTED","ABORTED"]
+    error: Optional[str] = None
+    response: Optional[TransactionResponse] = None
+
+class BatchTransferResponse(BaseModel):
+    atomic: bool
+    committed: bool
+    posted: int
+    replayed: int
+    rejected: int
+    aborted: int
+    results: List[BatchItemResult]
@@ -1,14 +1,18 @@
 from __future__ import annotations
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence
 from psycopg2.extras import RealDictCursor
 
+# sql/008_outbox_notify.sql NOTIFYs the relays (ledger.relay) on commit of any insert, including the SQL posting functions.
+INSERT_EVENT_SQL = "INSERT INTO outbox_event(event_type, payload) VALUES (%s, %s) RETURNING event_id"
+# Partition upkeep (sql/007_outbox_partitions.sql); a DETACH that cannot get its lock quickly waits for the next run
+# instead of queueing the posting path behind it.
+CREATE_PARTITIONS_SQL = "SELECT outbox_create_partitions((now() AT TIME ZONE 'UTC')::date, %s)"
+RETIRE_PARTITIONS_SQL = "SELECT outbox_retire_partitions('-infinity', now() - %s * interval '1 day', %s)"
+
 def insert_event(conn, event_type: str, payload: Dict[str, Any]) -> str:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "INSERT INTO outbox_event(event_type, payload) VALUES (%s, %s) RETURNING event_id",
-            (event_type, json.dumps(payload)),
-        )
+        cur.execute(INSERT_EVENT_SQL, (event_type, json.dumps(payload)))
         return str(cur.fetchone()["event_id"])
 
 def poll_unsent(conn, limit: int = 50) -> List[dict]:
@@ -27,3 +31,42 @@ def poll_unsent(conn, limit: int = 50) -> List[dict]:
 def mark_sent(conn, event_id: str) -> None:
     with conn.cursor() as cur:
         cur.execute("UPDATE outbox_event SET sent_at=now() WHERE event_id=%s", (event_id,))
+
+def mark_sent_many(conn, event_ids: List[str], created_at: Optional[Sequence] = None) -> int:
+    """Ack a whole published batch in one statement.
+
+    Passing the events' ``created_at`` values bounds the UPDATE so it only touches the partitions they live in.
+    """
+    with conn.cursor() as cur:
+        if created_at:
+            cur.execute(
+                """UPDATE outbox_event SET sent_at=now()
+                   WHERE event_id = ANY(%s::uuid[]) AND created_at BETWEEN %s AND %s""",
+                (event_ids, min(created_at), max(created_at)),
+            )
+        else:
+            cur.execute("UPDATE outbox_event SET sent_at=now() WHERE event_id = ANY(%s::uuid[])", (event_ids,))
+        return cur.rowcount
+
+def maintain_partitions(conn, *, days_ahead: int = 7, retention_days: float = 7, archive: bool = False) -> Dict[str, Any]:
+    """Create daily partitions through ``days_ahead`` and retire fully-sent ones older than ``retention_days``.
+
+    Retired partitions are dropped, or with ``archive`` only detached and left as standalone tables to dump.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '2s'")
+        cur.execute(CREATE_PARTITIONS_SQL, (days_ahead + 1,))
+        created = cur.fetchone()[0]
+        cur.execute(RETIRE_PARTITIONS_SQL, (retention_days, archive))
+        retired = [r[0] for r in cur.fetchall()]
+    return {"created": created, "archived" if archive else "dropped": retired}
+
+if __name__ == "__main__":
+    from ledger.config import settings
+    from ledger.db import get_conn, migrate
+    migrate(sql_dir="sql")
+    with get_conn() as conn:
+        print(json.dumps(maintain_partitions(conn, days_ahead=settings.outbox_partition_days_ahead,
+                                             retention_days=settings.outbox_retention_days,
+                                             archive=settings.outbox_archive)))
+        conn.commit()
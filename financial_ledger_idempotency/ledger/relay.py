@@ -0,0 +1,142 @@
+from __future__ import annotations
+import json, queue, select, sys, threading
+from time import monotonic
+from typing import List, Optional, Protocol
+
+import psycopg2
+
+from ledger.db import ConnectionPool, get_conn, get_pool
+from ledger.outbox import mark_sent_many, poll_unsent
+
+CHANNEL = "outbox_event"  # NOTIFYed by sql/008_outbox_notify.sql
+
+class Publisher(Protocol):
+    def publish(self, events: List[dict]) -> None:
+        """Deliver a batch or raise; a raised batch stays unsent and is retried."""
+
+def _lines(events: List[dict]) -> str:
+    return "".join(json.dumps({"published_event": e}, default=str) + "\n" for e in events)
+
+class StdoutPublisher:
+    def publish(self, events: List[dict]) -> None:
+        sys.stdout.write(_lines(events))
+        sys.stdout.flush()
+
+class FilePublisher:
+    """Appends one JSON line per event to ``path`` (a local sink for tests and demos)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def publish(self, events: List[dict]) -> None:
+        data = _lines(events)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+class QueuePublisher:
+    """Hands events to an in-process ``queue.Queue``."""
+
+    def __init__(self, q: Optional[queue.Queue] = None):
+        self.queue = q if q is not None else queue.Queue()
+
+    def publish(self, events: List[dict]) -> None:
+        for e in events:
+            self.queue.put(e)
+
+def publisher_from_spec(spec: str) -> Publisher:
+    """``stdout``, ``file:<path>`` or ``queue`` (LEDGER_OUTBOX_PUBLISHER)."""
+    if spec == "stdout":
+        return StdoutPublisher()
+    if spec == "queue":
+        return QueuePublisher()
+    if spec.startswith("file:"):
+        return FilePublisher(spec[len("file:"):])
+    raise ValueError(f"unknown outbox publisher: {spec}")
+
+class OutboxRelay:
+    """Publishes outbox events as soon as their transaction commits.
+
+    Each pass claims up to ``batch`` of the oldest unsent events with FOR UPDATE SKIP LOCKED, publishes them in one
+    call and acks them with one UPDATE in the same transaction, so any number of relays (threads or processes) share
+    the backlog without claiming an event twice. Delivery stays at-least-once: a crash between publish and commit
+    republishes the batch. The batch doubles while passes come back full (up to ``max_batch``) and halves when they
+    come back less than half full. An idle relay blocks on LISTEN and wakes on the NOTIFY of the next commit;
+    ``idle_poll_s`` is only a safety net for lost notifications.
+    """
+
+    def __init__(self, publisher: Publisher, *, pool: Optional[ConnectionPool] = None, db_url: Optional[str] = None,
+                 min_batch: int = 25, max_batch: int = 1000, idle_poll_s: float = 2.0):
+        self.publisher = publisher
+        self.pool = pool or get_pool()
+        self.db_url = db_url or self.pool.db_url
+        self.min_batch = min_batch
+        self.max_batch = max(min_batch, max_batch)
+        self.batch = min_batch
+        self.idle_poll_s = idle_poll_s
+
+    def run_once(self) -> int:
+        """One claim/publish/ack pass; returns how many events went out."""
+        with self.pool.connection() as conn:
+            events = poll_unsent(conn, limit=self.batch)
+            if events:
+                self.publisher.publish(events)
+                mark_sent_many(conn, [str(e["event_id"]) for e in events], [e["created_at"] for e in events])
+            conn.commit()
+        n = len(events)
+        if n >= self.batch:
+            self.batch = min(self.max_batch, self.batch * 2)
+        elif n < self.batch // 2:
+            self.batch = max(self.min_batch, self.batch // 2)
+        return n
+
+    def _wait(self, listen, stop: threading.Event) -> None:
+        deadline = monotonic() + self.idle_poll_s
+        while not stop.is_set():
+            left = deadline - monotonic()
+            if left <= 0:
+                return
+            # Short slices keep shutdown prompt; a notification that arrived during the last pass returns at once.
+            if select.select([listen], [], [], min(left, 0.5))[0]:
+                listen.poll()
+                listen.notifies.clear()
+                return
+
+    def _listen(self):
+        listen = get_conn(self.db_url)
+        listen.autocommit = True
+        with listen.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return listen
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        stop = stop or threading.Event()
+        listen = None
+        try:
+            while not stop.is_set():
+                try:
+                    if listen is None:
+                        listen = self._listen()
+                    if self.run_once() == 0:
+                        self._wait(listen, stop)
+                except Exception as e:  # publisher or DB down: the batch was rolled back, retry after a pause
+                    print(json.dumps({"outbox_relay_error": repr(e)}), file=sys.stderr)
+                    if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and listen is not None:
+                        # Possibly the LISTEN connection itself (server restart, idle timeout): LISTEN again. Events
+                        # committed meanwhile are still unsent, and the next pass claims them before waiting.
+                        listen.close()
+                        listen = None
+                    stop.wait(self.idle_poll_s)
+        finally:
+            if listen is not None:
+                listen.close()
+
+def start_relays(n: int, publisher: Publisher, stop: threading.Event, **kwargs) -> List[threading.Thread]:
+    """Run ``n`` relays on daemon threads sharing ``publisher`` and the process connection pool."""
+    threads = []
+    for i in range(n):
+        relay = OutboxRelay(publisher, **kwargs)
+        t = threading.Thread(target=relay.run, args=(stop,), name=f"outbox-relay-{i}", daemon=True)
+        t.start()
+        threads.append(t)
+    return threads
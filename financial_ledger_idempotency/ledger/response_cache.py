@@ -0,0 +1,80 @@
+from __future__ import annotations
+import json
+from collections import OrderedDict
+from time import monotonic
+from typing import Optional, Tuple
+
+from ledger.config import Settings, settings
+
+Entry = Tuple[str, dict]  # (request_hash, response)
+
+class ResponseCache:
+    """Read-through cache of completed idempotent responses, keyed by idempotency key.
+
+    An in-process LRU sits in front of an optional shared Redis (``redis_url``), so a replayed request is answered
+    without a pool checkout or a Postgres round trip. Only put responses whose transaction committed. Completed
+    responses never change, but ``ttl_s`` should stay below the key retention window, after which the key may be
+    reused. Redis errors count as misses.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_s: float = 300.0, redis_url: Optional[str] = None,
+                 prefix: str = "ledger:idem:"):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self._data: OrderedDict[str, Tuple[float, Entry]] = OrderedDict()
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as aioredis  # optional: only needed for the shared tier
+            self._redis = aioredis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    @classmethod
+    def from_settings(cls, s: Settings = settings) -> "ResponseCache":
+        ttl_s = min(s.response_cache_ttl_seconds, s.idempotency_retention_hours * 3600)
+        return cls(s.response_cache_size, ttl_s, s.response_cache_redis_url)
+
+    def _local_get(self, key: str) -> Optional[Entry]:
+        hit = self._data.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return hit[1]
+
+    def _local_put(self, key: str, entry: Entry) -> None:
+        if self.max_size <= 0:
+            return
+        self._data[key] = (monotonic() + self.ttl_s, entry)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Entry]:
+        entry = self._local_get(key)
+        if entry is not None or self._redis is None:
+            return entry
+        try:
+            raw = await self._redis.get(self.prefix + key)
+        except Exception:
+            return None
+        if raw is None:
+            return None
+        doc = json.loads(raw)
+        entry = (doc["h"], doc["r"])
+        self._local_put(key, entry)
+        return entry
+
+    async def put(self, key: str, req_hash: str, response: dict) -> None:
+        self._local_put(key, (req_hash, response))
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(self.prefix + key, json.dumps({"h": req_hash, "r": response}), ex=max(1, int(self.ttl_s)))
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
@@ -1,22 +1,78 @@
 from __future__ import annotations
-import json, time
+import json, sys, threading, time
+from datetime import timedelta
 from ledger.config import settings
-from ledger.db import get_conn, migrate
-from ledger.outbox import poll_unsent, mark_sent
+from ledger.db import get_pool, migrate
+from ledger.idempotency import expire_keys
+from ledger.ledger_core import compact_balance_shards, create_entry_partitions, take_balance_snapshot
+from ledger.outbox import maintain_partitions
+from ledger.relay import publisher_from_spec, start_relays
 
-def publish(event: dict) -> None:
-    print(json.dumps({"published_event": event}, default=str))
+def compact_balances(batch: int = 1000) -> None:
+    # Stop at the first partial page: hot shards refill constantly, the next run takes them.
+    with get_pool().connection() as conn:
+        while compact_balance_shards(conn, batch) == batch:
+            conn.commit()
+        conn.commit()
+
+def snapshot_balances() -> None:
+    # One bounded slice per transaction until the snapshots reach the time this run started.
+    max_span = timedelta(hours=settings.balance_snapshot_max_span_hours)
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT clock_timestamp()")
+            started = cur.fetchone()[0]
+        while True:
+            cutoff = take_balance_snapshot(conn, max_span)
+            conn.commit()
+            if cutoff is None or cutoff >= started:
+                break
+
+def expire_idempotency_keys(batch: int = 5000) -> None:
+    retention_s = settings.idempotency_retention_hours * 3600
+    with get_pool().connection() as conn:
+        while expire_keys(conn, retention_s, batch) == batch:
+            conn.commit()
+        conn.commit()
+
+def maintain_table_partitions() -> None:
+    with get_pool().connection() as conn:
+        # Separate transactions: the lock on ledger_entry is released before outbox maintenance waits for its own.
+        create_entry_partitions(conn, settings.entry_partition_months_ahead)
+        conn.commit()
+        maintain_partitions(conn, days_ahead=settings.outbox_partition_days_ahead,
+                            retention_days=settings.outbox_retention_days, archive=settings.outbox_archive)
+        conn.commit()
+
+def _run_job(name: str, job) -> None:
+    # A failed run (lock_timeout, statement timeout, DB restart) is logged and retried on the job's next tick; it
+    # must not end the process and take the relays with it.
+    try:
+        job()
+    except Exception as e:
+        print(json.dumps({"worker_job_error": name, "error": repr(e)}), file=sys.stderr)
 
 def main():
     migrate(sql_dir="sql")
-    while True:
-        with get_conn() as conn:
-            events = poll_unsent(conn, limit=25)
-            for e in events:
-                publish(e)
-                mark_sent(conn, str(e["event_id"]))
-            conn.commit()
-        time.sleep(settings.worker_poll_seconds)
+    stop = threading.Event()
+    start_relays(settings.outbox_relays, publisher_from_spec(settings.outbox_publisher), stop,
+                 max_batch=settings.outbox_batch_max, idle_poll_s=settings.worker_poll_seconds)
+    jobs = [
+        (compact_balances, settings.balance_compact_seconds),
+        (snapshot_balances, settings.balance_snapshot_seconds),
+        (expire_idempotency_keys, settings.idempotency_expire_seconds),
+        (maintain_table_partitions, settings.partition_maintain_seconds),
+    ]
+    last_run = {job: 0.0 for job, _ in jobs}
+    try:
+        while True:
+            for job, every_s in jobs:
+                if every_s and time.monotonic() - last_run[job] >= every_s:
+                    _run_job(job.__name__, job)
+                    last_run[job] = time.monotonic()
+            time.sleep(1.0)
+    finally:
+        stop.set()
 
 if __name__ == "__main__":
     main()
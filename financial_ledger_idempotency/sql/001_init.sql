@@ -25,29 +25,40 @@ CREATE TABLE IF NOT EXISTS ledger_entry (
   created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
-CREATE INDEX IF NOT EXISTS idx_entry_account ON ledger_entry(account_id);
+-- Account statements page by (created_at, entry_id) within an account; see sql/009_entry_partitions.sql.
+DROP INDEX IF EXISTS idx_entry_account;
+CREATE INDEX IF NOT EXISTS idx_entry_account_created ON ledger_entry(account_id, created_at, entry_id);
 CREATE INDEX IF NOT EXISTS idx_entry_txn ON ledger_entry(txn_id);
 
--- Deferred trigger enforces: SUM(entries.amount_cents) == 0 per txn at commit time.
+-- Statement-level triggers (installed on the partitioned table by sql/009_entry_partitions.sql) enforce
+-- SUM(entries.amount_cents) == 0 for every txn a statement touched. Every committed txn already sums to zero, so a
+-- statement keeps it balanced iff the rows it inserted, deleted or changed net to zero per txn: the check reads only
+-- the transition tables, never ledger_entry, and costs the same however many partitions there are. Statement triggers
+-- cannot be deferred: all legs of a txn go in with one INSERT, as the posting functions do. (Transition tables allow
+-- only one event per trigger, hence three triggers.)
 CREATE OR REPLACE FUNCTION enforce_txn_balanced() RETURNS trigger AS $$
 DECLARE
+  bad UUID;
   s BIGINT;
 BEGIN
-  SELECT COALESCE(SUM(amount_cents),0) INTO s FROM ledger_entry WHERE txn_id = NEW.txn_id;
-  IF s <> 0 THEN
-    RAISE EXCEPTION 'Transaction % is not balanced (sum=%)', NEW.txn_id, s;
+  IF TG_OP = 'INSERT' THEN
+    SELECT txn_id, SUM(amount_cents) INTO bad, s FROM new_entries
+    GROUP BY txn_id HAVING SUM(amount_cents) <> 0 LIMIT 1;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT txn_id, -SUM(amount_cents) INTO bad, s FROM old_entries
+    GROUP BY txn_id HAVING SUM(amount_cents) <> 0 LIMIT 1;
+  ELSE
+    SELECT txn_id, SUM(amount_cents) INTO bad, s
+    FROM (SELECT txn_id, amount_cents FROM new_entries UNION ALL SELECT txn_id, -amount_cents FROM old_entries) d
+    GROUP BY txn_id HAVING SUM(amount_cents) <> 0 LIMIT 1;
   END IF;
-  RETURN NEW;
+  IF bad IS NOT NULL THEN
+    RAISE EXCEPTION 'Transaction % is not balanced (sum=%)', bad, s;
+  END IF;
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
-DROP TRIGGER IF EXISTS trg_enforce_txn_balanced ON ledger_entry;
-CREATE CONSTRAINT TRIGGER trg_enforce_txn_balanced
-AFTER INSERT OR UPDATE OR DELETE ON ledger_entry
-DEFERRABLE INITIALLY DEFERRED
-FOR EACH ROW
-EXECUTE FUNCTION enforce_txn_balanced();
-
 CREATE TABLE IF NOT EXISTS account_balance (
   account_id UUID PRIMARY KEY REFERENCES account(account_id) ON DELETE CASCADE,
   balance_cents BIGINT NOT NULL DEFAULT 0,
@@ -0,0 +1,14 @@
+-- Single round-trip transfer posting: the two-leg case of post_journal() (sql/004_post_journal.sql), which claims
+-- the idempotency key, validates the accounts, writes the transaction, entries, balance deltas and outbox event and
+-- stores the response on the key. Returns the response JSON, the cached response for a completed key, or
+-- {"error": CODE} (IDEMPOTENCY_KEY_CONFLICT, IDEMPOTENCY_IN_PROGRESS, ACCOUNT_NOT_FOUND, CURRENCY_MISMATCH) which
+-- the caller turns into the usual exception and rolls back.
+CREATE OR REPLACE FUNCTION post_transfer(
+  p_key TEXT, p_hash TEXT, p_from UUID, p_to UUID, p_amount BIGINT, p_currency TEXT, p_external_ref TEXT
+) RETURNS JSONB AS $$
+BEGIN
+  RETURN post_journal(p_key, p_hash, 'TRANSFER', p_currency, p_external_ref, jsonb_build_array(
+    jsonb_build_object('account_id', p_from, 'amount_cents', -p_amount),
+    jsonb_build_object('account_id', p_to, 'amount_cents', p_amount)));
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,133 @@
+-- Set-based batch posting: one call posts many transfers, each under its own idempotency key.
+-- p_items is a JSON array of {idempotency_key, request_hash, from_account_id, to_account_id, amount_cents, currency,
+-- external_ref}; keys must be unique within the batch. Every step is one multi-row statement over the whole batch,
+-- and balance deltas are netted per account (or balance shard) before the upsert.
+--
+-- Per item the result is POSTED (with response), REPLAYED (cached response of a completed key), REJECTED (with
+-- error, same codes as post_transfer) or ABORTED. With p_atomic, any REJECTED item aborts the others: keys claimed
+-- by this call are released and nothing is written. Without it, valid items post and rejected ones are released.
+-- Either way the transaction is left consistent and the caller commits.
+CREATE OR REPLACE FUNCTION post_transfers(p_items JSONB, p_atomic BOOLEAN) RETURNS JSONB AS $$
+DECLARE
+  v_rejected BOOLEAN;
+  v_out JSONB;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS batch_item (
+    ord BIGINT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    from_account_id UUID NOT NULL,
+    to_account_id UUID NOT NULL,
+    amount_cents BIGINT NOT NULL,
+    currency TEXT NOT NULL,
+    external_ref TEXT,
+    txn_id UUID NOT NULL,
+    debit_entry_id UUID NOT NULL,
+    credit_entry_id UUID NOT NULL,
+    response JSONB,
+    claimed BOOLEAN NOT NULL DEFAULT FALSE,
+    posted BOOLEAN NOT NULL DEFAULT FALSE,
+    error TEXT
+  ) ON COMMIT DROP;
+  TRUNCATE batch_item;
+
+  -- Ids are generated up front, so the response is known before anything is written and the key can be stored
+  -- COMPLETED in one go (nobody sees it before commit, and concurrent claimants wait on it as before).
+  INSERT INTO batch_item(ord, idempotency_key, request_hash, from_account_id, to_account_id, amount_cents, currency,
+                         external_ref, txn_id, debit_entry_id, credit_entry_id, response)
+  SELECT t.*, jsonb_build_object(
+           'txn_id', t.txn_id, 'txn_type', 'TRANSFER', 'currency', t.currency, 'external_ref', t.external_ref,
+           'entries', jsonb_build_array(
+             jsonb_build_object('entry_id', t.debit_entry_id, 'account_id', t.from_account_id,
+                                'amount_cents', -t.amount_cents),
+             jsonb_build_object('entry_id', t.credit_entry_id, 'account_id', t.to_account_id,
+                                'amount_cents', t.amount_cents)))
+  FROM (
+    SELECT i.ord, i.item->>'idempotency_key', i.item->>'request_hash', (i.item->>'from_account_id')::uuid AS from_account_id,
+           (i.item->>'to_account_id')::uuid AS to_account_id, (i.item->>'amount_cents')::bigint AS amount_cents,
+           i.item->>'currency' AS currency, i.item->>'external_ref' AS external_ref,
+           gen_random_uuid() AS txn_id, gen_random_uuid() AS debit_entry_id, gen_random_uuid() AS credit_entry_id
+    FROM jsonb_array_elements(p_items) WITH ORDINALITY AS i(item, ord)
+  ) t;
+  -- Temp tables get no autovacuum statistics. Without fresh ones (also after the claimed/posted flags change) the
+  -- joins below plan as nested loops over the whole batch.
+  ANALYZE batch_item;
+
+  -- Claim keys in key order so concurrent batches lock them in the same order.
+  WITH claimed AS (
+    INSERT INTO idempotency_key(idempotency_key, request_hash, status, response_json)
+    SELECT idempotency_key, request_hash, 'COMPLETED', response FROM batch_item ORDER BY idempotency_key
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key
+  )
+  UPDATE batch_item b SET claimed = TRUE FROM claimed c WHERE c.idempotency_key = b.idempotency_key;
+  ANALYZE batch_item;
+
+  -- A key missing here was released by its holder between our claim and this read; the client retries.
+  UPDATE batch_item b
+  SET error = CASE WHEN k.idempotency_key IS NULL OR k.status <> 'COMPLETED' THEN 'IDEMPOTENCY_IN_PROGRESS'
+                   WHEN k.request_hash <> b.request_hash THEN 'IDEMPOTENCY_KEY_CONFLICT' END,
+      response = CASE WHEN k.request_hash = b.request_hash AND k.status = 'COMPLETED' THEN k.response_json END
+  FROM batch_item u LEFT JOIN idempotency_key k ON k.idempotency_key = u.idempotency_key
+  WHERE NOT u.claimed AND u.ord = b.ord;
+
+  UPDATE batch_item b SET error = v.err
+  FROM (
+    SELECT i.ord,
+           CASE WHEN fa.account_id IS NULL OR ta.account_id IS NULL THEN 'ACCOUNT_NOT_FOUND'
+                WHEN fa.currency <> i.currency OR ta.currency <> i.currency THEN 'CURRENCY_MISMATCH' END AS err
+    FROM batch_item i
+    LEFT JOIN account fa ON fa.account_id = i.from_account_id
+    LEFT JOIN account ta ON ta.account_id = i.to_account_id
+    WHERE i.claimed
+  ) v
+  WHERE v.ord = b.ord AND v.err IS NOT NULL;
+
+  SELECT EXISTS (SELECT 1 FROM batch_item WHERE error IS NOT NULL) INTO v_rejected;
+
+  DELETE FROM idempotency_key k USING batch_item b
+  WHERE b.claimed AND k.idempotency_key = b.idempotency_key AND (b.error IS NOT NULL OR (p_atomic AND v_rejected));
+
+  IF NOT (p_atomic AND v_rejected) THEN
+    UPDATE batch_item SET posted = TRUE WHERE claimed AND error IS NULL;
+    ANALYZE batch_item;
+
+    INSERT INTO ledger_transaction(txn_id, txn_type, currency, external_ref)
+    SELECT txn_id, 'TRANSFER', currency, external_ref FROM batch_item WHERE posted ORDER BY ord;
+
+    INSERT INTO ledger_entry(entry_id, txn_id, account_id, amount_cents)
+    SELECT l.entry_id, i.txn_id, l.account_id, l.amount_cents
+    FROM batch_item i
+    CROSS JOIN LATERAL (VALUES (1, i.debit_entry_id, i.from_account_id, -i.amount_cents),
+                               (2, i.credit_entry_id, i.to_account_id, i.amount_cents))
+      AS l(leg, entry_id, account_id, amount_cents)
+    WHERE i.posted
+    ORDER BY i.ord, l.leg;
+
+    PERFORM apply_balance_deltas(array_agg(txn_id), array_agg(account_id), array_agg(amount_cents))
+    FROM (
+      SELECT txn_id, from_account_id, -amount_cents FROM batch_item WHERE posted
+      UNION ALL
+      SELECT txn_id, to_account_id, amount_cents FROM batch_item WHERE posted
+    ) AS d(txn_id, account_id, amount_cents);
+
+    INSERT INTO outbox_event(event_type, payload)
+    SELECT 'ledger.transaction_posted', jsonb_build_object('txn_id', txn_id, 'type', 'TRANSFER', 'currency', currency)
+    FROM batch_item WHERE posted ORDER BY ord;
+  END IF;
+
+  SELECT jsonb_agg(
+           jsonb_build_object(
+             'idempotency_key', idempotency_key,
+             'status', CASE WHEN error IS NOT NULL THEN 'REJECTED'
+                            WHEN posted THEN 'POSTED'
+                            WHEN NOT claimed THEN 'REPLAYED'
+                            ELSE 'ABORTED' END)
+           || CASE WHEN error IS NOT NULL THEN jsonb_build_object('error', error)
+                   WHEN posted OR NOT claimed THEN jsonb_build_object('response', response)
+                   ELSE '{}' END
+           ORDER BY ord)
+  INTO v_out FROM batch_item;
+  RETURN v_out;
+END;
+$$ LANGUAGE plpgsql;
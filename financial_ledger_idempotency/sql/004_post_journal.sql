@@ -0,0 +1,70 @@
+-- N-leg journal posting in one round trip: fees, splits and multi-leg settlements.
+-- p_legs is a JSON array of {account_id, amount_cents}; legs must sum to zero (checked by the caller and by the
+-- ledger_entry balance trigger). All legs share p_currency: FX is posted as one journal per currency through FX
+-- clearing accounts. Idempotency, error codes and the response shape are those of post_transfer, which is the
+-- two-leg case of this function.
+CREATE OR REPLACE FUNCTION post_journal(
+  p_key TEXT, p_hash TEXT, p_txn_type TEXT, p_currency TEXT, p_external_ref TEXT, p_legs JSONB
+) RETURNS JSONB AS $$
+DECLARE
+  k idempotency_key%ROWTYPE;
+  v_missing BOOLEAN;
+  v_mismatch BOOLEAN;
+  v_txn_id UUID;
+  v_entries JSONB;
+  v_resp JSONB;
+BEGIN
+  -- Waits for a concurrent holder of the same key to finish, like the plain INSERT did.
+  INSERT INTO idempotency_key(idempotency_key, request_hash, status) VALUES (p_key, p_hash, 'IN_PROGRESS')
+  ON CONFLICT (idempotency_key) DO NOTHING;
+  IF NOT FOUND THEN
+    SELECT * INTO k FROM idempotency_key WHERE idempotency_key = p_key;
+    IF FOUND THEN
+      IF k.request_hash <> p_hash THEN
+        RETURN jsonb_build_object('error', 'IDEMPOTENCY_KEY_CONFLICT');
+      END IF;
+      IF k.status = 'COMPLETED' THEN
+        RETURN k.response_json;
+      END IF;
+      RETURN jsonb_build_object('error', 'IDEMPOTENCY_IN_PROGRESS');
+    END IF;
+  END IF;
+
+  -- Entry ids are generated here so the response lists the legs in request order.
+  SELECT jsonb_agg(jsonb_build_object('entry_id', gen_random_uuid(), 'account_id', (l.leg->>'account_id')::uuid,
+                                      'amount_cents', (l.leg->>'amount_cents')::bigint) ORDER BY l.ord)
+  INTO v_entries
+  FROM jsonb_array_elements(p_legs) WITH ORDINALITY AS l(leg, ord);
+
+  SELECT bool_or(a.account_id IS NULL), bool_or(a.currency <> p_currency) INTO v_missing, v_mismatch
+  FROM jsonb_array_elements(v_entries) AS e LEFT JOIN account a ON a.account_id = (e->>'account_id')::uuid;
+  IF v_missing THEN
+    RETURN jsonb_build_object('error', 'ACCOUNT_NOT_FOUND');
+  END IF;
+  IF v_mismatch THEN
+    RETURN jsonb_build_object('error', 'CURRENCY_MISMATCH');
+  END IF;
+
+  INSERT INTO ledger_transaction(txn_type, currency, external_ref) VALUES (p_txn_type, p_currency, p_external_ref)
+  RETURNING txn_id INTO v_txn_id;
+
+  INSERT INTO ledger_entry(entry_id, txn_id, account_id, amount_cents)
+  SELECT (e->>'entry_id')::uuid, v_txn_id, (e->>'account_id')::uuid, (e->>'amount_cents')::bigint
+  FROM jsonb_array_elements(v_entries) AS e;
+
+  PERFORM apply_balance_deltas(array_agg(v_txn_id), array_agg((e->>'account_id')::uuid),
+                               array_agg((e->>'amount_cents')::bigint))
+  FROM jsonb_array_elements(v_entries) AS e;
+
+  v_resp := jsonb_build_object('txn_id', v_txn_id, 'txn_type', p_txn_type, 'currency', p_currency,
+                               'external_ref', p_external_ref, 'entries', v_entries);
+
+  INSERT INTO outbox_event(event_type, payload)
+  VALUES ('ledger.transaction_posted', jsonb_build_object('txn_id', v_txn_id, 'type', p_txn_type, 'currency', p_currency));
+
+  UPDATE idempotency_key SET status = 'COMPLETED', response_json = v_resp, updated_at = now()
+  WHERE idempotency_key = p_key;
+
+  RETURN v_resp;
+END;
+$$ LANGUAGE plpgsql;
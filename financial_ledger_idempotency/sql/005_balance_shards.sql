@@ -0,0 +1,70 @@
+-- Opt-in balance sharding for hot accounts (fees, clearing, settlement) that take part in most postings.
+-- With balance_shards = N > 1 an account's deltas go to one of N account_balance_shard rows, picked by a hash of the
+-- txn id, so concurrent postings contend on N row locks instead of one. The balance is account_balance plus the
+-- sum of the shard rows; compact_balance_shards() folds shard rows back into account_balance.
+ALTER TABLE account ADD COLUMN IF NOT EXISTS balance_shards INT NOT NULL DEFAULT 1
+  CHECK (balance_shards BETWEEN 1 AND 256);
+
+CREATE TABLE IF NOT EXISTS account_balance_shard (
+  account_id UUID NOT NULL REFERENCES account(account_id) ON DELETE CASCADE,
+  shard INT NOT NULL,
+  balance_cents BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (account_id, shard)
+);
+
+-- All balance writes go through here. Deltas are netted per row and rows are locked in key order (plain rows
+-- first, then shards), so concurrent postings cannot deadlock on balances.
+CREATE OR REPLACE FUNCTION apply_balance_deltas(p_txn_ids UUID[], p_account_ids UUID[], p_amounts BIGINT[])
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO account_balance(account_id, balance_cents)
+  SELECT d.account_id, SUM(d.amount_cents)
+  FROM unnest(p_txn_ids, p_account_ids, p_amounts) AS d(txn_id, account_id, amount_cents)
+  JOIN account a ON a.account_id = d.account_id
+  WHERE a.balance_shards = 1
+  GROUP BY d.account_id ORDER BY d.account_id
+  ON CONFLICT (account_id) DO UPDATE
+    SET balance_cents = account_balance.balance_cents + EXCLUDED.balance_cents,
+        updated_at = now();
+
+  INSERT INTO account_balance_shard(account_id, shard, balance_cents)
+  SELECT d.account_id, (hashtext(d.txn_id::text) & 2147483647) % a.balance_shards, SUM(d.amount_cents)
+  FROM unnest(p_txn_ids, p_account_ids, p_amounts) AS d(txn_id, account_id, amount_cents)
+  JOIN account a ON a.account_id = d.account_id
+  WHERE a.balance_shards > 1
+  GROUP BY 1, 2 ORDER BY 1, 2
+  ON CONFLICT (account_id, shard) DO UPDATE
+    SET balance_cents = account_balance_shard.balance_cents + EXCLUDED.balance_cents,
+        updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Folds up to p_limit non-zero shard rows into account_balance and returns how many it folded. Rows locked by
+-- in-flight postings are skipped (picked up next run), so compaction never stalls the hot path. Shard rows are
+-- zeroed rather than deleted, which keeps the next posting an in-place update.
+CREATE OR REPLACE FUNCTION compact_balance_shards(p_limit INT) RETURNS INT AS $$
+DECLARE
+  n INT;
+BEGIN
+  WITH picked AS (
+    SELECT account_id, shard, balance_cents FROM account_balance_shard
+    WHERE balance_cents <> 0
+    ORDER BY account_id, shard
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ), zeroed AS (
+    UPDATE account_balance_shard s SET balance_cents = 0, updated_at = now()
+    FROM picked p WHERE s.account_id = p.account_id AND s.shard = p.shard
+    RETURNING p.account_id, p.balance_cents
+  ), folded AS (
+    INSERT INTO account_balance(account_id, balance_cents)
+    SELECT account_id, SUM(balance_cents) FROM zeroed GROUP BY account_id ORDER BY account_id
+    ON CONFLICT (account_id) DO UPDATE
+      SET balance_cents = account_balance.balance_cents + EXCLUDED.balance_cents,
+          updated_at = now()
+  )
+  SELECT count(*) INTO n FROM zeroed;
+  RETURN n;
+END;
+$$ LANGUAGE plpgsql;
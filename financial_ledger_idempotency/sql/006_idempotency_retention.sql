@@ -0,0 +1,3 @@
+-- Retention for idempotency keys: ledger.idempotency.expire_keys deletes keys older than the configured window in
+-- created_at order, so the table stays bounded by the write rate times the window.
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_key(created_at);
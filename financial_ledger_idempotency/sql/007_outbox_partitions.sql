@@ -0,0 +1,115 @@
+-- outbox_event is range-partitioned by day on created_at (UTC), so sent history is retired with DETACH/DROP
+-- instead of row-by-row DELETE. A pre-partitioning table is converted once: it becomes the partition for
+-- everything before tomorrow and is retired like any other partition once fully sent.
+DO $$
+DECLARE
+  v_bound TIMESTAMPTZ := ((now() AT TIME ZONE 'UTC')::date + 1)::timestamp AT TIME ZONE 'UTC';
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'outbox_event'::regclass) = 'r' THEN
+    DROP TRIGGER IF EXISTS trg_notify_outbox_event ON outbox_event;
+    ALTER TABLE outbox_event RENAME TO outbox_event_legacy;
+    ALTER TABLE outbox_event_legacy DROP CONSTRAINT outbox_event_pkey;
+    ALTER TABLE outbox_event_legacy ADD CONSTRAINT outbox_event_legacy_pkey PRIMARY KEY (event_id, created_at);
+    ALTER INDEX IF EXISTS idx_outbox_unsent RENAME TO outbox_event_legacy_unsent_idx;
+    ALTER INDEX IF EXISTS idx_outbox_unsent_created RENAME TO outbox_event_legacy_unsent_created_idx;
+
+    CREATE TABLE outbox_event (
+      event_id UUID NOT NULL DEFAULT gen_random_uuid(),
+      event_type TEXT NOT NULL,
+      payload JSONB NOT NULL,
+      created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+      sent_at TIMESTAMPTZ,
+      PRIMARY KEY (event_id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    EXECUTE format('ALTER TABLE outbox_event ATTACH PARTITION outbox_event_legacy FOR VALUES FROM (MINVALUE) TO (%L)', v_bound);
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_outbox_unsent ON outbox_event(sent_at) WHERE sent_at IS NULL;
+
+-- Catches rows if maintenance falls behind (an insert dated past the last pre-created partition).
+CREATE TABLE IF NOT EXISTS outbox_event_default PARTITION OF outbox_event DEFAULT;
+
+-- Creates partition p_name for [p_lo, p_hi) of p_parent; false if another partition already covers the range. If
+-- <parent>_default holds rows for that range a plain CREATE would fail its constraint check, so the default is
+-- detached, those rows move straight into the new partition and it is re-attached. Moving them partition to
+-- partition skips the parent's statement triggers, which already ran when the rows were first inserted.
+CREATE OR REPLACE FUNCTION create_range_partition(p_parent REGCLASS, p_name TEXT, p_lo TIMESTAMPTZ, p_hi TIMESTAMPTZ)
+RETURNS BOOLEAN AS $$
+DECLARE
+  v_default TEXT := p_parent::text || '_default';
+  v_stray BOOLEAN;
+BEGIN
+  EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= $1 AND created_at < $2)', v_default)
+    INTO v_stray USING p_lo, p_hi;
+  IF v_stray THEN
+    EXECUTE format('ALTER TABLE %s DETACH PARTITION %I', p_parent, v_default);
+  END IF;
+  EXECUTE format('CREATE TABLE %I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)', p_name, p_parent, p_lo, p_hi);
+  IF v_stray THEN
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE created_at >= $1 AND created_at < $2 RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', v_default, p_name) USING p_lo, p_hi;
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I DEFAULT', p_parent, v_default);
+    RAISE NOTICE 'moved rows for % out of %', p_name, v_default;
+  END IF;
+  RETURN true;
+EXCEPTION WHEN invalid_object_definition THEN
+  RETURN false; -- range already covered (the converted pre-partitioning table)
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION outbox_create_partitions(p_from DATE, p_days INT) RETURNS INT AS $$
+DECLARE
+  v_day DATE;
+  v_name TEXT;
+  v_created INT := 0;
+BEGIN
+  FOR i IN 0..p_days - 1 LOOP
+    v_day := p_from + i;
+    v_name := 'outbox_event_p' || to_char(v_day, 'YYYYMMDD');
+    CONTINUE WHEN to_regclass(v_name) IS NOT NULL;
+    IF create_range_partition('outbox_event', v_name, v_day::timestamp AT TIME ZONE 'UTC',
+                              (v_day + 1)::timestamp AT TIME ZONE 'UTC') THEN
+      v_created := v_created + 1;
+    END IF;
+  END LOOP;
+  RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detaches (and unless p_archive, drops) every partition lying wholly inside [p_from, p_to) that has no unsent
+-- event left. The unsent check is a probe of the partition's empty partial index, so each partition costs O(1)
+-- whatever its size. A partition whose lock is not granted within lock_timeout is left for the next run.
+CREATE OR REPLACE FUNCTION outbox_retire_partitions(p_from TIMESTAMPTZ, p_to TIMESTAMPTZ, p_archive BOOLEAN)
+RETURNS SETOF TEXT AS $$
+DECLARE
+  r RECORD;
+  v_unsent BOOLEAN;
+BEGIN
+  FOR r IN
+    SELECT c.relname,
+           CASE WHEN m[1] = 'MINVALUE' THEN '-infinity'::timestamptz ELSE btrim(m[1], '''')::timestamptz END AS lo,
+           CASE WHEN m[2] = 'MAXVALUE' THEN 'infinity'::timestamptz ELSE btrim(m[2], '''')::timestamptz END AS hi
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    CROSS JOIN LATERAL regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \((.*)\) TO \((.*)\)') AS m
+    WHERE i.inhparent = 'outbox_event'::regclass AND m IS NOT NULL  -- DEFAULT has no bounds and is never retired
+    ORDER BY 3
+  LOOP
+    CONTINUE WHEN r.lo < p_from OR r.hi > p_to;
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE sent_at IS NULL)', r.relname) INTO v_unsent;
+    CONTINUE WHEN v_unsent;
+    BEGIN
+      EXECUTE format('ALTER TABLE outbox_event DETACH PARTITION %I', r.relname);
+      IF NOT p_archive THEN
+        EXECUTE format('DROP TABLE %I', r.relname);
+      END IF;
+      RETURN NEXT r.relname;
+    EXCEPTION WHEN lock_not_available THEN
+      NULL;
+    END;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT outbox_create_partitions((now() AT TIME ZONE 'UTC')::date, 7);
@@ -0,0 +1,17 @@
+-- Wake outbox relays on commit instead of waiting for their next poll. Statement level, and Postgres folds
+-- identical notifications per transaction, so a batch posting costs one NOTIFY.
+CREATE OR REPLACE FUNCTION notify_outbox_event() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('outbox_event', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_outbox_event ON outbox_event;
+CREATE TRIGGER trg_notify_outbox_event
+AFTER INSERT ON outbox_event
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_outbox_event();
+
+-- Relays claim the oldest unsent events first.
+CREATE INDEX IF NOT EXISTS idx_outbox_unsent_created ON outbox_event(created_at) WHERE sent_at IS NULL;
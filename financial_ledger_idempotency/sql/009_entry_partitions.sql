@@ -0,0 +1,108 @@
+-- ledger_entry is range-partitioned by month (UTC) on created_at, so an account statement walks one partition at a
+-- time along idx_entry_account_created. A pre-partitioning table is converted once, like outbox_event in
+-- sql/007_outbox_partitions.sql: it becomes the partition for everything before next month, without copying rows.
+DO $$
+DECLARE
+  v_bound TIMESTAMPTZ := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC';
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'ledger_entry'::regclass) = 'r' THEN
+    DROP TRIGGER IF EXISTS trg_enforce_txn_balanced ON ledger_entry;
+    DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_ins ON ledger_entry;
+    DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_upd ON ledger_entry;
+    DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_del ON ledger_entry;
+    ALTER TABLE ledger_entry RENAME TO ledger_entry_legacy;
+    ALTER TABLE ledger_entry_legacy DROP CONSTRAINT ledger_entry_pkey;
+    ALTER TABLE ledger_entry_legacy ADD CONSTRAINT ledger_entry_legacy_pkey PRIMARY KEY (entry_id, created_at);
+    ALTER TABLE ledger_entry_legacy RENAME CONSTRAINT ledger_entry_txn_id_fkey TO ledger_entry_legacy_txn_id_fkey;
+    ALTER TABLE ledger_entry_legacy RENAME CONSTRAINT ledger_entry_account_id_fkey TO ledger_entry_legacy_account_id_fkey;
+    ALTER INDEX IF EXISTS idx_entry_txn RENAME TO ledger_entry_legacy_txn_idx;
+    ALTER INDEX IF EXISTS idx_entry_account_created RENAME TO ledger_entry_legacy_account_created_idx;
+
+    CREATE TABLE ledger_entry (
+      entry_id UUID NOT NULL DEFAULT gen_random_uuid(),
+      txn_id UUID NOT NULL REFERENCES ledger_transaction(txn_id) ON DELETE CASCADE,
+      account_id UUID NOT NULL REFERENCES account(account_id),
+      amount_cents BIGINT NOT NULL,
+      created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+      PRIMARY KEY (entry_id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    EXECUTE format('ALTER TABLE ledger_entry ATTACH PARTITION ledger_entry_legacy FOR VALUES FROM (MINVALUE) TO (%L)', v_bound);
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_entry_account_created ON ledger_entry(account_id, created_at, entry_id);
+CREATE INDEX IF NOT EXISTS idx_entry_txn ON ledger_entry(txn_id);
+
+-- Catches rows if maintenance falls behind (entries dated past the last pre-created month).
+CREATE TABLE IF NOT EXISTS ledger_entry_default PARTITION OF ledger_entry DEFAULT;
+
+CREATE OR REPLACE FUNCTION ledger_entry_create_partitions(p_from DATE, p_months INT) RETURNS INT AS $$
+DECLARE
+  v_month DATE;
+  v_name TEXT;
+  v_created INT := 0;
+BEGIN
+  FOR i IN 0..p_months - 1 LOOP
+    v_month := date_trunc('month', p_from) + make_interval(months => i);
+    v_name := 'ledger_entry_p' || to_char(v_month, 'YYYYMM');
+    CONTINUE WHEN to_regclass(v_name) IS NOT NULL;
+    -- create_range_partition (sql/007_outbox_partitions.sql) also moves rows out of ledger_entry_default.
+    IF create_range_partition('ledger_entry', v_name, v_month::timestamp AT TIME ZONE 'UTC',
+                              (v_month + interval '1 month') AT TIME ZONE 'UTC') THEN
+      v_created := v_created + 1;
+    END IF;
+  END LOOP;
+  RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ledger_entry_create_partitions((now() AT TIME ZONE 'UTC')::date, 3);
+
+-- Balance triggers (function in sql/001_init.sql). Statement triggers with transition tables sit on the partitioned
+-- parent and see the rows routed to every partition.
+DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_ins ON ledger_entry;
+CREATE TRIGGER trg_enforce_txn_balanced_ins
+AFTER INSERT ON ledger_entry
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION enforce_txn_balanced();
+
+DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_upd ON ledger_entry;
+CREATE TRIGGER trg_enforce_txn_balanced_upd
+AFTER UPDATE ON ledger_entry
+REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION enforce_txn_balanced();
+
+DROP TRIGGER IF EXISTS trg_enforce_txn_balanced_del ON ledger_entry;
+CREATE TRIGGER trg_enforce_txn_balanced_del
+AFTER DELETE ON ledger_entry
+REFERENCING OLD TABLE AS old_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION enforce_txn_balanced();
+
+-- Entries carry their transaction's start time (created_at defaults to now()), so a transaction still open can
+-- commit entries dated before rows that are already visible. Everything dated before the oldest open transaction's
+-- start is settled: no later commit can add to it. Read this in its own statement, before the one that reads the
+-- entries, so that a transaction which is no longer listed here is already visible to that statement.
+-- Every open transaction counts, readers included, so keep read transactions short. pg_stat_activity hides other
+-- roles' xact_start unless the caller has pg_read_all_stats; rather than silently ignore those sessions (and hand out
+-- a horizon that is not settled), the function refuses.
+CREATE OR REPLACE FUNCTION ledger_settled_horizon() RETURNS TIMESTAMPTZ AS $$
+DECLARE
+  v_now TIMESTAMPTZ := clock_timestamp();
+  v_oldest TIMESTAMPTZ;
+  v_hidden BOOLEAN;
+BEGIN
+  PERFORM pg_stat_clear_snapshot();  -- pg_stat_activity is otherwise frozen for the rest of the transaction
+  SELECT min(xact_start) FILTER (WHERE backend_type = 'client backend'), COALESCE(bool_or(backend_type IS NULL), false)
+  INTO v_oldest, v_hidden
+  FROM pg_stat_activity
+  WHERE datname = current_database() AND pid <> pg_backend_pid();
+  IF v_hidden THEN
+    RAISE EXCEPTION 'ledger_settled_horizon() cannot see other roles'' transactions; GRANT pg_read_all_stats TO %',
+      current_user;
+  END IF;
+  RETURN LEAST(v_now, v_oldest);
+END;
+$$ LANGUAGE plpgsql;
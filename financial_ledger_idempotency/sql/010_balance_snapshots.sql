@@ -0,0 +1,80 @@
+-- Point-in-time balances. Every run of take_balance_snapshot() picks a cutoff and stores, for each account with
+-- entries since the previous run, SUM(amount_cents) over entries created before the cutoff. Balances are rebuilt from
+-- ledger_entry rather than account_balance, so sharded accounts need nothing special and a snapshot is exact for
+-- its cutoff. Accounts without activity keep their older row, which is still their balance.
+CREATE TABLE IF NOT EXISTS balance_snapshot_run (
+  as_of TIMESTAMPTZ PRIMARY KEY,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS account_balance_snapshot (
+  account_id UUID NOT NULL REFERENCES account(account_id) ON DELETE CASCADE,
+  as_of TIMESTAMPTZ NOT NULL,
+  balance_cents BIGINT NOT NULL,
+  PRIMARY KEY (account_id, as_of)
+);
+
+-- Each run reads one interval of entries by created_at. Entries arrive in created_at order, so a BRIN index does
+-- that for a few pages per partition and costs postings next to nothing.
+CREATE INDEX IF NOT EXISTS idx_entry_created_brin ON ledger_entry USING brin (created_at);
+
+-- A run covers at most p_max_span of entries, so it stays well inside statement_timeout; a worker catching up (the
+-- first run on an existing ledger, or after downtime) calls it until it reaches the present. The first run starts
+-- at the oldest account: entries before it would go unsliced into that first run, but cannot exist unless backdated.
+DROP FUNCTION IF EXISTS take_balance_snapshot();
+CREATE OR REPLACE FUNCTION take_balance_snapshot(p_max_span INTERVAL) RETURNS TIMESTAMPTZ AS $$
+DECLARE
+  v_prev TIMESTAMPTZ;
+  v_from TIMESTAMPTZ;
+  v_cutoff TIMESTAMPTZ;
+BEGIN
+  LOCK TABLE balance_snapshot_run IN SHARE ROW EXCLUSIVE MODE;  -- one run at a time
+  SELECT COALESCE(max(as_of), '-infinity') INTO v_prev FROM balance_snapshot_run;
+  v_from := v_prev;
+  IF v_prev = '-infinity' THEN
+    SELECT min(created_at) INTO v_from FROM account;
+  END IF;
+
+  -- Cutting off at the settled horizon (sql/009_entry_partitions.sql) means every entry before the cutoff is
+  -- already committed and visible to the statements below. (A session left idle in transaction holds snapshots back.)
+  v_cutoff := LEAST(ledger_settled_horizon(), v_from + p_max_span);
+  IF v_cutoff <= v_prev THEN
+    RETURN NULL;
+  END IF;
+
+  INSERT INTO account_balance_snapshot(account_id, as_of, balance_cents)
+  SELECT d.account_id, v_cutoff,
+         COALESCE((SELECT s.balance_cents FROM account_balance_snapshot s
+                   WHERE s.account_id = d.account_id ORDER BY s.as_of DESC LIMIT 1), 0) + d.delta
+  FROM (SELECT account_id, SUM(amount_cents) AS delta FROM ledger_entry
+        WHERE created_at >= v_prev AND created_at < v_cutoff
+        GROUP BY account_id) d;
+  INSERT INTO balance_snapshot_run(as_of) VALUES (v_cutoff);
+  RETURN v_cutoff;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Snapshots assume history before the latest cutoff never changes. Postings always date entries after it (see the
+-- cutoff above), so only an explicitly backdated insert trips this.
+CREATE OR REPLACE FUNCTION guard_snapshotted_entries() RETURNS trigger AS $$
+DECLARE
+  v_last TIMESTAMPTZ;
+  v_min TIMESTAMPTZ;
+BEGIN
+  SELECT max(as_of) INTO v_last FROM balance_snapshot_run;
+  IF v_last IS NOT NULL THEN
+    SELECT min(created_at) INTO v_min FROM new_entries;
+    IF v_min < v_last THEN
+      RAISE EXCEPTION 'Entry dated % precedes the balance snapshot at %', v_min, v_last;
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_guard_snapshotted_entries ON ledger_entry;
+CREATE TRIGGER trg_guard_snapshotted_entries
+AFTER INSERT ON ledger_entry
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT
+EXECUTE FUNCTION guard_snapshotted_entries();
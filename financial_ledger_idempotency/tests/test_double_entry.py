@@ -1,7 +1,7 @@
 import os, uuid
 import pytest
 from ledger.db import get_conn, migrate
-from ledger.ledger_core import create_account, transfer
+from ledger.ledger_core import create_account, get_balance, transfer
 
 @pytest.fixture(scope="module")
 def conn():
@@ -24,3 +24,24 @@ def test_transfer_balances_to_zero(conn):
         cur.execute("SELECT COALESCE(SUM(amount_cents),0) FROM ledger_entry WHERE txn_id=%s", (resp["txn_id"],))
         s = cur.fetchone()[0]
     assert int(s) == 0
+
+def test_transfer_rejections_match_multi_statement_path(conn):
+    a1 = create_account(conn, "A1", "ASSET", "USD")
+    e1 = create_account(conn, "E1", "ASSET", "EUR")
+    conn.commit()
+
+    with pytest.raises(KeyError):
+        transfer(conn, idempotency_key=str(uuid.uuid4()), from_account_id=a1["account_id"], to_account_id=str(uuid.uuid4()),
+                 amount_cents=1, currency="USD", external_ref=None)
+    conn.rollback()
+    with pytest.raises(ValueError):
+        transfer(conn, idempotency_key=str(uuid.uuid4()), from_account_id=a1["account_id"], to_account_id=e1["account_id"],
+                 amount_cents=1, currency="USD", external_ref=None)
+    conn.rollback()
+
+    # Self transfer nets to zero on one balance row.
+    resp = transfer(conn, idempotency_key=str(uuid.uuid4()), from_account_id=a1["account_id"], to_account_id=a1["account_id"],
+                    amount_cents=5, currency="USD", external_ref=None)
+    conn.commit()
+    assert [e["amount_cents"] for e in resp["entries"]] == [-5, 5]
+    assert get_balance(conn, a1["account_id"])["balance_cents"] == 0
@@ -1,6 +1,7 @@
 import os, uuid
 import pytest
 from ledger.db import get_conn, migrate
+from ledger.idempotency import begin_idempotent, expire_keys
 from ledger.ledger_core import create_account, transfer
 
 @pytest.fixture(scope="module")
@@ -41,3 +42,25 @@ def test_idempotency_key_conflict(conn):
     with pytest.raises(ValueError):
         transfer(conn, idempotency_key=idem, from_account_id=a1["account_id"], to_account_id=a2["account_id"],
                  amount_cents=999, currency="USD", external_ref="x")
+
+def test_begin_idempotent_keeps_transaction_and_keys_expire(conn):
+    acct = create_account(conn, "Kept", "ASSET", "USD")
+    key = str(uuid.uuid4())
+    assert begin_idempotent(conn, key, "h1") == ("NEW", None)
+    # A taken key no longer raises and rolls back: the account created above survives.
+    assert begin_idempotent(conn, key, "h1") == ("IN_PROGRESS", None)
+    with pytest.raises(ValueError, match="IDEMPOTENCY_KEY_CONFLICT"):
+        begin_idempotent(conn, key, "h2")
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM account WHERE account_id=%s", (acct["account_id"],))
+        assert cur.fetchone()[0] == 1
+        cur.execute("UPDATE idempotency_key SET created_at = now() - interval '2 hours' WHERE idempotency_key=%s", (key,))
+    conn.commit()
+
+    while expire_keys(conn, 3600, batch=500) == 500:
+        pass
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM idempotency_key WHERE idempotency_key=%s", (key,))
+        assert cur.fetchone()[0] == 0
@@ -2,7 +2,7 @@ import os, uuid
 import pytest
 from ledger.db import get_conn, migrate
 from ledger.ledger_core import create_account, transfer
-from ledger.outbox import poll_unsent, mark_sent
+from ledger.outbox import maintain_partitions, mark_sent, mark_sent_many, poll_unsent
 
 @pytest.fixture(scope="module")
 def conn():
@@ -29,3 +29,46 @@ def test_outbox_event_created_and_marked_sent(conn):
 
     events2 = poll_unsent(conn, limit=10)
     assert all(str(e["event_id"]) != eid for e in events2)
+
+def test_outbox_partitions_created_and_retired(conn):
+    assert maintain_partitions(conn, days_ahead=3)["created"] >= 0
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SELECT outbox_create_partitions('2100-01-01', 3)")
+        assert cur.fetchone()[0] == 3
+        cur.execute("""INSERT INTO outbox_event(event_type, payload, created_at, sent_at) VALUES
+                       ('T', '{}', '2100-01-01 12:00+00', now()), ('T', '{}', '2100-01-02 12:00+00', NULL)""")
+        conn.commit()
+
+        # The unsent event keeps its partition; the empty and the fully-sent ones go.
+        cur.execute("SELECT outbox_retire_partitions('2100-01-01', '2100-01-04', true)")
+        assert sorted(r[0] for r in cur.fetchall()) == ["outbox_event_p21000101", "outbox_event_p21000103"]
+        cur.execute("SELECT count(*) FROM outbox_event_p21000101")
+        assert cur.fetchone()[0] == 1  # archived: detached, not dropped
+
+        cur.execute("SELECT event_id, created_at FROM outbox_event WHERE created_at >= '2100-01-01'")
+        (eid, created), = cur.fetchall()
+        assert mark_sent_many(conn, [str(eid)], [created]) == 1
+        cur.execute("SELECT outbox_retire_partitions('2100-01-01', '2100-01-04', false)")
+        assert [r[0] for r in cur.fetchall()] == ["outbox_event_p21000102"]
+        cur.execute("SELECT to_regclass('outbox_event_p21000102')")
+        assert cur.fetchone()[0] is None
+        cur.execute("DROP TABLE outbox_event_p21000101, outbox_event_p21000103")
+    conn.commit()
+
+def test_partition_created_over_rows_in_default_partition(conn):
+    with conn.cursor() as cur:
+        # No partition covers 2101 yet, so these land in outbox_event_default.
+        cur.execute("""INSERT INTO outbox_event(event_type, payload, created_at) VALUES
+                       ('T', '{}', '2101-01-01 10:00+00'), ('T', '{}', '2101-01-02 10:00+00')""")
+        conn.commit()
+        cur.execute("SELECT outbox_create_partitions('2101-01-01', 1)")
+        assert cur.fetchone()[0] == 1
+        assert maintain_partitions(conn, days_ahead=1)["created"] >= 0
+        cur.execute("SELECT count(*) FROM outbox_event_p21010101")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT count(*) FROM outbox_event_default WHERE created_at >= '2101-01-01'")
+        assert cur.fetchone()[0] == 1
+        cur.execute("DELETE FROM outbox_event WHERE created_at >= '2101-01-01'")
+        cur.execute("DROP TABLE outbox_event_p21010101")
+    conn.commit()
@@ -0,0 +1,57 @@
+import uuid
+import pytest
+import redis
+from ledger.response_cache import ResponseCache
+
+@pytest.mark.asyncio
+async def test_lru_evicts_and_expires(monkeypatch):
+    cache = ResponseCache(max_size=2, ttl_s=10)
+    for k in ("a", "b", "c"):
+        await cache.put(k, "h", {"k": k})
+    assert await cache.get("a") is None
+    assert await cache.get("c") == ("h", {"k": "c"})
+
+    import ledger.response_cache as rc
+    now = rc.monotonic()
+    monkeypatch.setattr(rc, "monotonic", lambda: now + 11)
+    assert await cache.get("c") is None
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_between_processes():
+    url = "redis://localhost:6379/0"
+    try:
+        redis.Redis.from_url(url).ping()
+    except redis.exceptions.RedisError:
+        pytest.skip("redis not available")
+    prefix = f"t:{uuid.uuid4()}:"
+    writer, reader = ResponseCache(redis_url=url, prefix=prefix), ResponseCache(redis_url=url, prefix=prefix)
+    await writer.put("k", "h", {"txn_id": "1"})
+    assert await reader.get("k") == ("h", {"txn_id": "1"})
+    await writer.close()
+    await reader.close()
+
+@pytest.mark.asyncio
+async def test_api_replay_is_served_from_cache(monkeypatch):
+    import httpx
+    from ledger import api
+
+    await api._startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://t") as c:
+            src = (await c.post("/v1/accounts", json={"name": "S", "type": "ASSET", "currency": "USD"})).json()
+            dst = (await c.post("/v1/accounts", json={"name": "D", "type": "ASSET", "currency": "USD"})).json()
+            body = {"from_account_id": src["account_id"], "to_account_id": dst["account_id"], "amount_cents": 10, "currency": "USD"}
+            headers = {"Idempotency-Key": str(uuid.uuid4())}
+            first = await c.post("/v1/transactions/transfer", json=body, headers=headers)
+            assert first.status_code == 200
+
+            def no_db():
+                raise AssertionError("replay reached the database")
+            monkeypatch.setattr(api, "get_async_pool", no_db)
+            replay = await c.post("/v1/transactions/transfer", json=body, headers=headers)
+            assert replay.status_code == 200 and replay.json() == first.json()
+            conflict = await c.post("/v1/transactions/transfer", json={**body, "amount_cents": 11}, headers=headers)
+            assert conflict.status_code == 409
+    finally:
+        monkeypatch.undo()
+        await api._shutdown()